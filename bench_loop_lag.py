@@ -0,0 +1,114 @@
+"""Event-loop lag while serving concurrent /feed requests, per RANKING_EXECUTOR mode.
+
+Seeds a synthetic catalog into the configured Redis (flushing it first), then
+for each mode fires concurrent /feed requests through the ASGI app while a
+probe task measures how late the event loop wakes it up.
+
+    python bench_loop_lag.py --flush --images 20000 --requests 200
+"""
+from services import executor, ranking
+from services.feed import store_image, add_images_tags, update_engagement
+from services.session import create_session
+from services.redis import get_redis
+from main import app
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+import httpx
+
+TAGS = ["nature", "city", "food", "travel", "art", "sports", "music", "tech", "animals", "ocean"]
+PROBE_INTERVAL = 0.005
+
+
+def seed(count: int):
+    redis = get_redis()
+    redis.flushdb()
+    rng = random.Random(42)
+    for i in range(count):
+        tags = rng.sample(TAGS, rng.randint(1, 3))
+        store_image(f"bench_img{i}", f"https://example.com/bench_img{i}.jpg", tags)
+        add_images_tags(f"bench_img{i}", tags)
+        redis.hset(f"image:bench_img{i}", mapping={"likes": rng.randint(0, 500), "dislikes": rng.randint(0, 50)})
+        update_engagement(f"bench_img{i}")
+
+
+async def probe(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def run_mode(mode: str, sessions: list, concurrency: int):
+    executor.RANKING_EXECUTOR = mode
+    if mode == "process":
+        executor.publish_catalog(ranking.get_snapshot())
+
+    lags = []
+    latencies = []
+    stop = asyncio.Event()
+    limit = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(session_id):
+            async with limit:
+                start = time.perf_counter()
+                response = await client.get(f"/feed?session_id={session_id}")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        prober = asyncio.create_task(probe(lags, stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(one(session_id) for session_id in sessions))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await prober
+
+    executor.shutdown()
+    lags.sort()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "rps": len(sessions) / elapsed,
+        "lag_p50_ms": statistics.median(lags) * 1000,
+        "lag_p99_ms": lags[int(len(lags) * 0.99)] * 1000,
+        "lag_max_ms": lags[-1] * 1000,
+        "latency_p50_ms": statistics.median(latencies) * 1000,
+        "latency_p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flush", action="store_true", help="required: the benchmark flushes the configured Redis DB")
+    parser.add_argument("--images", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--modes", default="inline,thread,process")
+    args = parser.parse_args()
+
+    if not args.flush:
+        sys.exit("Refusing to run without --flush: the benchmark wipes the configured Redis DB.")
+
+    print(f"Seeding {args.images} images...")
+    seed(args.images)
+    ranking.set_snapshot(ranking.refresh_snapshot())
+    # Measure the pool on every request, not only the largest candidate sets.
+    executor.PROCESS_MIN_CANDIDATES = 0
+
+    print(f"{'mode':<8} {'req/s':>8} {'lag p50':>9} {'lag p99':>9} {'lag max':>9} {'lat p50':>9} {'lat p99':>9}")
+    for mode in args.modes.split(","):
+        sessions = [create_session(random.sample(TAGS, 2)) for _ in range(args.requests)]
+        result = asyncio.run(run_mode(mode, sessions, args.concurrency))
+        print(
+            f"{result['mode']:<8} {result['rps']:>8.1f} {result['lag_p50_ms']:>7.1f}ms {result['lag_p99_ms']:>7.1f}ms "
+            f"{result['lag_max_ms']:>7.1f}ms {result['latency_p50_ms']:>7.1f}ms {result['latency_p99_ms']:>7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
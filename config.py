@@ -6,4 +6,88 @@ load_dotenv()
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.getenv('REDIS_PORT', '6379'))
 REDIS_DB = int(os.getenv('REDIS_DB', '0'))
-REDIS_PASSWORD = os.getenv('REDIS_PASSWORD')
\ No newline at end of file
+REDIS_PASSWORD = os.getenv('REDIS_PASSWORD')
+REDIS_CLUSTER = os.getenv('REDIS_CLUSTER', '0').lower() in ('1', 'true', 'yes')
+REDIS_BACKEND = os.getenv('REDIS_BACKEND', 'redis')
+
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+TRAFFIC_CAPTURE_FILE = os.getenv('TRAFFIC_CAPTURE_FILE', '')
+
+RANKING_TOP_N = int(os.getenv('RANKING_TOP_N', '1000'))
+RANKING_TAG_TOP_N = int(os.getenv('RANKING_TAG_TOP_N', '200'))
+RANKING_REFRESH_SECONDS = float(os.getenv('RANKING_REFRESH_SECONDS', '5'))
+
+RANKING_MODE = os.getenv('RANKING_MODE', 'alltime')
+TRENDING_HALF_LIFE_SECONDS = float(os.getenv('TRENDING_HALF_LIFE_SECONDS', '21600'))
+TRENDING_RENORMALIZE_SECONDS = float(os.getenv('TRENDING_RENORMALIZE_SECONDS', '3600'))
+
+SESSION_STORE = os.getenv('SESSION_STORE', 'keys')
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', '3600'))
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', '10000'))
+SEEN_TRACKER = os.getenv('SEEN_TRACKER', 'set')
+SEEN_FILTER_THRESHOLD = int(os.getenv('SEEN_FILTER_THRESHOLD', '200'))
+SEEN_FILTER_CAPACITY = int(os.getenv('SEEN_FILTER_CAPACITY', '10000'))
+SEEN_FILTER_FP_RATE = float(os.getenv('SEEN_FILTER_FP_RATE', '0.01'))
+
+FEED_COALESCE = os.getenv('FEED_COALESCE', 'share')
+FEED_COMPRESSION = os.getenv('FEED_COMPRESSION', 'off')
+FEED_COMPRESSION_MIN_BYTES = int(os.getenv('FEED_COMPRESSION_MIN_BYTES', '500'))
+COMPACT_URL_PREFIXES = os.getenv('COMPACT_URL_PREFIXES', 'https://images.unsplash.com/photo-')
+
+TASK_QUEUE_SIZE = int(os.getenv('TASK_QUEUE_SIZE', '1000'))
+TASK_CONCURRENCY = int(os.getenv('TASK_CONCURRENCY', '8'))
+TASK_DRAIN_SECONDS = float(os.getenv('TASK_DRAIN_SECONDS', '10'))
+
+RANKING_EXECUTOR = os.getenv('RANKING_EXECUTOR', 'thread')
+RANKING_THREADS = int(os.getenv('RANKING_THREADS', '16'))
+RANKING_PROCESSES = int(os.getenv('RANKING_PROCESSES', '2'))
+
+FEED_PAGE_SIZE = int(os.getenv('FEED_PAGE_SIZE', '10'))
+FEED_PREFETCH_SIZE = int(os.getenv('FEED_PREFETCH_SIZE', '10'))
+FEED_MAX_SEEN = int(os.getenv('FEED_MAX_SEEN', '50'))
+FEED_CURSOR_TTL_SECONDS = int(os.getenv('FEED_CURSOR_TTL_SECONDS', '300'))
+FEED_CURSOR_RESCORE_THRESHOLD = float(os.getenv('FEED_CURSOR_RESCORE_THRESHOLD', '0.25'))
+
+COLD_START_CACHE_SIZE = int(os.getenv('COLD_START_CACHE_SIZE', '1000'))
+COLD_START_TTL_SECONDS = int(os.getenv('COLD_START_TTL_SECONDS', '600'))
+COLD_START_WARM_KEYS = int(os.getenv('COLD_START_WARM_KEYS', '100'))
+
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', '1.0'))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', '0.5'))
+REDIS_RETRIES = int(os.getenv('REDIS_RETRIES', '1'))
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', '256'))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', '5'))
+FALLBACK_FEED_SIZE = int(os.getenv('FALLBACK_FEED_SIZE', '200'))
+FALLBACK_SESSION_CACHE_SIZE = int(os.getenv('FALLBACK_SESSION_CACHE_SIZE', '10000'))
+INTERACTION_BUFFER_SIZE = int(os.getenv('INTERACTION_BUFFER_SIZE', '10000'))
+INTERACTION_REPLAY_SECONDS = float(os.getenv('INTERACTION_REPLAY_SECONDS', '1'))
+
+HOT_KEY_SHARDING = os.getenv('HOT_KEY_SHARDING', '0').lower() in ('1', 'true', 'yes')
+HOT_KEY_SHARDS = int(os.getenv('HOT_KEY_SHARDS', '8'))
+HOT_KEY_RATE = float(os.getenv('HOT_KEY_RATE', '50'))
+HOT_KEY_HOLD_SECONDS = float(os.getenv('HOT_KEY_HOLD_SECONDS', '30'))
+HOT_KEY_ROLLUP_SECONDS = float(os.getenv('HOT_KEY_ROLLUP_SECONDS', '1'))
+
+EMBEDDING_NEIGHBORS = int(os.getenv('EMBEDDING_NEIGHBORS', '200'))
+EMBEDDING_LISTS = int(os.getenv('EMBEDDING_LISTS', '0'))
+EMBEDDING_PROBES = int(os.getenv('EMBEDDING_PROBES', '8'))
+EMBEDDING_TASTE_DECAY = float(os.getenv('EMBEDDING_TASTE_DECAY', '0.9'))
+
+CATALOG_FILE_DIR = os.getenv('CATALOG_FILE_DIR', '')
+CATALOG_FILE_REBUILD_SECONDS = float(os.getenv('CATALOG_FILE_REBUILD_SECONDS', '300'))
+CATALOG_FILE_KEEP = int(os.getenv('CATALOG_FILE_KEEP', '2'))
+
+REDIS_REPLICAS = os.getenv('REDIS_REPLICAS', '')
+REDIS_REPLICA_MAX_LAG_SECONDS = float(os.getenv('REDIS_REPLICA_MAX_LAG_SECONDS', '15'))
+REDIS_REPLICA_CHECK_SECONDS = float(os.getenv('REDIS_REPLICA_CHECK_SECONDS', '5'))
+
+SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.getenv('SERVER_PORT', '8000'))
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', str(os.cpu_count() or 1)))
+WARMUP_CONNECTIONS = int(os.getenv('WARMUP_CONNECTIONS', '16'))
+WARMUP_TIMEOUT_SECONDS = float(os.getenv('WARMUP_TIMEOUT_SECONDS', '30'))
+WARMUP_RETRY_SECONDS = float(os.getenv('WARMUP_RETRY_SECONDS', '1'))
@@ -1,9 +1,55 @@
-from fastapi import FastAPI , HTTPException 
+from fastapi import FastAPI , HTTPException , Request
 from fastapi.middleware.cors import CORSMiddleware
-from services.redis import get_redis
+from fastapi.responses import PlainTextResponse, JSONResponse, Response
+from services.redis import get_redis, run_replica_monitor, UNAVAILABLE_ERRORS
+from services import metrics, traffic
+from services.profiler import PROFILE_HEADER, ADMIN_TOKEN_HEADER, profile_requested, admin_authorized
+from services.ranking import run_materializer
+from services.tasks import runner as task_runner
+from services import executor
+from services.fallback import run_replayer
+from services.feed_generator import apply_interaction
+from services.feed import rollup_engagement_shards
+from services.hot_keys import run_rollup
+from services.warmup import run_warmup, is_ready
+from config import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, WARMUP_TIMEOUT_SECONDS
+from contextlib import asynccontextmanager
+import argparse
+import asyncio
+import time
 from routes.feed import router as feed_router
 from routes.session import router as session_router
-app = FastAPI()
+from routes.admin import router as admin_router
+from routes.images import router as images_router
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await task_runner.start()
+    # Hold startup until the worker is warm, but not forever: if Redis is
+    # down, keep retrying in the background and report not-ready meanwhile.
+    warmup = asyncio.create_task(run_warmup())
+    await asyncio.wait({warmup}, timeout=WARMUP_TIMEOUT_SECONDS)
+    materializer = asyncio.create_task(run_materializer())
+    replayer = asyncio.create_task(run_replayer(apply_interaction))
+    rollup = asyncio.create_task(run_rollup(rollup_engagement_shards))
+    replica_monitor = asyncio.create_task(run_replica_monitor())
+    try:
+        yield
+    finally:
+        for task in (warmup, materializer, replayer, rollup, replica_monitor):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await task_runner.drain()
+        try:
+            await asyncio.to_thread(rollup_engagement_shards)
+        except Exception as e:
+            print(f"Error rolling up sharded engagement counters: {e}")
+        await asyncio.to_thread(executor.shutdown)
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,9 +61,63 @@ app.add_middleware(
 
 app.include_router(feed_router)
 app.include_router(session_router)
+app.include_router(admin_router)
+app.include_router(images_router)
+
+async def redis_unavailable(request: Request, exc: Exception):
+    return JSONResponse(status_code=503, content={"detail": "Redis connection failed"})
+
+for error in UNAVAILABLE_ERRORS:
+    app.add_exception_handler(error, redis_unavailable)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    if request.headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes") and admin_authorized(request.headers.get(ADMIN_TOKEN_HEADER)):
+        profile_requested.set(True)
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.request_latency.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        route=route.path if route is not None else "unmatched",
+        status=response.status_code,
+    )
+    return response
+
+@app.middleware("http")
+async def capture_traffic(request: Request, call_next):
+    op = traffic.capture_op(request.method, request.url.path)
+    if op is None:
+        return await call_next(request)
+    started_at = time.time()
+    start = time.perf_counter()
+    body = await request.body() if op == "session" else b""
+    response = await call_next(request)
+    content = b"".join([chunk async for chunk in response.body_iterator])
+    traffic.record_request(
+        op, started_at, time.perf_counter() - start, response.status_code,
+        dict(request.query_params), body, content, response.headers.get("content-encoding"),
+    )
+    return Response(content, status_code=response.status_code, headers=response.headers)
 
 def main():
-    app.run(host="0.0.0.0", port=8000)
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the feed API")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    args = parser.parse_args()
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="uvloop",
+        http="httptools",
+        lifespan="on",
+    )
 
 @app.get("/")
 async def root():
@@ -34,8 +134,25 @@ async def health_redis():
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
+    try:
+        redis.ping()
+    except Exception:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
     return {"message": "Redis connection successful"}
 
+@app.get("/health/ready")
+async def health_ready():
+    if not is_ready():
+        raise HTTPException(status_code=503, detail="Warming up")
+    return {"message": "Ready"}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(
+        metrics.render_metrics(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,41 @@
+import argparse
+from redis import Redis
+from services.feed import migrate_engagement_keys, migrate_image_tags
+from services.keys import copy_to_cluster_layout
+from services.redis import get_redis
+from config import REDIS_CLUSTER
+
+def migrate_engagement():
+    print("Folding image:{id}:likes / image:{id}:dislikes into image hashes...")
+    migrated = migrate_engagement_keys()
+    print(f" Migrated {migrated} engagement keys")
+
+def migrate_tags():
+    print("Replacing JSON image_tags with tag dictionary bitmasks...")
+    migrated = migrate_image_tags()
+    print(f" Migrated {migrated} images")
+
+def migrate_cluster(source_url: str):
+    if not REDIS_CLUSTER:
+        raise SystemExit("Set REDIS_CLUSTER=1 and point REDIS_HOST/REDIS_PORT at the target cluster")
+    if not source_url:
+        raise SystemExit("--source redis://host:port/db is required for the cluster migration")
+    print(f"Copying keys from {source_url} into the cluster with hash-tagged names...")
+    copied = copy_to_cluster_layout(Redis.from_url(source_url), get_redis(decode_responses=False))
+    print(f" Copied {copied} keys")
+
+MIGRATIONS = {
+    "engagement": migrate_engagement,
+    "tags": migrate_tags,
+    "cluster": migrate_cluster,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="One-time Redis data migrations")
+    parser.add_argument("migration", choices=sorted(MIGRATIONS))
+    parser.add_argument("--source", help="standalone Redis URL to copy from (cluster migration)")
+    args = parser.parse_args()
+    if args.migration == "cluster":
+        migrate_cluster(args.source)
+    else:
+        MIGRATIONS[args.migration]()
@@ -0,0 +1,219 @@
+"""Replay captured traffic (TRAFFIC_CAPTURE_FILE) against the ASGI app in-process.
+
+Requests are re-issued on the captured schedule, sped up by --speed (0 sends
+them back to back), through httpx's ASGI transport with the app's lifespan
+running. Captured session ids and cursors are mapped to the ones the replay
+gets back, and each session's requests run in their captured order. Reports
+latency percentiles per operation and how the replayed feed pages differ
+from the captured ones.
+
+    REDIS_BACKEND=memory python replay.py traffic.jsonl --seed --speed 10
+"""
+from seed_data import SEED_IMAGES
+from services.feed import store_image, add_images_tags, update_engagement
+from services.redis import get_redis
+from services.traffic import read_records, feed_image_ids, set_capture_file
+from main import app, lifespan
+from config import REDIS_BACKEND
+import argparse
+import asyncio
+import json
+import sys
+import time
+import httpx
+
+OPS = ("session", "feed", "like", "dislike")
+
+
+def seed():
+    for image in SEED_IMAGES:
+        store_image(image["image_id"], image["url"], image["tags"])
+        add_images_tags(image["image_id"], image["tags"])
+        update_engagement(image["image_id"])
+
+
+def percentile(values: list, q: float):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+async def send(client: httpx.AsyncClient, record: dict, sessions: dict, cursors: dict):
+    """Issue one captured request. Returns (status, elapsed seconds, body)."""
+    op = record["op"]
+    session_id = sessions.get(record.get("session_id"), record.get("session_id"))
+    start = time.perf_counter()
+    if op == "session":
+        response = await client.post("/sessions/create", json={"preferred_tags": record.get("preferred_tags") or []})
+    elif op == "feed":
+        params = {"session_id": session_id}
+        if record.get("cursor"):
+            params["cursor"] = cursors.get(record["cursor"], record["cursor"])
+        for name in ("tags", "mode", "format", "known_tags"):
+            if name in record:
+                params[name] = record[name]
+        response = await client.get("/feed", params=params)
+    else:
+        response = await client.post(f"/{op}", params={"session_id": session_id, "image_id": record.get("image_id")})
+    elapsed = time.perf_counter() - start
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    return response.status_code, elapsed, body if isinstance(body, dict) else {}
+
+
+async def replay_one(client, record: dict, previous, sessions: dict, cursors: dict, results: list):
+    if previous is not None:
+        await previous
+    sent_at = time.time()
+    try:
+        status, elapsed, body = await send(client, record, sessions, cursors)
+    except Exception as e:
+        print(f"Error replaying {record['op']}: {e}")
+        status, elapsed, body = None, 0.0, {}
+
+    result = {"t": round(sent_at, 6), "op": record["op"], "ms": round(elapsed * 1000, 3), "status": status}
+    if record["op"] == "session":
+        if body.get("session_id"):
+            sessions[record.get("session_id")] = body["session_id"]
+        result["session_id"] = body.get("session_id")
+        result["preferred_tags"] = record.get("preferred_tags")
+    else:
+        result["session_id"] = sessions.get(record.get("session_id"), record.get("session_id"))
+    if record["op"] == "feed":
+        for name in ("tags", "mode", "format", "known_tags"):
+            if name in record:
+                result[name] = record[name]
+        if "message" in body:
+            result["message"] = body["message"]
+        elif status == 200:
+            result["images"] = feed_image_ids(body)
+            result["next_cursor"] = body.get("cursor")
+            if record.get("next_cursor") and body.get("cursor"):
+                cursors[record["next_cursor"]] = body["cursor"]
+    elif record["op"] in ("like", "dislike"):
+        result["image_id"] = record.get("image_id")
+    results.append((record, result))
+
+
+async def replay(records: list, client: httpx.AsyncClient, speed: float = 1.0):
+    """Replay records in order. Returns (captured, replayed) record pairs."""
+    sessions, cursors, chains, results, pending = {}, {}, {}, [], []
+    if not records:
+        return results
+    first = records[0]["t"]
+    start = time.perf_counter()
+    for record in records:
+        if record.get("op") not in OPS:
+            continue
+        if speed > 0:
+            delay = (record["t"] - first) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        key = record.get("session_id")
+        task = asyncio.create_task(replay_one(client, record, chains.get(key), sessions, cursors, results))
+        chains[key] = task
+        pending.append(task)
+    await asyncio.gather(*pending)
+    return results
+
+
+def summarize(results: list):
+    """Latency percentiles per operation and feed ranking differences."""
+    summary = {"ops": {}, "status_mismatches": 0, "feeds": {"compared": 0, "same_order": 0, "same_set": 0, "overlap": 0.0}}
+    for op in OPS:
+        pairs = [(captured, replayed) for captured, replayed in results if captured["op"] == op]
+        if not pairs:
+            continue
+        replayed_ms = [replayed["ms"] for _, replayed in pairs]
+        captured_ms = [captured["ms"] for captured, _ in pairs if "ms" in captured]
+        summary["ops"][op] = {
+            "count": len(pairs),
+            "p50_ms": percentile(replayed_ms, 0.5),
+            "p90_ms": percentile(replayed_ms, 0.9),
+            "p99_ms": percentile(replayed_ms, 0.99),
+            "max_ms": max(replayed_ms),
+            "captured_p50_ms": percentile(captured_ms, 0.5),
+            "captured_p99_ms": percentile(captured_ms, 0.99),
+        }
+
+    feeds = summary["feeds"]
+    overlap = 0.0
+    for captured, replayed in results:
+        if captured.get("status") != replayed["status"]:
+            summary["status_mismatches"] += 1
+        if captured["op"] != "feed" or "images" not in captured or "images" not in replayed:
+            continue
+        expected, actual = captured["images"], replayed["images"]
+        feeds["compared"] += 1
+        feeds["same_order"] += expected == actual
+        feeds["same_set"] += set(expected) == set(actual)
+        overlap += len(set(expected) & set(actual)) / max(len(expected), len(actual), 1)
+    if feeds["compared"]:
+        feeds["overlap"] = overlap / feeds["compared"]
+    return summary
+
+
+def print_summary(summary: dict):
+    print(f"{'op':<8} {'count':>6} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9} {'was p50':>9} {'was p99':>9}")
+    for op, stats in summary["ops"].items():
+        print(
+            f"{op:<8} {stats['count']:>6} {stats['p50_ms']:>7.1f}ms {stats['p90_ms']:>7.1f}ms "
+            f"{stats['p99_ms']:>7.1f}ms {stats['max_ms']:>7.1f}ms {stats['captured_p50_ms']:>7.1f}ms "
+            f"{stats['captured_p99_ms']:>7.1f}ms"
+        )
+    feeds = summary["feeds"]
+    print(f"\nStatus mismatches: {summary['status_mismatches']}")
+    if feeds["compared"]:
+        print(
+            f"Feed pages compared: {feeds['compared']}, same order: {feeds['same_order']}, "
+            f"same images: {feeds['same_set']}, mean overlap: {feeds['overlap']:.1%}"
+        )
+
+
+async def run(records: list, speed: float):
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+            return await replay(records, client, speed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", help="file written with TRAFFIC_CAPTURE_FILE")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression, e.g. 10 for 10x; 0 for no delays")
+    parser.add_argument("--seed", action="store_true", help="seed the bundled catalog before replaying")
+    parser.add_argument("--flush", action="store_true", help="flush the configured Redis DB before replaying")
+    parser.add_argument("--save", help="write the replayed requests in capture format, to replay and diff later")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    if REDIS_BACKEND != "memory" and args.seed and not args.flush:
+        sys.exit("Refusing to seed a real Redis without --flush; or set REDIS_BACKEND=memory.")
+
+    # Don't capture the replay itself.
+    set_capture_file("")
+    if args.flush:
+        get_redis().flushdb()
+    if args.seed:
+        seed()
+
+    records = read_records(args.capture)
+    pace = f"{args.speed:g}x" if args.speed > 0 else "full speed"
+    print(f"Replaying {len(records)} requests at {pace} against {REDIS_BACKEND}...", file=sys.stderr)
+    results = asyncio.run(run(records, args.speed))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            for _, replayed in sorted(results, key=lambda pair: pair[1]["t"]):
+                f.write(json.dumps(replayed, separators=(",", ":")) + "\n")
+
+    summary = summarize(results)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse
+from services.profiler import list_profiles, get_profile_path, admin_enabled, admin_authorized, ADMIN_TOKEN_HEADER
+
+def require_admin(request: Request):
+    if not admin_enabled():
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not admin_authorized(request.headers.get(ADMIN_TOKEN_HEADER)):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+@router.get("/profiles")
+async def list_profiles_route():
+    return {"profiles": list_profiles()}
+
+@router.get("/profiles/{name}")
+async def get_profile_route(name: str):
+    path = get_profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
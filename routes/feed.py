@@ -1,31 +1,61 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
-from services.feed_generator import generate_feed, like_handler, dislike_handler
+from services.feed_generator import serve_feed, like_handler, dislike_handler
 from services.sse_manager import register_connection, unregister_connection
+from services.singleflight import AsyncSingleFlight, KeyedLock
+from services.executor import offload
+from services.tag_index import MODES
+from services.compact import FORMATS, compact_page, json_response, choose_encoding, StreamEncoder
+from config import FEED_COALESCE
 import asyncio
-import json
 
 router = APIRouter()
 
+feed_flight = AsyncSingleFlight("feed")
+feed_locks = KeyedLock()
+
 @router.get("/feed")
-async def get_feed(session_id: str):
-    return generate_feed(session_id)
+async def get_feed(
+    request: Request, session_id: str, cursor: str = None, tags: str = None, mode: str = "any",
+    response_format: str = Query("json", alias="format"), known_tags: int = None,
+):
+    if mode not in MODES:
+        raise HTTPException(status_code=400, detail="mode must be 'any' or 'all'")
+    if response_format not in FORMATS:
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'compact'")
+    tag_list = [tag for tag in dict.fromkeys((tags or "").split(",")) if tag] or None
+    # Retries and double-fired requests for one session must not race each
+    # other for the same unseen images: either share the in-flight page or
+    # wait for it and take the next one.
+    if FEED_COALESCE == "serialize":
+        async with feed_locks.hold(session_id):
+            page = await offload(serve_feed, session_id, cursor, tag_list, mode)
+    else:
+        key = (session_id, cursor, tuple(tag_list or ()), mode)
+        page = await feed_flight.do(key, lambda: offload(serve_feed, session_id, cursor, tag_list, mode))
+    if response_format == "compact":
+        # The prefix table goes out once, with the response that has no known_tags.
+        page, _ = compact_page(page, known_tags or 0, prefixes=known_tags is None)
+    return json_response(page, request.headers.get("accept-encoding"))
 
 @router.get("/feed/stream")
-async def stream_feed_updates(session_id: str):
+async def stream_feed_updates(request: Request, session_id: str, response_format: str = Query("json", alias="format")):
+    if response_format not in FORMATS:
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'compact'")
+    encoder = StreamEncoder(response_format, choose_encoding(request.headers.get("accept-encoding")))
     queue = asyncio.Queue(maxsize=10)
     register_connection(session_id, queue)
     
     async def event_generator():
         try:
-            yield f"data: {json.dumps({'type': 'connected', 'session_id': session_id})}\n\n"
+            yield encoder.event({"type": "connected", "session_id": session_id})
             
             while True:
                 try:
                     message = await asyncio.wait_for(queue.get(), timeout=30.0)
-                    yield message
+                    yield encoder.event(message)
                 except asyncio.TimeoutError:
-                    yield "data: {\"type\": \"ping\"}\n\n"
+                    yield encoder.event({"type": "ping"})
                     continue
         except GeneratorExit:
             pass
@@ -40,7 +70,8 @@ async def stream_feed_updates(session_id: str):
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
+            "X-Accel-Buffering": "no",
+            **encoder.headers(),
         }
     )
 
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, HTTPException
+from services.feed import get_engagement_batch, get_top_engagement
+
+router = APIRouter(prefix="/images")
+
+MAX_ENGAGEMENT_IDS = 5000
+
+@router.get("/engagement")
+async def get_engagement_route(ids: str):
+    image_ids = [image_id for image_id in ids.split(",") if image_id]
+    if len(image_ids) > MAX_ENGAGEMENT_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_ENGAGEMENT_IDS} ids per request")
+    return {"engagement": get_engagement_batch(image_ids)}
+
+@router.get("/engagement/top")
+async def get_top_engagement_route(count: int = 100):
+    if count < 1 or count > MAX_ENGAGEMENT_IDS:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {MAX_ENGAGEMENT_IDS}")
+    return {"images": get_top_engagement(count)}
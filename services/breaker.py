@@ -0,0 +1,100 @@
+from services import metrics
+import threading
+import time
+
+# Circuit breaker. After `failure_threshold` consecutive failures calls are
+# rejected immediately for `reset_seconds`; then a single trial call is let
+# through and its outcome closes the breaker or opens it again.
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+breaker_state = metrics.Gauge(
+    "feedstream_breaker_state",
+    "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+)
+breaker_transitions = metrics.Counter(
+    "feedstream_breaker_transitions_total",
+    "Circuit breaker state changes",
+)
+breaker_rejections = metrics.Counter(
+    "feedstream_breaker_rejections_total",
+    "Calls rejected while the breaker was open",
+)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        breaker_state.set(0, breaker=name)
+
+    @property
+    def state(self):
+        return self._state
+
+    def _move(self, state: str):
+        if state != self._state:
+            self._state = state
+            breaker_state.set(STATE_VALUES[state], breaker=self.name)
+            breaker_transitions.inc(breaker=self.name, state=state)
+
+    def is_open(self):
+        """True while calls are being rejected (no trial is due yet)."""
+        with self._lock:
+            if self._state == OPEN:
+                return time.monotonic() - self._opened_at < self.reset_seconds
+            return self._state == HALF_OPEN and self._trial_running
+
+    def allow(self):
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._move(HALF_OPEN)
+            if self._state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+        breaker_rejections.inc(breaker=self.name)
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_running = False
+            self._move(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._move(OPEN)
+
+    def record_unknown(self):
+        """The call failed before reaching the service; let another trial run."""
+        with self._lock:
+            self._trial_running = False
+
+    def trip(self):
+        """Open the breaker now (tests, manual failover)."""
+        with self._lock:
+            self._opened_at = time.monotonic()
+            self._trial_running = False
+            self._move(OPEN)
+
+    def reset(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_running = False
+            self._move(CLOSED)
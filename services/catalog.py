@@ -0,0 +1,63 @@
+from fastapi import HTTPException
+from services.redis import get_redis
+import threading
+
+# Dense integer index for catalog images. Compact per-session structures
+# (seen bitmaps, filters, ledgers) address images by this index instead of
+# by their string id.
+
+INDEX_KEY = "catalog:index"
+IDS_KEY = "catalog:ids"
+NEXT_INDEX_KEY = "catalog:next_idx"
+
+_indexes = {}
+_ids = {}
+_lock = threading.Lock()
+
+
+def _remember(image_id: str, index: int):
+    _indexes[image_id] = index
+    _ids[index] = image_id
+
+
+def reset_catalog_cache():
+    with _lock:
+        _indexes.clear()
+        _ids.clear()
+
+
+def get_image_indexes(image_ids: list[str], create: bool = True):
+    """Return {image_id: index}, assigning indexes to images that lack one."""
+    missing = [image_id for image_id in dict.fromkeys(image_ids) if image_id not in _indexes]
+    if missing:
+        redis = get_redis()
+        if redis is None:
+            raise HTTPException(status_code=503, detail="Redis connection failed")
+        existing = redis.hmget(INDEX_KEY, missing)
+        with _lock:
+            for image_id, index in zip(missing, existing):
+                if index is None:
+                    if not create:
+                        continue
+                    index = redis.incr(NEXT_INDEX_KEY) - 1
+                    if redis.hsetnx(INDEX_KEY, image_id, index):
+                        redis.hset(IDS_KEY, index, image_id)
+                    else:
+                        index = redis.hget(INDEX_KEY, image_id)
+                _remember(image_id, int(index))
+    return {image_id: _indexes[image_id] for image_id in image_ids if image_id in _indexes}
+
+
+def get_image_ids(indexes: list[int]):
+    """Return {index: image_id} for indexes that belong to a catalog image."""
+    missing = [index for index in dict.fromkeys(indexes) if index not in _ids]
+    if missing:
+        redis = get_redis()
+        if redis is None:
+            raise HTTPException(status_code=503, detail="Redis connection failed")
+        existing = redis.hmget(IDS_KEY, missing)
+        with _lock:
+            for index, image_id in zip(missing, existing):
+                if image_id is not None:
+                    _remember(image_id, index)
+    return {index: _ids[index] for index in indexes if index in _ids}
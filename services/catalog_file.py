@@ -0,0 +1,212 @@
+from config import CATALOG_FILE_DIR, CATALOG_FILE_REBUILD_SECONDS, CATALOG_FILE_KEEP
+from contextlib import contextmanager
+import bisect
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+
+# Catalog snapshot file. A background job exports every catalog image (id,
+# URL, tag bitmask, global score) into one read-only binary file per version
+# under CATALOG_FILE_DIR and points the `catalog.bin` symlink at it with an
+# atomic rename. Workers mmap the file, so all workers on a host share one
+# copy through the page cache, and look images up locally instead of reading
+# their image:{id} hashes from Redis.
+#
+# Layout (little endian):
+#   header     magic, version, built_at, count, mask_words
+#   offsets    (count + 1) uint64 into the id blob, then the same for URLs
+#   masks      count * mask_words uint64, least significant word first
+#   scores     count float64
+#   blobs      UTF-8 ids (sorted), then UTF-8 URLs
+
+MAGIC = b"FSCATLG1"
+HEADER = struct.Struct("<8sQdQQ")
+LINK_NAME = "catalog.bin"
+LOCK_NAME = "catalog.lock"
+CHECK_INTERVAL_SECONDS = 1.0
+
+_current = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+class CatalogFile:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, self.built_at, self.count, self.mask_words = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog file")
+
+        view = memoryview(self._mmap)
+        count = self.count
+        position = HEADER.size
+        self._id_offsets = view[position:position + (count + 1) * 8].cast("Q")
+        position += (count + 1) * 8
+        self._url_offsets = view[position:position + (count + 1) * 8].cast("Q")
+        position += (count + 1) * 8
+        self._masks = view[position:position + count * self.mask_words * 8].cast("Q")
+        position += count * self.mask_words * 8
+        self._scores = view[position:position + count * 8].cast("d")
+        position += count * 8
+        ids_size = self._id_offsets[count] if count else 0
+        self._ids = view[position:position + ids_size]
+        self._urls = view[position + ids_size:]
+
+    def __len__(self):
+        return self.count
+
+    def image_id(self, slot: int):
+        return bytes(self._ids[self._id_offsets[slot]:self._id_offsets[slot + 1]]).decode()
+
+    def find(self, image_id: str):
+        slot = bisect.bisect_left(range(self.count), image_id, key=self.image_id)
+        if slot < self.count and self.image_id(slot) == image_id:
+            return slot
+        return None
+
+    def mask(self, slot: int):
+        words = self._masks[slot * self.mask_words:(slot + 1) * self.mask_words]
+        return sum(word << (64 * i) for i, word in enumerate(words))
+
+    def get_images(self, image_ids: list[str]):
+        """Catalog entries in the get_images_batch shape for the ids present
+        in the file."""
+        images = {}
+        for image_id in image_ids:
+            slot = self.find(image_id)
+            if slot is not None:
+                images[image_id] = {
+                    "image_id": image_id,
+                    "image_url": bytes(self._urls[self._url_offsets[slot]:self._url_offsets[slot + 1]]).decode(),
+                    "tag_mask": self.mask(slot),
+                }
+        return images
+
+    def global_scores(self, image_ids: list[str]):
+        slots = {image_id: self.find(image_id) for image_id in image_ids}
+        return {image_id: self._scores[slot] for image_id, slot in slots.items() if slot is not None}
+
+
+def write_catalog_file(directory: str, version: int, entries: list):
+    """entries: (image_id, image_url, tag_mask, global_score). Writes
+    catalog-{version}.bin and returns its path."""
+    entries = sorted(entries)
+    count = len(entries)
+    mask_words = max([1] + [(mask.bit_length() + 63) // 64 for _, _, mask, _ in entries])
+    ids = [image_id.encode() for image_id, _, _, _ in entries]
+    urls = [image_url.encode() for _, image_url, _, _ in entries]
+
+    def offsets(blobs):
+        total, result = 0, [0]
+        for blob in blobs:
+            total += len(blob)
+            result.append(total)
+        return struct.pack(f"<{count + 1}Q", *result)
+
+    words = []
+    for _, _, mask, _ in entries:
+        words.extend((mask >> (64 * i)) & 0xFFFFFFFFFFFFFFFF for i in range(mask_words))
+
+    path = os.path.join(directory, f"catalog-{version}.bin")
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, version, time.time(), count, mask_words))
+        f.write(offsets(ids))
+        f.write(offsets(urls))
+        f.write(struct.pack(f"<{len(words)}Q", *words))
+        f.write(struct.pack(f"<{count}d", *(score for _, _, _, score in entries)))
+        f.write(b"".join(ids))
+        f.write(b"".join(urls))
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def _publish(directory: str, path: str):
+    link = os.path.join(directory, LINK_NAME)
+    os.symlink(os.path.basename(path), link + ".tmp")
+    os.replace(link + ".tmp", link)
+
+    versions = sorted(
+        (int(name[len("catalog-"):-len(".bin")]), name)
+        for name in os.listdir(directory)
+        if name.startswith("catalog-") and name.endswith(".bin")
+    )
+    # Workers that still map an older file keep their mapping after unlink.
+    for _, name in versions[:-CATALOG_FILE_KEEP]:
+        os.unlink(os.path.join(directory, name))
+
+
+@contextmanager
+def _build_lock(directory: str):
+    with open(os.path.join(directory, LOCK_NAME), "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def current():
+    """The mmapped catalog file the symlink points at, or None. Checks for a
+    new version at most once per CHECK_INTERVAL_SECONDS."""
+    global _current, _checked_at
+    if not CATALOG_FILE_DIR:
+        return None
+    now = time.monotonic()
+    if now - _checked_at < CHECK_INTERVAL_SECONDS:
+        return _current
+    with _lock:
+        _checked_at = now
+        link = os.path.join(CATALOG_FILE_DIR, LINK_NAME)
+        try:
+            inode = os.stat(link).st_ino
+            if _current is None or _current.inode != inode:
+                _current = CatalogFile(link)
+        except FileNotFoundError:
+            _current = None
+        except (OSError, ValueError) as e:
+            print(f"Error opening catalog file: {e}")
+    return _current
+
+
+def reset_catalog_file():
+    global _current, _checked_at
+    with _lock:
+        _current = None
+        _checked_at = 0.0
+
+
+def _recheck():
+    global _checked_at
+    _checked_at = 0.0
+    return current()
+
+
+def export_catalog_file(snapshot, read_entries):
+    """Rebuild the catalog file if the global ranking changed and the current
+    file is older than CATALOG_FILE_REBUILD_SECONDS. One worker per host
+    builds; read_entries() returns the entries to write."""
+    if not CATALOG_FILE_DIR or snapshot is None:
+        return None
+    os.makedirs(CATALOG_FILE_DIR, exist_ok=True)
+    existing = _recheck()
+    if existing is not None and (
+        existing.version == snapshot.version
+        or time.time() - existing.built_at < CATALOG_FILE_REBUILD_SECONDS
+    ):
+        return existing
+
+    with _build_lock(CATALOG_FILE_DIR) as locked:
+        if not locked:
+            return existing
+        path = write_catalog_file(CATALOG_FILE_DIR, snapshot.version, read_entries())
+        _publish(CATALOG_FILE_DIR, path)
+    return _recheck()
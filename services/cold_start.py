@@ -0,0 +1,102 @@
+from fastapi import HTTPException
+from services.redis import get_redis
+from services.ranking import get_snapshot
+from services.singleflight import SingleFlight
+from services import metrics
+from config import COLD_START_CACHE_SIZE, COLD_START_TTL_SECONDS, COLD_START_WARM_KEYS
+from collections import Counter, OrderedDict
+import json
+import threading
+
+# Cold-start rankings. A session that has not seen anything yet ranks purely
+# from its tag scores and the global snapshot, so every new session with the
+# same preferred tags gets the same first ranking. It is computed once per
+# (ranking epoch, tag scores) and served from process memory, then Redis,
+# and rebuilt for the most requested tag sets when the epoch moves.
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_requested = Counter()
+_requested_scores = {}
+_warmed_epoch = None
+
+cold_start_flight = SingleFlight("cold_start")
+
+
+def cold_start_key(tag_scores: dict):
+    return ",".join(f"{tag}={score:g}" for tag, score in sorted(tag_scores.items()))
+
+
+def _redis_key(epoch: int, key: str):
+    return f"coldstart:{epoch}:{key}"
+
+
+def reset_cold_start_cache():
+    global _warmed_epoch
+    with _cache_lock:
+        _cache.clear()
+        _requested.clear()
+        _requested_scores.clear()
+        _warmed_epoch = None
+
+
+def _cache_put(cache_key, entry: dict):
+    with _cache_lock:
+        _cache[cache_key] = entry
+        _cache.move_to_end(cache_key)
+        while len(_cache) > COLD_START_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _load_or_compute(epoch: int, key: str, tag_scores: dict, compute):
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+
+    raw = redis.get(_redis_key(epoch, key))
+    if raw is not None:
+        entry = json.loads(raw)
+    else:
+        entry = compute(tag_scores)
+        redis.set(_redis_key(epoch, key), json.dumps(entry), ex=COLD_START_TTL_SECONDS)
+    _cache_put((epoch, key), entry)
+    return entry
+
+
+def get_cold_start(tag_scores: dict, compute):
+    """Cached {"ranked": [...ids], "images": {id: entry}} for a session with
+    these tag scores and nothing seen; compute(tag_scores) builds it on a miss.
+    Returns None without a ranking snapshot, since there is no epoch to key on."""
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return None
+
+    key = cold_start_key(tag_scores)
+    with _cache_lock:
+        _requested[key] += 1
+        _requested_scores[key] = dict(tag_scores)
+        entry = _cache.get((snapshot.epoch, key))
+        if entry is not None:
+            _cache.move_to_end((snapshot.epoch, key))
+    metrics.record_cache("cold_start", entry is not None)
+    if entry is not None:
+        return entry
+
+    return cold_start_flight.do(
+        (snapshot.epoch, key), lambda: _load_or_compute(snapshot.epoch, key, tag_scores, compute)
+    )
+
+
+def warm_cold_starts(snapshot, compute):
+    """Rebuild the most requested cold starts for a new epoch."""
+    global _warmed_epoch
+    if snapshot is None or snapshot.epoch == _warmed_epoch:
+        return 0
+    with _cache_lock:
+        popular = [(key, _requested_scores[key]) for key, _ in _requested.most_common(COLD_START_WARM_KEYS)]
+        _requested.clear()
+        _requested_scores.clear()
+    for key, tag_scores in popular:
+        _load_or_compute(snapshot.epoch, key, tag_scores, compute)
+    _warmed_epoch = snapshot.epoch
+    return len(popular)
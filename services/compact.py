@@ -0,0 +1,151 @@
+from fastapi.responses import Response
+from services.tags import get_tag_names, lookup_tag_ids
+from config import COMPACT_URL_PREFIXES, FEED_COMPRESSION, FEED_COMPRESSION_MIN_BYTES
+import gzip
+import json
+import zlib
+
+import brotli
+
+# Compact feed format: each image is a row [image_id, prefix id, url suffix,
+# tag ids]. Prefix ids index a fixed table (COMPACT_URL_PREFIXES, null when
+# no prefix matches and the suffix is the whole URL) and tag ids are the
+# global tag dictionary's, which only ever grows. So a client only needs the
+# names added since its last response: it sends back how many it has as
+# known_tags, and an SSE stream tracks that itself.
+
+FORMATS = ("json", "compact")
+URL_PREFIXES = [prefix for prefix in COMPACT_URL_PREFIXES.split(",") if prefix]
+_PREFIX_ORDER = sorted(range(len(URL_PREFIXES)), key=lambda prefix_id: -len(URL_PREFIXES[prefix_id]))
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def split_url(url: str):
+    """(prefix id, suffix), trying the longest prefixes first."""
+    for prefix_id in _PREFIX_ORDER:
+        prefix = URL_PREFIXES[prefix_id]
+        if url.startswith(prefix):
+            return prefix_id, url[len(prefix):]
+    return None, url
+
+
+def compact_image(image: dict):
+    prefix_id, suffix = split_url(image["image_url"])
+    tag_ids = lookup_tag_ids(image["image_tags"])
+    return [image["image_id"], prefix_id, suffix, [tag_ids[tag] for tag in image["image_tags"] if tag in tag_ids]]
+
+
+def compact_page(page: dict, known_tags: int = 0, prefixes: bool = True):
+    """page with its "visible"/"prefetched" images as compact rows, the tag
+    names from known_tags on (as "tag_base" and "tags", only when there are
+    any) and, with prefixes, the URL prefix table. Returns (compact page,
+    size of the client's tag dictionary afterwards)."""
+    compact = dict(page)
+    compact["format"] = "compact"
+    if prefixes:
+        compact["prefixes"] = URL_PREFIXES
+    used = set()
+    for key in ("visible", "prefetched"):
+        if key in page:
+            compact[key] = rows = [compact_image(image) for image in page[key]]
+            used.update(tag_id for row in rows for tag_id in row[3])
+    names = get_tag_names(needed=used)
+    base = known_tags if 0 <= known_tags <= len(names) else 0
+    if base < len(names):
+        compact["tag_base"], compact["tags"] = base, names[base:]
+    return compact, len(names)
+
+
+def choose_encoding(accept_encoding: str):
+    """The content coding for a client's Accept-Encoding, or None."""
+    if FEED_COMPRESSION not in ("gzip", "br") or not accept_encoding:
+        return None
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        quality = params.strip()
+        try:
+            if quality.startswith("q=") and float(quality[2:]) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip())
+    if FEED_COMPRESSION == "br" and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(data: bytes, encoding: str):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    return data
+
+
+def decompress(data: bytes, encoding: str):
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "br":
+        return brotli.decompress(data)
+    return data
+
+
+def json_response(payload: dict, accept_encoding: str = None):
+    """payload serialized once with json.dumps, compressed when the client
+    accepts it and the body is large enough to be worth it."""
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    headers = {}
+    if FEED_COMPRESSION in ("gzip", "br"):
+        headers["Vary"] = "Accept-Encoding"
+        encoding = choose_encoding(accept_encoding) if len(body) >= FEED_COMPRESSION_MIN_BYTES else None
+        if encoding:
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+
+class StreamEncoder:
+    """Serializes one SSE stream's events. In compact format the connected
+    event carries the URL prefix table and tag dictionary and later events
+    only the tag names added since. When compressed, every event is flushed
+    on its own (a gzip sync flush, a brotli flush) so proxies and clients can
+    decode it as soon as it arrives instead of waiting for more data."""
+
+    def __init__(self, response_format: str = "json", encoding: str = None):
+        self.compact = response_format == "compact"
+        self.encoding = encoding
+        self.known_tags = 0
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = None
+
+    def headers(self):
+        if self.encoding is None:
+            return {}
+        return {"Content-Encoding": self.encoding, "Vary": "Accept-Encoding"}
+
+    def event(self, message: dict):
+        if self.compact and message.get("type") == "connected":
+            message, self.known_tags = compact_page(message, self.known_tags)
+            data = json.dumps(message, separators=(",", ":"))
+        elif self.compact and "prefetched" in message:
+            message, self.known_tags = compact_page(message, self.known_tags, prefixes=False)
+            data = json.dumps(message, separators=(",", ":"))
+        else:
+            data = json.dumps(message)
+        return self._flush(f"data: {data}\n\n".encode())
+
+    def _flush(self, data: bytes):
+        if self.encoding == "gzip":
+            return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return data
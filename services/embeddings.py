@@ -0,0 +1,184 @@
+from fastapi import HTTPException
+from redis.exceptions import WatchError
+from services.redis import get_redis
+from services.keys import session_key
+from services import metrics
+from config import EMBEDDING_NEIGHBORS, EMBEDDING_LISTS, EMBEDDING_PROBES, EMBEDDING_TASTE_DECAY, SESSION_TTL_SECONDS
+import array
+import base64
+import math
+import sys
+import threading
+import numpy as np
+
+# "More like this" candidates. Images may carry an embedding vector (stored
+# base64 float32 in the `embedding` field of image:{id}). Each worker builds
+# a CPU inverted-file (IVF) index over them: vectors are clustered into
+# EMBEDDING_LISTS lists by k-means, and a query scans only the
+# EMBEDDING_PROBES lists whose centroids are closest. Likes and dislikes
+# move a per-session taste vector toward or away from the image, and
+# get_candidate takes the taste vector's nearest neighbors instead of whole
+# tag sets.
+
+VERSION_KEY = "embeddings:version"
+
+_index = None
+_index_version = None
+_lock = threading.Lock()
+
+index_size = metrics.Gauge(
+    "feedstream_embedding_index_size",
+    "Images in this worker's embedding index",
+)
+index_size.set_function(lambda: len(_index.image_ids) if _index is not None else 0)
+
+
+def available():
+    return np is not None
+
+
+def encode_embedding(vector):
+    values = array.array("f", vector)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return base64.b64encode(values.tobytes()).decode()
+
+
+def decode_embedding(raw: str):
+    return np.frombuffer(base64.b64decode(raw), dtype="<f4")
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class IVFIndex:
+    def __init__(self, image_ids: list[str], vectors, lists: int = None, iterations: int = 10, seed: int = 0):
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        count = len(image_ids)
+        lists = min(count, lists or max(1, int(math.sqrt(count))))
+
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(count, lists, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            # Empty lists keep their previous centroid.
+            filled = np.bincount(assign, minlength=lists) > 0
+            centroids[filled] = _normalize(sums[filled])
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+
+        order = np.argsort(assign, kind="stable")
+        self.centroids = centroids
+        self.vectors = vectors[order]
+        self.image_ids = [image_ids[i] for i in order]
+        self.offsets = np.searchsorted(assign[order], np.arange(lists + 1))
+        self.slots = {image_id: slot for slot, image_id in enumerate(self.image_ids)}
+
+    def vector(self, image_id: str):
+        slot = self.slots.get(image_id)
+        return self.vectors[slot] if slot is not None else None
+
+    def search(self, query, count: int, probes: int = None):
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        probes = min(len(self.centroids), probes or EMBEDDING_PROBES)
+        nearest_lists = np.argsort(-(self.centroids @ query))[:probes]
+        slots = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in nearest_lists])
+        scores = self.vectors[slots] @ query
+        if len(slots) > count:
+            top = np.argpartition(-scores, count)[:count]
+        else:
+            top = np.arange(len(slots))
+        top = top[np.argsort(-scores[top])]
+        return [self.image_ids[slot] for slot in slots[top]]
+
+
+def get_index():
+    return _index
+
+
+def reset_embedding_index():
+    global _index, _index_version
+    with _lock:
+        _index = None
+        _index_version = None
+
+
+def rebuild_index(read_embeddings):
+    """Rebuild this worker's index when embeddings were added since the last
+    build. read_embeddings() returns (image_id, encoded vector) pairs."""
+    global _index, _index_version
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    version = redis.get(VERSION_KEY)
+    if version is None or version == _index_version:
+        return _index
+
+    entries = read_embeddings()
+    vectors = [decode_embedding(raw) for _, raw in entries]
+    dimension = max((len(vector) for vector in vectors), default=0)
+    # Skip vectors that don't match the catalog's dimension.
+    entries = [(image_id, vector) for (image_id, _), vector in zip(entries, vectors) if len(vector) == dimension]
+    index = None
+    if entries:
+        index = IVFIndex([image_id for image_id, _ in entries], [vector for _, vector in entries], EMBEDDING_LISTS)
+    with _lock:
+        _index, _index_version = index, version
+    return index
+
+
+def _taste_key(session_id: str):
+    return session_key(session_id, "taste")
+
+
+def get_taste(session_id: str):
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    raw = redis.get(_taste_key(session_id))
+    return decode_embedding(raw) if raw is not None else None
+
+
+def update_taste(session_id: str, image_id: str, weight: float, ttl_seconds: int = SESSION_TTL_SECONDS):
+    """Decay the session's taste vector and add weight * the image's vector.
+    No-op for images without an embedding."""
+    index = _index
+    vector = index.vector(image_id) if index is not None else None
+    if vector is None:
+        return None
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+
+    key = _taste_key(session_id)
+    with redis.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                raw = pipe.get(key)
+                taste = decode_embedding(raw) if raw is not None else None
+                if taste is None or taste.shape != vector.shape:
+                    taste = np.zeros_like(vector)
+                taste = taste * EMBEDDING_TASTE_DECAY + weight * vector
+                pipe.multi()
+                pipe.set(key, encode_embedding(taste), ex=ttl_seconds)
+                pipe.execute()
+                return taste
+            except WatchError:
+                continue
+
+
+def similar_images(session_id: str, count: int = None):
+    """The taste vector's nearest images, or None when the session has no
+    taste vector yet (or no index has been built)."""
+    index = _index
+    if index is None:
+        return None
+    taste = get_taste(session_id)
+    metrics.record_cache("taste_vector", taste is not None)
+    if taste is None or taste.shape != index.vectors.shape[1:] or not taste.any():
+        return None
+    return index.search(taste, count or EMBEDDING_NEIGHBORS)
@@ -0,0 +1,129 @@
+from services import metrics, ranking
+from services.feed import get_images_batch, trending_decay
+from services.shared_catalog import SharedCatalog, rank_slots
+from config import RANKING_EXECUTOR, RANKING_THREADS, RANKING_PROCESSES
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import get_context
+import array
+import asyncio
+import contextvars
+import functools
+import threading
+
+# Where feed generation and ranking run. "inline" keeps everything on the
+# event loop, "thread" moves the whole feed build (Redis reads + scoring) to
+# a bounded thread pool, and "process" additionally sends the scoring/top-K
+# step of large candidate sets to a process pool that reads the catalog from
+# shared memory, so ranking no longer competes with request threads for
+# the GIL.
+
+# Below this many candidates the pickling round trip costs more than it saves.
+PROCESS_MIN_CANDIDATES = 2000
+
+offloaded_calls = metrics.Counter(
+    "feedstream_offloaded_calls_total",
+    "Feed builds run off the event loop",
+)
+shared_rankings = metrics.Counter(
+    "feedstream_shared_rankings_total",
+    "Ranking calls served by the process pool",
+)
+
+_threads = None
+_processes = None
+_catalog = None
+_pool_lock = threading.Lock()
+
+
+def get_executor_mode():
+    return RANKING_EXECUTOR
+
+
+def _thread_pool():
+    global _threads
+    with _pool_lock:
+        if _threads is None:
+            _threads = ThreadPoolExecutor(RANKING_THREADS, thread_name_prefix="ranking")
+        return _threads
+
+
+def _process_pool():
+    global _processes
+    with _pool_lock:
+        if _processes is None:
+            _processes = ProcessPoolExecutor(RANKING_PROCESSES, mp_context=get_context("spawn"))
+        return _processes
+
+
+async def offload(fn, *args):
+    """Run a synchronous feed build according to RANKING_EXECUTOR."""
+    mode = get_executor_mode()
+    if mode == "inline":
+        return fn(*args)
+    offloaded_calls.inc(mode=mode)
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_thread_pool(), functools.partial(context.run, fn, *args))
+
+
+@ranking.on_snapshot
+def publish_catalog(snapshot):
+    """Copy the snapshot's images (tag mask + global score) into shared memory
+    for the process pool. No-op unless the executor runs in process mode."""
+    global _catalog
+    if get_executor_mode() != "process" or snapshot is None:
+        return _catalog
+    if _catalog is not None and _catalog.epoch == snapshot.epoch:
+        return _catalog
+
+    image_ids = list(snapshot.scores)
+    images = get_images_batch(image_ids)
+    entries = [
+        (image_id, images[image_id]["tag_mask"], snapshot.scores[image_id])
+        for image_id in image_ids if image_id in images
+    ]
+    catalog = SharedCatalog.build(snapshot.epoch, entries)
+    previous, _catalog = _catalog, catalog
+    if previous is not None:
+        previous.release()
+    return _catalog
+
+
+def rank_shared(snapshot, available: list[str], dense: list, count: int):
+    """Top `count` ids of `available`, ranked in the process pool.
+
+    Returns None when the caller should rank in-process instead: not in
+    process mode, too few candidates, no shared catalog for this snapshot,
+    or a candidate the catalog has no slot for (added since the snapshot).
+    """
+    catalog = _catalog
+    if get_executor_mode() != "process" or len(available) < PROCESS_MIN_CANDIDATES:
+        return None
+    if snapshot is None or catalog is None or catalog.epoch != snapshot.epoch:
+        return None
+
+    slots = array.array("I")
+    for image_id in available:
+        slot = catalog.slots.get(image_id)
+        if slot is None:
+            return None
+        slots.append(slot)
+    scale = trending_decay(snapshot.origin) if snapshot.origin is not None else 1.0
+    future = _process_pool().submit(rank_slots, catalog.name, slots.tobytes(), dense, scale, count)
+    top_slots = future.result()
+    shared_rankings.inc()
+    return [catalog.image_ids[slot] for slot in top_slots]
+
+
+def shutdown():
+    global _threads, _processes, _catalog
+    with _pool_lock:
+        threads, processes = _threads, _processes
+        _threads = _processes = None
+    if threads is not None:
+        threads.shutdown(wait=True)
+    if processes is not None:
+        processes.shutdown(wait=True)
+    if _catalog is not None:
+        _catalog.release()
+        _catalog = None
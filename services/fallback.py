@@ -0,0 +1,155 @@
+from fastapi import HTTPException
+from services import metrics
+from services.feed import get_images_batch, describe_image
+from services.ranking import on_snapshot
+from services.redis import redis_breaker, UNAVAILABLE_ERRORS
+from services.interactions import PendingCounts
+from config import (
+    FALLBACK_FEED_SIZE, FALLBACK_SESSION_CACHE_SIZE, INTERACTION_BUFFER_SIZE,
+    INTERACTION_REPLAY_SECONDS, FEED_PAGE_SIZE, FEED_PREFETCH_SIZE,
+)
+from collections import OrderedDict, deque
+import asyncio
+import threading
+import time
+
+# Degraded mode for when Redis is down or the breaker is open. Each worker
+# keeps the top of the global ranking (with image URLs and tags) from the
+# last snapshot, serves /feed pages from it while remembering what it already
+# showed each session, and queues likes/dislikes in a bounded buffer that is
+# replayed once Redis answers again.
+
+_top = []
+_served = OrderedDict()
+_buffer = deque()
+_lock = threading.Lock()
+
+degraded_feeds = metrics.Counter(
+    "feedstream_degraded_feeds_total",
+    "Feed pages served from the local fallback list",
+)
+interactions_buffered = metrics.Counter(
+    "feedstream_interactions_buffered_total",
+    "Likes/dislikes queued locally while Redis was unavailable",
+)
+interactions_dropped = metrics.Counter(
+    "feedstream_interactions_dropped_total",
+    "Interactions lost because the local buffer was full or replay failed",
+)
+interactions_replayed = metrics.Counter(
+    "feedstream_interactions_replayed_total",
+    "Buffered interactions written to Redis after recovery",
+)
+interaction_buffer_depth = metrics.Gauge(
+    "feedstream_interaction_buffer_depth",
+    "Interactions waiting to be replayed",
+)
+interaction_buffer_depth.set_function(lambda: len(_buffer))
+
+
+@on_snapshot
+def refresh_fallback_feed(snapshot):
+    global _top
+    if snapshot is None:
+        return
+    ids = snapshot.global_ids()[:FALLBACK_FEED_SIZE]
+    images = get_images_batch(ids)
+    _top = [describe_image(images[image_id]) for image_id in ids if image_id in images]
+
+
+def reset_fallback():
+    global _top
+    with _lock:
+        _top = []
+        _served.clear()
+        _buffer.clear()
+
+
+def image_tags(image_id: str):
+    for image in _top:
+        if image["image_id"] == image_id:
+            return image["image_tags"]
+    return []
+
+
+def degraded_feed(session_id: str, tags: list[str] = None, mode: str = "any"):
+    top = _top
+    if not top:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    if tags:
+        match = all if mode == "all" else any
+        top = [image for image in top if match(tag in image["image_tags"] for tag in tags)]
+
+    with _lock:
+        served = _served.pop(session_id, set())
+        page = [image for image in top if image["image_id"] not in served][:FEED_PAGE_SIZE + FEED_PREFETCH_SIZE]
+        served.update(image["image_id"] for image in page)
+        _served[session_id] = served
+        while len(_served) > FALLBACK_SESSION_CACHE_SIZE:
+            _served.popitem(last=False)
+    degraded_feeds.inc()
+
+    if not page:
+        return {"message": "All images are shown", "degraded": True}
+    return {
+        "visible": page[:FEED_PAGE_SIZE],
+        "prefetched": page[FEED_PAGE_SIZE:],
+        "cursor": None,
+        "degraded": True,
+    }
+
+
+def buffer_interaction(kind: str, session_id: str, image_id: str, resume: str = None, previous: str = None):
+    """Queue an interaction for replay. resume/previous mark one whose ledger
+    swap already committed: replay continues at count step resume. Returns
+    False if the buffer is full."""
+    with _lock:
+        if len(_buffer) >= INTERACTION_BUFFER_SIZE:
+            interactions_dropped.inc(kind=kind, reason="buffer_full")
+            return False
+        _buffer.append((kind, session_id, image_id, resume, previous, time.time()))
+    interactions_buffered.inc(kind=kind)
+    return True
+
+
+def replay_buffered(apply):
+    """Apply buffered interactions in order until the buffer is empty or
+    Redis fails again. apply(kind, session_id, image_id, resume, previous)
+    does the write."""
+    replayed = 0
+    while True:
+        with _lock:
+            if not _buffer:
+                break
+            kind, session_id, image_id, resume, previous, queued_at = _buffer[0]
+        try:
+            apply(kind, session_id, image_id, resume, previous)
+        except PendingCounts as pending:
+            # Retry from the count step that failed, without swapping again.
+            with _lock:
+                _buffer[0] = (kind, session_id, image_id, pending.step, pending.previous, queued_at)
+            break
+        except UNAVAILABLE_ERRORS:
+            break
+        except Exception as e:
+            interactions_dropped.inc(kind=kind, reason="replay_failed")
+            print(f"Dropping buffered {kind} for session {session_id}: {e}")
+        else:
+            interactions_replayed.inc(kind=kind)
+            replayed += 1
+        with _lock:
+            _buffer.popleft()
+    return replayed
+
+
+async def run_replayer(apply):
+    while True:
+        await asyncio.sleep(INTERACTION_REPLAY_SECONDS)
+        if not _buffer or redis_breaker.is_open():
+            continue
+        try:
+            await asyncio.to_thread(replay_buffered, apply)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error replaying buffered interactions: {e}")
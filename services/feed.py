@@ -1,31 +1,69 @@
 from fastapi import HTTPException
-from services.redis import get_redis
+from services.redis import get_redis, get_read_redis
+from services.tags import tags_to_mask, mask_to_tags
+from services.catalog import get_image_indexes
+from services import session_store
+from services import seen_filter
+from services import embeddings
+from services import hot_keys
+from services import catalog_file
+from services import metrics
+from services.singleflight import SingleFlight
+from services.keys import session_key, ranking_key, tag_key
+from config import RANKING_MODE, TRENDING_HALF_LIFE_SECONDS, TRENDING_RENORMALIZE_SECONDS, HOT_KEY_SHARDS, SESSION_TTL_SECONDS
 import json
+import time
 
+GLOBAL_KEY = ranking_key("feed:global")
+GLOBAL_VERSION_KEY = ranking_key("feed:global:version")
+TRENDING_KEY = ranking_key("feed:trending")
+TRENDING_ORIGIN_KEY = ranking_key("feed:trending:origin")
+ALL_TAGS_KEY = ranking_key("tags:all")
 
-def store_image(image_id: str, image_url: str,image_tags: list[str]):    
+# Catalog-wide reads are identical for every caller, so concurrent callers
+# share one Redis round trip.
+shared_reads = SingleFlight("shared_reads")
+
+
+def store_image(image_id: str, image_url: str,image_tags: list[str], embedding: list[float] = None):    
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
     key = f"image:{image_id}"
-    redis.hset(key, mapping={
+    mapping = {
         "image_url": image_url,
-        "image_tags": json.dumps(image_tags)
-    })
+        "tag_mask": tags_to_mask(image_tags)
+    }
+    if embedding is not None:
+        mapping["embedding"] = embeddings.encode_embedding(embedding)
+    pipe = redis.pipeline()
+    pipe.hset(key, mapping=mapping)
+    pipe.hdel(key, "image_tags")
+    if embedding is not None:
+        pipe.incr(embeddings.VERSION_KEY)
+    pipe.execute()
+    get_image_indexes([image_id])
     return {"message": "Image stored successfully"}
 
+def _image_mask(tag_mask, legacy_tags):
+    if tag_mask is not None:
+        return int(tag_mask)
+    # Images ingested before the tag dictionary still carry a JSON tag list.
+    return tags_to_mask(json.loads(legacy_tags or "[]"))
+
 def get_image(image_id: str):
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
     key = f"image:{image_id}"
-    image = redis.hgetall(key)
-    if image is None or len(image) == 0:
+    image_url, tag_mask, legacy_tags = redis.hmget(key, "image_url", "tag_mask", "image_tags")
+    if image_url is None:
         return None
+    mask = _image_mask(tag_mask, legacy_tags)
     return {
         "image_id": image_id,
-        "image_url": image["image_url"],
-        "image_tags": json.loads(image["image_tags"])
+        "image_url": image_url,
+        "image_tags": mask_to_tags(mask)
     }
 
 
@@ -33,8 +71,8 @@ def increment_likes(image_id: str):
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
-    key  = f"image:{image_id}:likes"
-    likes =redis.incr(key)
+    key  = f"image:{image_id}"
+    likes =redis.hincrby(key, "likes", 1)
     return {
         "likes": likes
     }
@@ -43,77 +81,340 @@ def increment_dislikes(image_id: str):
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
-    key  = f"image:{image_id}:dislikes"
-    dislikes = redis.incr(key)
+    key  = f"image:{image_id}"
+    dislikes = redis.hincrby(key, "dislikes", 1)
     return {
         "dislikes": dislikes
     }
 
+def increment_engagement(image_id: str, counts: dict):
+    """HINCRBY each field of counts ({"likes": 1, "dislikes": -1}) on the
+    image hash."""
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    key = f"image:{image_id}"
+    pipe = redis.pipeline(transaction=False)
+    for field, amount in counts.items():
+        pipe.hincrby(key, field, amount)
+    return dict(zip(counts, pipe.execute()))
 
 def get_engagement(image_id: str):
-    redis = get_redis()
+    redis = get_read_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    return _read_engagement(redis, image_id)
+
+def _read_engagement(redis, image_id: str):
+    likes, dislikes = redis.hmget(f"image:{image_id}", "likes", "dislikes")
+    pending_likes, pending_dislikes = _pending_shard_counts(redis, [image_id]).get(image_id, (0, 0))
+    return {
+        "likes": int(likes or 0) + pending_likes,
+        "dislikes": int(dislikes or 0) + pending_dislikes
+    }
+
+def get_engagement_batch(image_ids: list[str]):
+    redis = get_read_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
-    likes = redis.get(f"image:{image_id}:likes")
-    dislikes = redis.get(f"image:{image_id}:dislikes")
+
+    pipe = redis.pipeline(transaction=False)
+    for image_id in image_ids:
+        pipe.hmget(f"image:{image_id}", "likes", "dislikes")
+    results = pipe.execute()
+
+    engagement = {
+        image_id: {"likes": int(likes or 0), "dislikes": int(dislikes or 0)}
+        for image_id, (likes, dislikes) in zip(image_ids, results)
+    }
+    for image_id, (pending_likes, pending_dislikes) in _pending_shard_counts(redis, image_ids).items():
+        engagement[image_id]["likes"] += pending_likes
+        engagement[image_id]["dislikes"] += pending_dislikes
+    return engagement
+
+def _read_shards(redis, image_ids: list[str]):
+    pipe = redis.pipeline(transaction=False)
+    for image_id in image_ids:
+        for shard in range(HOT_KEY_SHARDS):
+            pipe.hmget(hot_keys.shard_key(image_id, shard), "likes", "dislikes", "trending")
+    results = pipe.execute()
+    return {
+        image_id: [
+            (int(likes or 0), int(dislikes or 0), float(trending or 0))
+            for likes, dislikes, trending in results[i * HOT_KEY_SHARDS:(i + 1) * HOT_KEY_SHARDS]
+        ]
+        for i, image_id in enumerate(image_ids)
+    }
+
+def _pending_shard_counts(redis, image_ids: list[str]):
+    """Likes/dislikes of this worker's hot images that are still in shard
+    keys, waiting for the rollup."""
+    pending = hot_keys.dirty(image_ids)
+    if not pending:
+        return {}
     return {
-        "likes": int(likes or 0),
-        "dislikes": int(dislikes or 0)
+        image_id: (sum(shard[0] for shard in shards), sum(shard[1] for shard in shards))
+        for image_id, shards in _read_shards(redis, pending).items()
     }
 
+def increment_engagement_shard(image_id: str, field: str, amount: int = 1):
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    redis.hincrby(hot_keys.random_shard_key(image_id), field, amount)
+    hot_keys.mark_dirty(image_id)
+
+def increment_trending_shard(image_id: str, weight: float):
+    """Trending weight for a hot image, added to feed:trending by the rollup.
+    It is scaled for decay when rolled up, which credits it as up to
+    HOT_KEY_ROLLUP_SECONDS newer than it is."""
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    redis.hincrbyfloat(hot_keys.random_shard_key(image_id), "trending", weight)
+    hot_keys.mark_dirty(image_id)
+
+def rollup_engagement_shards():
+    """Fold the shard counts of images this worker sharded into their
+    image:{id} hashes, feed:global and feed:trending. Returns the number of
+    images rolled up."""
+    image_ids = sorted(hot_keys.take_dirty())
+    if not image_ids:
+        return 0
+    redis = get_redis()
+    if redis is None:
+        hot_keys.restore_dirty(image_ids)
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+
+    try:
+        shards = _read_shards(redis, image_ids)
+        # Subtract exactly what was read rather than deleting the shards, so
+        # increments that land in between are kept for the next rollup.
+        pipe = redis.pipeline(transaction=False)
+        for image_id in image_ids:
+            for shard, (likes, dislikes, trending) in enumerate(shards[image_id]):
+                key = hot_keys.shard_key(image_id, shard)
+                if likes:
+                    pipe.hincrby(key, "likes", -likes)
+                if dislikes:
+                    pipe.hincrby(key, "dislikes", -dislikes)
+                if trending:
+                    pipe.hincrbyfloat(key, "trending", -trending)
+        for image_id in image_ids:
+            pipe.hincrby(f"image:{image_id}", "likes", sum(shard[0] for shard in shards[image_id]))
+            pipe.hincrby(f"image:{image_id}", "dislikes", sum(shard[1] for shard in shards[image_id]))
+        totals = pipe.execute()[-2 * len(image_ids):]
+    except Exception:
+        hot_keys.restore_dirty(image_ids)
+        raise
+
+    scores = {image_id: totals[i * 2] * 2 - totals[i * 2 + 1] for i, image_id in enumerate(image_ids)}
+    trending = {image_id: sum(shard[2] for shard in shards[image_id]) for image_id in image_ids}
+    record_trending_batch({image_id: weight for image_id, weight in trending.items() if weight}, scores)
+    return len(image_ids)
+
+def get_top_engagement(count: int = 100):
+    top = get_top_global_images(count)
+    engagement = get_engagement_batch([image_id for image_id, _ in top])
+    return [
+        {"image_id": image_id, "score": score, **engagement[image_id]}
+        for image_id, score in top
+    ]
+
+def migrate_engagement_keys(batch_size: int = 500):
+    """Fold legacy image:{id}:likes / image:{id}:dislikes string keys into
+    the likes/dislikes fields of the image:{id} hash."""
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+
+    migrated = 0
+    for field in ("likes", "dislikes"):
+        keys = list(redis.scan_iter(match=f"image:*:{field}", count=batch_size))
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            values = redis.mget(batch)
+            pipe = redis.pipeline()
+            for key, value in zip(batch, values):
+                image_key = key[:-len(f":{field}")]
+                if value is not None:
+                    pipe.hincrby(image_key, field, int(value))
+                pipe.delete(key)
+            pipe.execute()
+            migrated += len(batch)
+    return migrated
+
 def update_engagement(image_id: str):
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
     
-    engagement = get_engagement(image_id)
-    if engagement is None:
-        raise HTTPException(status_code=404, detail="Image not found")
+    # Read back from the primary: a lagging replica could miss the
+    # increments this score is meant to include.
+    engagement = _read_engagement(redis, image_id)
     like , dislike = engagement["likes"], engagement["dislikes"]
     score = (like*2)-(dislike*1)
-    key = f"feed:global"
-    redis.zadd(key, {image_id: score})
+    key = GLOBAL_KEY
+    pipe = redis.pipeline()
+    pipe.zadd(key, {image_id: score})
+    pipe.incr(GLOBAL_VERSION_KEY)
+    pipe.execute()
     return score
 
 
+# Trending scores decay exponentially with TRENDING_HALF_LIFE_SECONDS. Instead
+# of rescoring every image as time passes, each interaction adds a weight
+# scaled up by 2^((now - origin) / half_life): the log2 of that factor grows
+# linearly with the offset from the origin, so newer interactions outweigh
+# older ones and `feed:trending` only ever needs ZINCRBY. Reading multiplies by
+# the inverse factor, and renormalize_trending() occasionally moves the origin
+# forward so the stored floats stay bounded.
+
+def get_ranking_mode():
+    return RANKING_MODE
+
+def trending_decay(origin: float, now: float = None):
+    now = time.time() if now is None else now
+    return 2 ** (-(now - origin) / TRENDING_HALF_LIFE_SECONDS)
+
+def record_trending(image_id: str, weight: float):
+    record_trending_batch({image_id: weight})
+
+def record_trending_batch(weights: dict, global_scores: dict = None):
+    """Add trending weights and set global_scores (image id -> feed:global
+    score) in one transaction with a single ranking version bump."""
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+
+    def apply(pipe):
+        now = time.time()
+        origin = pipe.get(TRENDING_ORIGIN_KEY) if weights else None
+        pipe.multi()
+        if weights and origin is None:
+            origin = now
+            pipe.set(TRENDING_ORIGIN_KEY, origin)
+        for image_id, weight in weights.items():
+            pipe.zincrby(TRENDING_KEY, weight / trending_decay(float(origin), now), image_id)
+        if global_scores:
+            pipe.zadd(GLOBAL_KEY, global_scores)
+        pipe.incr(GLOBAL_VERSION_KEY)
+
+    redis.transaction(apply, TRENDING_ORIGIN_KEY)
+
+def renormalize_trending(force: bool = False):
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+
+    def apply(pipe):
+        now = time.time()
+        origin = pipe.get(TRENDING_ORIGIN_KEY)
+        if origin is None:
+            return False
+        if not force and now - float(origin) < TRENDING_RENORMALIZE_SECONDS:
+            return False
+        pipe.multi()
+        pipe.zunionstore(TRENDING_KEY, {TRENDING_KEY: trending_decay(float(origin), now)})
+        pipe.set(TRENDING_ORIGIN_KEY, now)
+        return True
+
+    return redis.transaction(apply, TRENDING_ORIGIN_KEY, value_from_callable=True)
+
+def get_trending_scores(image_ids: list[str]):
+    redis = get_read_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+
+    pipe = redis.pipeline()
+    pipe.get(TRENDING_ORIGIN_KEY)
+    for image_id in image_ids:
+        pipe.zscore(TRENDING_KEY, image_id)
+    origin, *results = pipe.execute()
+
+    decay = trending_decay(float(origin)) if origin is not None else 1.0
+    return {
+        image_id: float(score) * decay if score is not None else 0.0
+        for image_id, score in zip(image_ids, results)
+    }
+
+
 def add_images_tags(image_id: str, tags: list[str]):
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
     
     for tag in tags:
-        key = f"tag:{tag}"
+        key = tag_key(tag)
         redis.sadd(key, image_id)
+    if tags:
+        redis.sadd(ALL_TAGS_KEY, *tags)
     return {"message": "Tags added successfully"}
 
+def get_all_tags():
+    redis = get_read_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    tags = redis.smembers(ALL_TAGS_KEY)
+    if not tags:
+        prefix = tag_key("")
+        tags = {key[len(prefix):] for key in redis.scan_iter(match=f"{prefix}*", count=500)}
+    return set(tags)
+
 def get_images_by_tag(tag: str):
-    redis = get_redis()
+    redis = get_read_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
-    key = f"tag:{tag}"
+    key = tag_key(tag)
     images = redis.smembers(key)
     return list(images)
 
 def mark_image_as_seen(session_id: str, image_id: str):
+    if session_store.get_session_store() == "packed":
+        return session_store.mark_packed_images_seen(session_id, [image_id]) == 1
+    if seen_filter.get_seen_tracker() == "bloom":
+        return seen_filter.mark_seen(session_id, [image_id], SESSION_TTL_SECONDS) == 1
+
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
     
     ensure_session(session_id)
     
-    key = f"session:{session_id}:seen_images"
+    key = session_key(session_id, "seen_images")
     added = redis.sadd(key, image_id)
     
     return added == 1
 
+def mark_images_as_seen(session_id: str, image_ids: list[str], ttl_seconds: int = SESSION_TTL_SECONDS):
+    if not image_ids:
+        return 0
+    if session_store.get_session_store() == "packed":
+        return session_store.mark_packed_images_seen(session_id, image_ids)
+    if seen_filter.get_seen_tracker() == "bloom":
+        return seen_filter.mark_seen(session_id, image_ids, ttl_seconds)
+
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    key = session_key(session_id, "seen_images")
+    pipe = redis.pipeline()
+    pipe.sadd(key, *image_ids)
+    pipe.expire(key, ttl_seconds)
+    added, _ = pipe.execute()
+    return added
+
+
+def ensure_session(session_id: str, ttl_seconds: int = SESSION_TTL_SECONDS):
+    if session_store.get_session_store() == "packed":
+        return session_store.ensure_packed_session(session_id)
 
-def ensure_session(session_id: str, ttl_seconds: int = 3600):
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
     
-    key_seen = f"session:{session_id}:seen_images"
-    key_tag_scores = f"session:{session_id}:tag_scores"
+    key_seen = session_key(session_id, "seen_images")
+    key_tag_scores = session_key(session_id, "tag_scores")
     
     if not redis.exists(key_seen):
         redis.sadd(key_seen, "__init__")
@@ -129,83 +430,211 @@ def ensure_session(session_id: str, ttl_seconds: int = 3600):
     
 
 def get_seen_images(session_id: str):
+    if session_store.get_session_store() == "packed":
+        return session_store.get_packed_seen_images(session_id)
+    if seen_filter.get_seen_tracker() == "bloom":
+        return seen_filter.get_seen(session_id)
+
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
-    key = f"session:{session_id}:seen_images"
+    key = session_key(session_id, "seen_images")
     images = redis.smembers(key)
     return set(images)
 
 def is_image_seen(session_id: str, image_id: str):
+    if session_store.get_session_store() == "packed":
+        return session_store.is_packed_image_seen(session_id, image_id)
+    if seen_filter.get_seen_tracker() == "bloom":
+        return seen_filter.is_seen(session_id, image_id)
+
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
-    key = f"session:{session_id}:seen_images"
+    key = session_key(session_id, "seen_images")
     return redis.sismember(key, image_id) == 1
 
 def update_tag_scores(session_id: str, tag, delta: float):
+    if session_store.get_session_store() == "packed":
+        return session_store.update_packed_tag_scores(session_id, {tag: delta}).get(tag, 0.0)
+
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
-    key = f"session:{session_id}:tag_scores"
+    key = session_key(session_id, "tag_scores")
     return redis.hincrbyfloat(key, tag, delta)
 
+def update_tag_scores_batch(session_id: str, deltas: dict, ttl_seconds: int = SESSION_TTL_SECONDS):
+    if not deltas:
+        return {}
+    if session_store.get_session_store() == "packed":
+        return session_store.update_packed_tag_scores(session_id, deltas)
+
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    key = session_key(session_id, "tag_scores")
+    pipe = redis.pipeline()
+    for tag, delta in deltas.items():
+        pipe.hincrbyfloat(key, tag, delta)
+    pipe.expire(key, ttl_seconds)
+    return dict(zip(deltas, pipe.execute()))
+
 def get_tag_scores(session_id: str):
+    if session_store.get_session_store() == "packed":
+        return session_store.get_packed_tag_scores(session_id)
+
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
-    key = f"session:{session_id}:tag_scores"
+    key = session_key(session_id, "tag_scores")
     raw_scores = redis.hgetall(key)
     return {k: float(v) for k, v in raw_scores.items()}
 
+def get_session_view(session_id: str):
+    """(seen images, tag scores) for a feed request. A packed session is
+    read once for both."""
+    if session_store.get_session_store() == "packed":
+        return session_store.get_packed_session_view(session_id)
+    return get_seen_images(session_id), get_tag_scores(session_id)
+
 def get_top_global_images(count: int = 10):
-    redis = get_redis()
+    return shared_reads.do(("top_global", count), lambda: _read_top_global_images(count))
+
+def _read_top_global_images(count: int):
+    redis = get_read_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
-    key = f"feed:global"
+    key = GLOBAL_KEY
     return redis.zrevrange(key, 0, count - 1, withscores=True)
 
 def get_global_score(image_id: str):
-    redis = get_redis()
+    redis = get_read_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
-    key = f"feed:global"
+    key = GLOBAL_KEY
     return redis.zscore(key, image_id)
 
 def get_all_images():
-    redis = get_redis()
+    return shared_reads.do("all_images", _read_all_images)
+
+def _read_all_images():
+    redis = get_read_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
-    key = f"feed:global"
+    key = GLOBAL_KEY
     images = redis.zrange(key, 0, -1, withscores=True)
     return [img for img, _ in images]
 
 def get_images_batch(image_ids: list[str]):
-    redis = get_redis()
+    """Fetch catalog entries for ranking: tags come back as a bitmask, use
+    describe_image() to turn an entry into the public image shape."""
+    images = {}
+    catalog = catalog_file.current()
+    if catalog is not None:
+        images = catalog.get_images(image_ids)
+        metrics.cache_hits.inc(len(images), cache="catalog_file")
+        if len(images) == len(image_ids):
+            return images
+        image_ids = [image_id for image_id in image_ids if image_id not in images]
+        metrics.cache_misses.inc(len(image_ids), cache="catalog_file")
+    images.update(_read_images(image_ids))
+    return images
+
+def _read_images(image_ids: list[str]):
+    redis = get_read_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
     
-    pipe = redis.pipeline()
+    # Image hashes live in different slots; a non-transactional pipeline is
+    # split per node by the cluster client and sent as one batch per node.
+    pipe = redis.pipeline(transaction=False)
     for image_id in image_ids:
-        pipe.hgetall(f"image:{image_id}")
+        pipe.hmget(f"image:{image_id}", "image_url", "tag_mask", "image_tags")
     results = pipe.execute()
     
     images = {}
-    for image_id, result in zip(image_ids, results):
-        if result and len(result) > 0:
+    for image_id, (image_url, tag_mask, legacy_tags) in zip(image_ids, results):
+        if image_url is not None:
             images[image_id] = {
                 "image_id": image_id,
-                "image_url": result["image_url"],
-                "image_tags": json.loads(result["image_tags"])
+                "image_url": image_url,
+                "tag_mask": _image_mask(tag_mask, legacy_tags)
             }
     return images
 
-def get_global_scores_batch(image_ids: list[str]):
+def read_catalog_entries(batch_size: int = 1000):
+    """(image_id, image_url, tag_mask, global_score) for every ranked image,
+    read from Redis for the catalog file export."""
+    redis = get_read_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    ranked = redis.zrange(GLOBAL_KEY, 0, -1, withscores=True)
+    entries = []
+    for start in range(0, len(ranked), batch_size):
+        batch = ranked[start:start + batch_size]
+        images = _read_images([image_id for image_id, _ in batch])
+        entries.extend(
+            (image_id, images[image_id]["image_url"], images[image_id]["tag_mask"], score)
+            for image_id, score in batch if image_id in images
+        )
+    return entries
+
+def read_embeddings(batch_size: int = 1000):
+    """(image_id, encoded embedding) for every ranked image that has one."""
+    redis = get_read_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    image_ids = redis.zrange(GLOBAL_KEY, 0, -1)
+    entries = []
+    for start in range(0, len(image_ids), batch_size):
+        batch = image_ids[start:start + batch_size]
+        pipe = redis.pipeline(transaction=False)
+        for image_id in batch:
+            pipe.hget(f"image:{image_id}", "embedding")
+        entries.extend((image_id, raw) for image_id, raw in zip(batch, pipe.execute()) if raw is not None)
+    return entries
+
+def describe_image(image: dict):
+    return {
+        "image_id": image["image_id"],
+        "image_url": image["image_url"],
+        "image_tags": mask_to_tags(image["tag_mask"])
+    }
+
+def migrate_image_tags(batch_size: int = 500):
+    """Replace the JSON image_tags field of legacy image hashes with a tag_mask."""
     redis = get_redis()
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
+
+    keys = [key for key in redis.scan_iter(match="image:*", count=batch_size) if key.count(":") == 1]
+    migrated = 0
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        pipe = redis.pipeline(transaction=False)
+        for key in batch:
+            pipe.hget(key, "image_tags")
+        legacy = pipe.execute()
+        pipe = redis.pipeline(transaction=False)
+        for key, legacy_tags in zip(batch, legacy):
+            if legacy_tags is None:
+                continue
+            pipe.hset(key, "tag_mask", tags_to_mask(json.loads(legacy_tags)))
+            pipe.hdel(key, "image_tags")
+            migrated += 1
+        pipe.execute()
+    return migrated
+
+def get_global_scores_batch(image_ids: list[str]):
+    if get_ranking_mode() == "trending":
+        return get_trending_scores(image_ids)
+
+    redis = get_read_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
     
-    key = f"feed:global"
+    key = GLOBAL_KEY
     pipe = redis.pipeline()
     for image_id in image_ids:
         pipe.zscore(key, image_id)
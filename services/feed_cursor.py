@@ -0,0 +1,83 @@
+from fastapi import HTTPException
+from services.redis import get_redis
+from services.keys import cursor_key
+from config import FEED_CURSOR_TTL_SECONDS, FEED_CURSOR_RESCORE_THRESHOLD
+import base64
+import binascii
+import json
+import uuid
+
+# Feed cursors. The first /feed request ranks the session's remaining depth
+# once and stores the ordered ids under a short TTL; the cursor handed back
+# is the ranking token plus an offset, so following pages are an LRANGE
+# instead of a re-rank of the catalog.
+
+
+def _ids_key(token: str):
+    return cursor_key(token, "ids")
+
+
+def _meta_key(token: str):
+    return cursor_key(token)
+
+
+def encode_cursor(token: str, offset: int):
+    return base64.urlsafe_b64encode(f"{token}:{offset}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        token, offset = raw.rsplit(":", 1)
+        offset = int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return token, offset
+
+
+def tag_drift(ranked_with: dict, current: dict):
+    """Relative L1 distance between the tag scores a ranking was built with
+    and the session's current ones."""
+    tags = set(ranked_with) | set(current)
+    change = sum(abs(current.get(tag, 0.0) - ranked_with.get(tag, 0.0)) for tag in tags)
+    return change / max(1.0, sum(abs(score) for score in ranked_with.values()))
+
+
+def save_ranking(session_id: str, ranked_ids: list[str], tag_scores: dict):
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+
+    token = uuid.uuid4().hex
+    pipe = redis.pipeline()
+    pipe.rpush(_ids_key(token), *ranked_ids)
+    pipe.hset(_meta_key(token), mapping={"session_id": session_id, "tag_scores": json.dumps(tag_scores)})
+    pipe.expire(_ids_key(token), FEED_CURSOR_TTL_SECONDS)
+    pipe.expire(_meta_key(token), FEED_CURSOR_TTL_SECONDS)
+    pipe.execute()
+    return token
+
+
+def load_page(cursor: str, session_id: str, tag_scores: dict, count: int):
+    """Return (token, offset, ids, total) for the page at cursor, or None if
+    the ranking expired or the session's tag scores moved too far from it."""
+    token, offset = decode_cursor(cursor)
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+
+    pipe = redis.pipeline()
+    pipe.hmget(_meta_key(token), "session_id", "tag_scores")
+    pipe.lrange(_ids_key(token), offset, offset + count - 1)
+    pipe.llen(_ids_key(token))
+    (owner, ranked_with), ids, total = pipe.execute()
+
+    if owner is None:
+        return None
+    if owner != session_id:
+        raise HTTPException(status_code=400, detail="Cursor belongs to another session")
+    if tag_drift(json.loads(ranked_with), tag_scores) > FEED_CURSOR_RESCORE_THRESHOLD:
+        return None
+    return token, offset, ids, total
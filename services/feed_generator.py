@@ -1,160 +1,331 @@
-from services.feed import get_image, get_seen_images, is_image_seen, mark_image_as_seen, update_tag_scores, get_tag_scores,get_all_images,get_top_global_images,get_images_by_tag,get_global_score,increment_likes,update_engagement,increment_dislikes,ensure_session,get_images_batch,get_global_scores_batch
-from services.redis import get_redis
+from services.feed import get_image, get_seen_images, is_image_seen, mark_image_as_seen, update_tag_scores, get_tag_scores,get_all_images,get_top_global_images,get_images_by_tag,get_global_score,increment_engagement,update_engagement,ensure_session,get_images_batch,mark_images_as_seen,update_tag_scores_batch,get_global_scores_batch,record_trending,describe_image,increment_engagement_shard,increment_trending_shard,read_catalog_entries,read_embeddings,get_session_view
+from services.redis import get_redis, redis_breaker, UNAVAILABLE_ERRORS
 from services.sse_manager import broadcast_to_session, has_active_connections
+from services import metrics
+from services.profiler import profiled
+from services.ranking import get_snapshot, on_snapshot
+from services.tags import dense_tag_scores, mask_boost
+from services import tasks
+from services import executor
+from services import feed_cursor
+from services.cold_start import get_cold_start, warm_cold_starts
+from services.catalog_file import export_catalog_file
+from services import fallback
+from services import hot_keys
+from services import embeddings
+from services.tag_index import get_tag_index
+from services.interactions import swap_interaction, PendingCounts
+from config import FEED_PAGE_SIZE, FEED_PREFETCH_SIZE, FEED_MAX_SEEN
 from fastapi import HTTPException
-import asyncio
+import time
 
 
 
-def get_candidate(session_id:str):
-    all_images = get_all_images()
+def get_candidate(session_id:str, tag_scores: dict = None):
+    if tag_scores is None:
+        tag_scores = get_tag_scores(session_id)
+    top_tags = sorted(tag_scores.items(), key=lambda x: x[1], reverse=True)[:3]
 
-    tag_scores = get_tag_scores(session_id)
+    snapshot = get_snapshot()
+    metrics.record_cache("ranking_snapshot", snapshot is not None)
+    # Candidates are returned sorted: ranking sorts are stable, so equal
+    # scores break by image id instead of by set iteration order, which
+    # changes from process to process.
+    if snapshot is not None:
+        candidate = set(snapshot.global_ids())
+        # Sessions with a taste vector get its nearest images instead of
+        # whole tag sets. Cold-start rankings have no session to look up.
+        similar = embeddings.similar_images(session_id) if session_id is not None else None
+        if similar is not None:
+            candidate.update(similar)
+            return sorted(candidate)
+        for tag, score in top_tags:
+            candidate.update(snapshot.tag_ids(tag))
+        return sorted(candidate)
 
+    all_images = get_all_images()
 
     tag_based_images = []
-    if tag_scores:
-        top_tags = sorted(tag_scores.items(), key=lambda x: x[1], reverse=True)[:3]    
-        for tag, score in top_tags:
-            images_by_tag = get_images_by_tag(tag)
-            tag_based_images.extend(images_by_tag)
+    for tag, score in top_tags:
+        images_by_tag = get_images_by_tag(tag)
+        tag_based_images.extend(images_by_tag)
 
-    candidate = list(set(all_images + tag_based_images))
+    candidate = sorted(set(all_images + tag_based_images))
     return candidate
 
-def get_prefetched_batch(session_id: str, count: int = 10):
-    seen_images = get_seen_images(session_id)
-    if len(seen_images) >= 50:
+def get_candidate_scores(image_ids: list[str]):
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.global_scores(image_ids)
+    return get_global_scores_batch(image_ids)
+
+def score_candidates(available: list[str], images_dict: dict, global_scores: dict, tag_scores: dict, count: int, source: str):
+    ranking_start = time.perf_counter()
+    dense = dense_tag_scores(tag_scores)
+    boosts = {}
+    scored = []
+
+    for image_id in available:
+        image = images_dict.get(image_id)
+        if image is None:
+            continue
+        tag_boost = mask_boost(image["tag_mask"], dense, boosts)
+        final_score = global_scores.get(image_id, 0) + tag_boost
+        scored.append((image_id, final_score))
+
+    scored.sort(key=lambda x: x[1], reverse=True)
+    top_ids = [image_id for image_id, _ in scored[:count]]
+    metrics.ranking_duration.observe(time.perf_counter() - ranking_start, source=source)
+    return top_ids
+
+def rank_available(available: list[str], tag_scores: dict, count: int, source: str):
+    """Rank unseen candidates; returns the top ids and their catalog entries."""
+    ranking_start = time.perf_counter()
+    top_ids = executor.rank_shared(get_snapshot(), available, dense_tag_scores(tag_scores), count)
+    if top_ids is not None:
+        metrics.ranking_duration.observe(time.perf_counter() - ranking_start, source=source)
+        images_dict = get_images_batch(top_ids)
+        return [image_id for image_id in top_ids if image_id in images_dict], images_dict
+
+    global_scores = get_candidate_scores(available)
+    images_dict = get_images_batch(available)
+    return score_candidates(available, images_dict, global_scores, tag_scores, count, source), images_dict
+
+@profiled("get_prefetched_batch")
+def get_prefetched_batch(session_id: str, count: int = FEED_PREFETCH_SIZE):
+    seen_images, tag_scores = get_session_view(session_id)
+    if len(seen_images) >= FEED_MAX_SEEN:
         return []
     
-    candidate = get_candidate(session_id)
+    candidate = get_candidate(session_id, tag_scores)
     available = [img for img in candidate if img not in seen_images]
+    metrics.candidate_set_size.observe(len(available), source="prefetch")
     
     if not available:
         return []
     
-    global_scores = get_global_scores_batch(available)
-    images_dict = get_images_batch(available)
+    top_images, images_dict = rank_available(available, tag_scores, count, "prefetch")
     
-    tag_scores = get_tag_scores(session_id)
-    scored = []
-    
-    for image_id in available:
-        if image_id not in images_dict:
-            continue
-        image = images_dict[image_id]
-        global_score = global_scores.get(image_id, 0)
-        image_tags = image["image_tags"]
-        tag_boost = sum(tag_scores.get(tag, 0) for tag in image_tags)
-        final_score = global_score + tag_boost
-        scored.append((image_id, final_score))
-    
-    scored.sort(key=lambda x: x[1], reverse=True)
-    top_images = [image_id for image_id, _ in scored[:count]]
-    
-    prefetched = [images_dict[img_id] for img_id in top_images if img_id in images_dict]
+    prefetched = [describe_image(images_dict[img_id]) for img_id in top_images]
     
     return prefetched
 
-def generate_feed(session_id:str):
+def rank_cold_start(tag_scores: dict):
+    """First ranking for a session with these tag scores and nothing seen."""
+    candidate = get_candidate(None, tag_scores)
+    metrics.candidate_set_size.observe(len(candidate), source="cold_start")
+    if not candidate:
+        return {"ranked": [], "images": {}}
+    ranked, images_dict = rank_available(candidate, tag_scores, FEED_MAX_SEEN, "cold_start")
+    return {"ranked": ranked, "images": {image_id: images_dict[image_id] for image_id in ranked}}
 
-    seen_images = get_seen_images(session_id)
-    if len(seen_images)>=50:
-        return {"message": "All 50 images are shown"}
+on_snapshot(lambda snapshot: warm_cold_starts(snapshot, rank_cold_start))
+on_snapshot(lambda snapshot: export_catalog_file(snapshot, read_catalog_entries))
+on_snapshot(lambda snapshot: embeddings.rebuild_index(read_embeddings))
 
-    candidate = get_candidate(session_id)
+@profiled("generate_feed")
+def generate_feed(session_id:str, cursor: str = None, tags: list[str] = None, mode: str = "any"):
 
-    available = [img for img in candidate if img not in seen_images]
-    
-    if not available:
-        return {"message": "All 50 images are shown"}
+    seen_images, tag_scores = get_session_view(session_id)
+    remaining = FEED_MAX_SEEN - len(seen_images)
+    if remaining <= 0:
+        return {"message": f"All {FEED_MAX_SEEN} images are shown"}
 
-    global_scores = get_global_scores_batch(available)
-    images_dict = get_images_batch(available)
+    page_size = min(FEED_PAGE_SIZE + FEED_PREFETCH_SIZE, remaining)
 
-    tag_scores = get_tag_scores(session_id)
-    scored = []
+    page = feed_cursor.load_page(cursor, session_id, tag_scores, page_size) if cursor else None
+    if page is not None:
+        token, offset, page_ids, total = page
+        page_ids = [img for img in page_ids if img not in seen_images]
+        images_dict = get_images_batch(page_ids)
+        page_ids = [img for img in page_ids if img in images_dict]
+    if cursor:
+        metrics.record_cache("feed_cursor", bool(page and page_ids))
 
-    for image_id in available:
-        if image_id not in images_dict:
-            continue
-        image = images_dict[image_id]
-        global_score = global_scores.get(image_id, 0)
-        image_tags = image["image_tags"]
-        tag_boost = sum(tag_scores.get(tag, 0) for tag in image_tags)
-        final_score = global_score + tag_boost
-        scored.append((image_id, final_score))
+    if page is None or not page_ids:
+        # No usable cursor: rank the session's remaining depth once. Sessions
+        # that haven't seen anything share a ranking per tag-score set.
+        cold_start = get_cold_start(tag_scores, rank_cold_start) if not seen_images and not tags else None
+        if cold_start is not None:
+            ranked, images_dict = cold_start["ranked"], cold_start["images"]
+        else:
+            if tags:
+                candidate = get_tag_index().query(tags, mode)
+                if not candidate:
+                    return {"message": "No images match the requested tags"}
+            else:
+                candidate = get_candidate(session_id, tag_scores)
 
-    scored.sort(key=lambda x: x[1], reverse=True)
-    top_20 = [image_id for image_id, _ in scored[:20]]
+            available = [img for img in candidate if img not in seen_images]
+            metrics.candidate_set_size.observe(len(available), source="feed")
+
+            ranked, images_dict = rank_available(available, tag_scores, remaining, "feed") if available else ([], {})
+
+        if not ranked:
+            return {"message": f"All {FEED_MAX_SEEN} images are shown"}
 
-    visible_ids = top_20[:10]
-    prefetched_ids = top_20[10:20]
+        token = feed_cursor.save_ranking(session_id, ranked, tag_scores)
+        offset, total = 0, len(ranked)
+        page_ids = ranked[:page_size]
 
-    for image_id in visible_ids + prefetched_ids:
-        mark_image_as_seen(session_id, image_id)
+    visible_ids = page_ids[:FEED_PAGE_SIZE]
+    prefetched_ids = page_ids[FEED_PAGE_SIZE:]
 
-    visible_images = [images_dict[img_id] for img_id in visible_ids if img_id in images_dict]
-    prefetched_images = [images_dict[img_id] for img_id in prefetched_ids if img_id in images_dict]
+    mark_images_as_seen(session_id, visible_ids + prefetched_ids)
+
+    visible_images = [describe_image(images_dict[img_id]) for img_id in visible_ids]
+    prefetched_images = [describe_image(images_dict[img_id]) for img_id in prefetched_ids]
+
+    next_offset = offset + page_size
+    has_more = next_offset < total and len(seen_images) + len(page_ids) < FEED_MAX_SEEN
     
     return {
         "visible": visible_images,
-        "prefetched": prefetched_images
+        "prefetched": prefetched_images,
+        "cursor": feed_cursor.encode_cursor(token, next_offset) if has_more else None
     }
 
 
 
-async def like_handler(session_id:str, image_id:str):
-    ensure_session(session_id)
-    image = get_image(image_id)
-    if not image:
-        raise HTTPException(status_code=404, detail="Image not found")
-    increment_likes(image_id)
+def _count_engagement(image_id: str, counts: dict, hot: bool):
+    # Hot images count into shard keys; the rollup updates feed:global.
+    if hot:
+        for field, amount in counts.items():
+            increment_engagement_shard(image_id, field, amount)
+        return
+    increment_engagement(image_id, counts)
     update_engagement(image_id)
-    for tag in image["image_tags"]:
-        update_tag_scores(session_id, tag, 1.0)
-    
-    # Run prefetch update in background - don't block the response
-    if has_active_connections(session_id):
-        asyncio.create_task(_broadcast_prefetch_update(session_id))
-    
-    return {"message": "Liked", "liked_tags": image["image_tags"]}
 
-async def dislike_handler(session_id:str, image_id:str):
+def _count_trending(image_id: str, weight: float, hot: bool):
+    # Likewise, hot images stay off the feed:trending transaction.
+    if hot:
+        increment_trending_shard(image_id, weight)
+    else:
+        record_trending(image_id, weight)
+
+def _interaction_image(session_id: str, image_id: str):
     ensure_session(session_id)
     image = get_image(image_id)
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
-    increment_dislikes(image_id)
-    update_engagement(image_id)
-    
-    tag_scores = get_tag_scores(session_id)
-    image_tags = image["image_tags"]
-    
-    for tag in image_tags:
-        current_score = tag_scores.get(tag, 0)
-        if current_score > 0:
-            update_tag_scores(session_id, tag, -0.5)
-        elif current_score < 0:
-            update_tag_scores(session_id, tag, -1.0)
-        else:
-            pass
-    
+    return image
+
+# Writes after the ledger swap, in order. A buffered interaction resumes at
+# the first one that didn't complete.
+COUNT_STEPS = ("engagement", "trending", "taste")
+
+def _count_interaction(kind: str, session_id: str, image_id: str, previous: str = None, resume: str = COUNT_STEPS[0]):
+    """Engagement counts, ranking, trending and taste for a ledger swap from
+    previous (the session's earlier interaction with the image) to kind,
+    starting at step resume. Raises PendingCounts if Redis fails."""
+    counts = {}
+    trending = taste = 0.0
+    if previous == "like":
+        counts["likes"] = -1
+        trending -= 2.0
+        taste -= 1.0
+    elif previous == "dislike":
+        counts["dislikes"] = -1
+        trending += 1.0
+        taste += 0.5
+
+    if kind == "like":
+        counts["likes"] = 1
+        trending += 2.0
+        taste += 1.0
+    else:
+        counts["dislikes"] = 1
+        trending -= 1.0
+        taste -= 0.5
+
+    # A resumed interaction was already counted towards hot-key detection.
+    hot = hot_keys.observe(image_id) if resume == COUNT_STEPS[0] else hot_keys.is_hot(image_id)
+    writes = {
+        "engagement": lambda: _count_engagement(image_id, counts, hot),
+        "trending": lambda: _count_trending(image_id, trending, hot),
+        "taste": lambda: embeddings.update_taste(session_id, image_id, taste),
+    }
+    for step in COUNT_STEPS[COUNT_STEPS.index(resume):]:
+        try:
+            writes[step]()
+        except UNAVAILABLE_ERRORS as e:
+            raise PendingCounts(previous, step) from e
+
+@profiled("apply_interaction")
+def apply_interaction(kind: str, session_id: str, image_id: str, resume: str = None, previous: str = None):
+    """Like or dislike once per session and image: repeats are no-ops and
+    switching reverses the earlier interaction. Returns (image tags, changed).
+
+    resume names the count step a buffered interaction stopped at: its ledger
+    already moved from previous to kind, and only the remaining writes run.
+    Raises PendingCounts if Redis fails after the ledger swap."""
+    image = _interaction_image(session_id, image_id)
+    if resume is None:
+        previous = swap_interaction(session_id, image_id, kind, image["image_tags"])
+        if previous == kind:
+            metrics.repeated_interactions.inc(kind=kind)
+            return image["image_tags"], False
+        resume = COUNT_STEPS[0]
+    _count_interaction(kind, session_id, image_id, previous, resume)
+    return image["image_tags"], True
+
+def _record_or_buffer(kind: str, session_id: str, image_id: str):
+    """Write the interaction, or queue it locally while Redis is unavailable.
+    Returns (image tags, changed, buffered)."""
+    try:
+        return *apply_interaction(kind, session_id, image_id), False
+    except PendingCounts as pending:
+        # The ledger swap is committed: replaying must only finish the counts.
+        queued = fallback.buffer_interaction(kind, session_id, image_id, pending.step, pending.previous)
+    except UNAVAILABLE_ERRORS:
+        queued = fallback.buffer_interaction(kind, session_id, image_id)
+    if not queued:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    return fallback.image_tags(image_id), True, True
+
+def _schedule_prefetch_update(session_id: str):
     # Run prefetch update in background - don't block the response
     if has_active_connections(session_id):
-        asyncio.create_task(_broadcast_prefetch_update(session_id))
-    
-    return {"message": "Disliked", "disliked_tags": image_tags}
+        tasks.submit(
+            _broadcast_prefetch_update, session_id,
+            priority=tasks.INTERACTIVE, name="prefetch_broadcast", key=("prefetch", session_id),
+        )
+
+async def like_handler(session_id:str, image_id:str):
+    liked_tags, changed, buffered = _record_or_buffer("like", session_id, image_id)
+    if buffered:
+        return {"message": "Liked", "liked_tags": liked_tags, "buffered": True}
+    if not changed:
+        return {"message": "Liked", "liked_tags": liked_tags, "unchanged": True}
+    _schedule_prefetch_update(session_id)
+    return {"message": "Liked", "liked_tags": liked_tags}
+
+async def dislike_handler(session_id:str, image_id:str):
+    disliked_tags, changed, buffered = _record_or_buffer("dislike", session_id, image_id)
+    if buffered:
+        return {"message": "Disliked", "disliked_tags": disliked_tags, "buffered": True}
+    if not changed:
+        return {"message": "Disliked", "disliked_tags": disliked_tags, "unchanged": True}
+    _schedule_prefetch_update(session_id)
+    return {"message": "Disliked", "disliked_tags": disliked_tags}
+
+def serve_feed(session_id: str, cursor: str = None, tags: list[str] = None, mode: str = "any"):
+    """generate_feed, or a degraded page from the local fallback list while
+    Redis is unavailable."""
+    if redis_breaker.is_open():
+        return fallback.degraded_feed(session_id, tags, mode)
+    try:
+        return generate_feed(session_id, cursor, tags, mode)
+    except UNAVAILABLE_ERRORS:
+        return fallback.degraded_feed(session_id, tags, mode)
 
 
 async def _broadcast_prefetch_update(session_id: str):
     """Background task to calculate and broadcast prefetch updates"""
-    try:
-        prefetched = get_prefetched_batch(session_id, 10)
+    with metrics.prefetch_broadcast_duration.time():
+        prefetched = await executor.offload(get_prefetched_batch, session_id, FEED_PREFETCH_SIZE)
         await broadcast_to_session(session_id, {
             "type": "prefetch_update",
             "prefetched": prefetched
         })
-    except Exception as e:
-        print(f"Error broadcasting prefetch update: {e}")
     
\ No newline at end of file
@@ -0,0 +1,112 @@
+from services import metrics
+from config import HOT_KEY_SHARDING, HOT_KEY_SHARDS, HOT_KEY_RATE, HOT_KEY_HOLD_SECONDS, HOT_KEY_ROLLUP_SECONDS
+from collections import Counter
+import asyncio
+import random
+import threading
+import time
+
+# Hot-key detection for engagement counters. Each worker counts interactions
+# per image over one-second windows; an image liked or disliked more than
+# HOT_KEY_RATE times a second is hot for HOT_KEY_HOLD_SECONDS. While hot, its
+# likes/dislikes and trending weight go to one of HOT_KEY_SHARDS shard hashes
+# instead of the single image:{id} hash and the {feed} slot (feed:global,
+# feed:trending and the ranking version), and a periodic rollup folds the
+# shards back in with one write per batch. Images with unrolled shard counts are "dirty" in the worker
+# that wrote them, and that worker adds the shards on read.
+
+_window_start = 0.0
+_counts = Counter()
+_hot_until = {}
+_dirty = set()
+_lock = threading.Lock()
+
+sharded_increments = metrics.Counter(
+    "feedstream_sharded_increments_total",
+    "Likes/dislikes written to a hot image's shard keys",
+)
+hot_images = metrics.Gauge(
+    "feedstream_hot_images",
+    "Images currently detected as hot in this worker",
+)
+hot_images.set_function(lambda: sum(1 for until in list(_hot_until.values()) if until > time.monotonic()))
+
+
+def shard_key(image_id: str, shard: int):
+    return f"image:{image_id}:shard:{shard}"
+
+
+def random_shard_key(image_id: str):
+    return shard_key(image_id, random.randrange(HOT_KEY_SHARDS))
+
+
+def observe(image_id: str):
+    """Count an interaction on image_id. Returns True if it should go to a
+    shard key."""
+    global _window_start
+    if not HOT_KEY_SHARDING:
+        return False
+    now = time.monotonic()
+    with _lock:
+        if now - _window_start >= 1.0:
+            _window_start = now
+            _counts.clear()
+            for expired in [key for key, until in _hot_until.items() if until <= now]:
+                del _hot_until[expired]
+        _counts[image_id] += 1
+        if _counts[image_id] > HOT_KEY_RATE:
+            _hot_until[image_id] = now + HOT_KEY_HOLD_SECONDS
+        return _hot_until.get(image_id, 0) > now
+
+
+def is_hot(image_id: str):
+    """Like observe, without counting an interaction."""
+    if not HOT_KEY_SHARDING:
+        return False
+    with _lock:
+        return _hot_until.get(image_id, 0) > time.monotonic()
+
+
+def mark_dirty(image_id: str):
+    with _lock:
+        _dirty.add(image_id)
+    sharded_increments.inc()
+
+
+def dirty(image_ids):
+    with _lock:
+        return [image_id for image_id in image_ids if image_id in _dirty]
+
+
+def take_dirty():
+    global _dirty
+    with _lock:
+        taken, _dirty = _dirty, set()
+    return taken
+
+
+def restore_dirty(image_ids):
+    with _lock:
+        _dirty.update(image_ids)
+
+
+def reset_hot_keys():
+    global _window_start
+    with _lock:
+        _window_start = 0.0
+        _counts.clear()
+        _hot_until.clear()
+        _dirty.clear()
+
+
+async def run_rollup(rollup):
+    while True:
+        await asyncio.sleep(HOT_KEY_ROLLUP_SECONDS)
+        if not _dirty:
+            continue
+        try:
+            await asyncio.to_thread(rollup)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error rolling up sharded engagement counters: {e}")
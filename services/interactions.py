@@ -0,0 +1,113 @@
+from fastapi import HTTPException
+from services.redis import get_redis
+from services.keys import session_key
+from services.catalog import get_image_indexes
+from services.tags import lookup_tag_ids
+from services import session_store
+from config import SESSION_TTL_SECONDS
+import json
+
+# Per-session interaction ledger: catalog image index -> the session's like
+# or dislike of the image and the tag-score deltas it applied. Recording an
+# interaction swaps the entry and moves the session's tag scores in one
+# atomic step: a WATCH/MULTI over the session's ledger hash and tag scores
+# (one slot in cluster mode), or one version CAS on a packed record. So
+# concurrent retries and double taps see each other and only the first one
+# changes anything, and switching subtracts exactly what the earlier
+# interaction added.
+
+
+class PendingCounts(Exception):
+    """The ledger swap from `previous` committed, but Redis failed at count
+    step `step`; that step and the ones after it were not written."""
+
+    def __init__(self, previous, step):
+        super().__init__(f"interaction counts pending from {step} (previous: {previous})")
+        self.previous = previous
+        self.step = step
+
+
+def _ledger_key(session_id: str):
+    return session_key(session_id, "interactions")
+
+
+def tag_deltas(kind: str, tags: list, score_of):
+    """Tag-score deltas for an interaction: +1 per tag for a like. A dislike
+    takes 0.5 off tags the session likes (score > 0), 1 off tags it dislikes
+    and leaves neutral tags alone."""
+    if kind == "like":
+        return {tag: 1.0 for tag in tags}
+    deltas = {}
+    for tag in tags:
+        score = score_of(tag)
+        if score > 0:
+            deltas[tag] = -0.5
+        elif score < 0:
+            deltas[tag] = -1.0
+    return deltas
+
+
+def _transition(kind: str, tags: list, previous_deltas: dict, score_of):
+    """(deltas to record for kind, net change to the tag scores), undoing
+    previous_deltas first."""
+    undo = {tag: -delta for tag, delta in previous_deltas.items()}
+    applied = tag_deltas(kind, tags, lambda tag: score_of(tag) + undo.get(tag, 0.0))
+    net = dict(undo)
+    for tag, delta in applied.items():
+        net[tag] = net.get(tag, 0.0) + delta
+    return applied, {tag: delta for tag, delta in net.items() if delta}
+
+
+def swap_interaction(session_id: str, image_id: str, kind: str, image_tags: list[str], ttl_seconds: int = SESSION_TTL_SECONDS):
+    """Record kind ("like"/"dislike") as the session's interaction with the
+    image and apply its tag-score deltas. Returns the previous kind, or None
+    if there was none; nothing changes when it equals kind."""
+    if session_store.get_session_store() == "packed":
+        return _swap_packed(session_id, image_id, kind, image_tags)
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    field = get_image_indexes([image_id])[image_id]
+    ledger, scores_key = _ledger_key(session_id), session_key(session_id, "tag_scores")
+
+    def swap(pipe):
+        entry = pipe.hget(ledger, field)
+        previous, previous_deltas = (None, {}) if entry is None else json.loads(entry)
+        if previous == kind:
+            return previous
+        # Only dislike deltas depend on the current scores.
+        scores = dict(zip(image_tags, pipe.hmget(scores_key, image_tags))) if kind == "dislike" and image_tags else {}
+        applied, net = _transition(kind, image_tags, previous_deltas, lambda tag: float(scores.get(tag) or 0))
+        pipe.multi()
+        for tag, delta in net.items():
+            pipe.hincrbyfloat(scores_key, tag, delta)
+        pipe.expire(scores_key, ttl_seconds)
+        pipe.hset(ledger, field, json.dumps([kind, applied], separators=(",", ":")))
+        pipe.expire(ledger, ttl_seconds)
+        return previous
+
+    return redis.transaction(swap, ledger, scores_key, value_from_callable=True)
+
+
+def _swap_packed(session_id: str, image_id: str, kind: str, image_tags: list[str]):
+    index = get_image_indexes([image_id])[image_id]
+    tag_ids = lookup_tag_ids(image_tags)
+    ids = [tag_ids[tag] for tag in image_tags if tag in tag_ids]
+
+    def swap(state):
+        previous = state.interaction(index)
+        if previous == kind:
+            return previous
+        previous_deltas = state.interaction_deltas(index)
+        if previous_deltas is None:
+            # Recorded before format 3: a like's deltas are known, a dislike's aren't.
+            previous_deltas = {tag_id: 1.0 for tag_id in ids} if previous == "like" else {}
+        applied, net = _transition(kind, ids, previous_deltas, state.tag_score)
+        for tag_id, delta in net.items():
+            state.add_tag_score(tag_id, delta)
+        if net:
+            state.updates += 1
+        state.set_interaction(index, kind, applied)
+        return previous
+
+    return session_store.update_state(session_id, swap, write_if=lambda previous: previous != kind)
@@ -0,0 +1,81 @@
+from config import REDIS_CLUSTER
+
+# Key layout. Standalone Redis keeps the historical key names. With
+# REDIS_CLUSTER=1, keys that are used together carry a hash tag so they map
+# to one slot: a session's keys share `{session_id}`, and the global ranking
+# keys (feed:global, trending scores, tag sets and the ranking scratch keys
+# that ZUNIONSTORE / ZINTERSTORE combine) share `{feed}`. Per-image hashes
+# need no tag and spread across the cluster.
+
+RANKING_HASH_TAG = "{feed}"
+
+# Keys in the ranking group, by exact name or by prefix.
+RANKING_KEYS = ("feed:global", "feed:global:version", "feed:trending", "feed:trending:origin", "ranking:trending", "tags:all")
+RANKING_PREFIXES = ("tag:", "ranking:tag:")
+
+
+def _tagged(value: str):
+    return f"{{{value}}}" if REDIS_CLUSTER else value
+
+
+def session_key(session_id: str, kind: str):
+    return f"session:{_tagged(session_id)}:{kind}"
+
+
+def ranking_key(name: str):
+    return f"{RANKING_HASH_TAG}:{name}" if REDIS_CLUSTER else name
+
+
+def tag_key(tag: str):
+    return ranking_key(f"tag:{tag}")
+
+
+def cursor_key(token: str, kind: str = None):
+    key = f"feed:cursor:{_tagged(token)}"
+    return f"{key}:{kind}" if kind else key
+
+
+def cluster_key(key: str):
+    """Cluster-layout name for a key written with the standalone layout."""
+    if key in RANKING_KEYS or key.startswith(RANKING_PREFIXES):
+        return f"{RANKING_HASH_TAG}:{key}"
+    parts = key.split(":")
+    if parts[0] == "session" and len(parts) == 3:
+        return f"session:{{{parts[1]}}}:{parts[2]}"
+    if key.startswith("feed:cursor:") and len(parts) in (3, 4):
+        return ":".join(["feed", "cursor", f"{{{parts[2]}}}"] + parts[3:])
+    return key
+
+
+def copy_to_cluster_layout(source, target, batch_size: int = 500):
+    """Copy every key of a standalone `source` into `target` under its
+    cluster-layout name, keeping TTLs. Both clients must use
+    decode_responses=False. Returns the number of keys copied."""
+    copied = 0
+    batch = []
+    for key in source.scan_iter(count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            copied += _copy_batch(source, target, batch)
+            batch = []
+    if batch:
+        copied += _copy_batch(source, target, batch)
+    return copied
+
+
+def _copy_batch(source, target, keys: list):
+    pipe = source.pipeline(transaction=False)
+    for key in keys:
+        pipe.dump(key)
+        pipe.pttl(key)
+    results = pipe.execute()
+
+    copied = 0
+    pipe = target.pipeline(transaction=False)
+    for key, dumped, ttl in zip(keys, results[::2], results[1::2]):
+        if dumped is None or ttl == -2:
+            continue  # expired while we were copying
+        pipe.restore(cluster_key(key.decode()), max(ttl, 0), dumped, replace=True)
+        copied += 1
+    pipe.execute()
+    return copied
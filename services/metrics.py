@@ -0,0 +1,209 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process collectors rendered in the Prometheus text exposition format.
+# Everything here is plain memory bookkeeping so recording a sample never
+# touches Redis or blocks on I/O.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000, 100000)
+
+_registry = []
+
+
+def _label_key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def collect(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._function = None
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """Compute the value lazily at scrape time instead of on every change."""
+        self._function = function
+
+    def value(self, **labels):
+        if self._function is not None and not labels:
+            return self._function()
+        return self._values.get(_label_key(labels), 0)
+
+    def collect(self):
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return series[2] if series else 0
+
+    def collect(self):
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._series.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+def record_cache(cache: str, hit: bool):
+    if hit:
+        cache_hits.inc(cache=cache)
+    else:
+        cache_misses.inc(cache=cache)
+
+
+request_latency = Histogram(
+    "feedstream_request_duration_seconds",
+    "HTTP request latency by route",
+)
+candidate_set_size = Histogram(
+    "feedstream_ranking_candidates",
+    "Number of unseen candidates scored per ranking pass",
+    buckets=SIZE_BUCKETS,
+)
+ranking_duration = Histogram(
+    "feedstream_ranking_duration_seconds",
+    "Time spent scoring and sorting candidates",
+)
+cache_hits = Counter(
+    "feedstream_cache_hits_total",
+    "In-process cache hits by cache name",
+)
+cache_misses = Counter(
+    "feedstream_cache_misses_total",
+    "In-process cache misses by cache name",
+)
+sse_active_connections = Gauge(
+    "feedstream_sse_active_connections",
+    "Open SSE streams across all sessions",
+)
+sse_queue_depth = Gauge(
+    "feedstream_sse_queue_depth",
+    "Messages waiting in SSE queues across all streams",
+)
+sse_dropped_messages = Counter(
+    "feedstream_sse_dropped_messages_total",
+    "SSE messages dropped because a client queue was full or closed",
+)
+prefetch_broadcast_duration = Histogram(
+    "feedstream_prefetch_broadcast_duration_seconds",
+    "Time to recompute and broadcast a prefetch update",
+)
+repeated_interactions = Counter(
+    "feedstream_repeated_interactions_total",
+    "Likes/dislikes that repeated the session's last interaction with the image",
+)
@@ -0,0 +1,110 @@
+import cProfile
+import contextvars
+import functools
+import hmac
+import inspect
+import os
+import random
+import threading
+import time
+import uuid
+from config import PROFILE_SAMPLE_RATE, PROFILE_DIR, PROFILE_MAX_FILES, ADMIN_TOKEN
+from services import metrics
+
+# Opt-in cProfile capture for the ranking hot path. A request carrying the
+# admin token asks for a profile with the X-Profile header; otherwise calls
+# are sampled at PROFILE_SAMPLE_RATE. Only one profiler can be active per
+# process, so nested or concurrent profiled calls simply run unprofiled.
+# Only synchronous functions are profiled: around an await, cProfile would
+# also record whatever else the event loop ran meanwhile.
+
+PROFILE_HEADER = "x-profile"
+ADMIN_TOKEN_HEADER = "x-admin-token"
+
+profile_requested = contextvars.ContextVar("profile_requested", default=False)
+_active = threading.Lock()
+
+profiles_captured = metrics.Counter(
+    "feedstream_profiles_captured_total",
+    "cProfile captures written to the profile directory",
+)
+
+
+def admin_enabled():
+    return bool(ADMIN_TOKEN)
+
+
+def admin_authorized(token: str):
+    """Whether `token` matches ADMIN_TOKEN; always False when it is unset."""
+    return admin_enabled() and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def should_profile():
+    if profile_requested.get():
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _dump(profiler: cProfile.Profile, name: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}.pstats"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+    profiles_captured.inc(function=name)
+    _prune()
+    return filename
+
+
+def _prune():
+    files = list_profiles()
+    for stale in files[PROFILE_MAX_FILES:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, stale["name"]))
+        except OSError:
+            pass
+
+
+def profiled(name: str):
+    """Profile the wrapped synchronous function when the current request
+    opted in."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            raise TypeError(f"profiled({name!r}) wraps a coroutine function; profile its synchronous parts instead")
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not should_profile() or not _active.acquire(blocking=False):
+                return func(*args, **kwargs)
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    _dump(profiler, name)
+            finally:
+                _active.release()
+        return wrapper
+    return decorator
+
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    entries = []
+    for filename in os.listdir(PROFILE_DIR):
+        if not filename.endswith(".pstats"):
+            continue
+        stat = os.stat(os.path.join(PROFILE_DIR, filename))
+        entries.append({"name": filename, "size": stat.st_size, "created": stat.st_mtime})
+    entries.sort(key=lambda entry: entry["created"], reverse=True)
+    return entries
+
+
+def get_profile_path(name: str):
+    if os.path.basename(name) != name or not name.endswith(".pstats"):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    if not os.path.isfile(path):
+        return None
+    return path
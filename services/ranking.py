@@ -0,0 +1,209 @@
+from fastapi import HTTPException
+from services.redis import get_redis
+from services.feed import get_all_tags, get_ranking_mode, trending_decay, renormalize_trending, TRENDING_KEY, TRENDING_ORIGIN_KEY, GLOBAL_KEY, GLOBAL_VERSION_KEY
+from services.keys import ranking_key, tag_key
+from services import metrics
+from config import RANKING_TOP_N, RANKING_TAG_TOP_N, RANKING_REFRESH_SECONDS
+import asyncio
+import json
+import time
+import uuid
+
+# Materialized global ranking. A background task periodically snapshots the
+# top of `feed:global` and the top of every tag (by global score) into
+# process memory and into Redis under an increasing epoch number, so request
+# paths only merge session-specific boosts on top of a ready-made ordering.
+
+SNAPSHOT_KEY = "ranking:snapshot"
+EPOCH_KEY = "ranking:epoch"
+LOCK_KEY = "ranking:lock"
+VERSION_KEY = GLOBAL_VERSION_KEY
+TRENDING_SCRATCH_KEY = ranking_key("ranking:trending")
+# Also bounds how long the ZUNIONSTORE/ZINTERSTORE scratch sets outlive a pass.
+LOCK_TTL_SECONDS = max(1, int(RANKING_REFRESH_SECONDS * 2))
+
+# Delete the lock only if it still holds our token: if a slow pass outlived
+# the TTL, another worker may hold it by now.
+RELEASE_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+_snapshot = None
+_listeners = []
+
+snapshot_epoch = metrics.Gauge(
+    "feedstream_ranking_snapshot_epoch",
+    "Epoch of the ranking snapshot held by this worker",
+)
+materialize_duration = metrics.Histogram(
+    "feedstream_ranking_materialize_duration_seconds",
+    "Time to rebuild the global ranking snapshot",
+)
+
+
+class RankingSnapshot:
+    def __init__(self, epoch: int, version: int, global_top: list, tag_top: dict, built_at: float,
+                 mode: str = "alltime", origin: float = None):
+        self.epoch = epoch
+        self.version = version
+        self.global_top = global_top
+        self.tag_top = tag_top
+        self.built_at = built_at
+        self.mode = mode
+        self.origin = origin
+        self.scores = dict(global_top)
+        for entries in tag_top.values():
+            self.scores.update(entries)
+
+    def global_ids(self):
+        return [image_id for image_id, _ in self.global_top]
+
+    def tag_ids(self, tag: str):
+        return [image_id for image_id, _ in self.tag_top.get(tag, [])]
+
+    def global_scores(self, image_ids: list[str]):
+        decay = trending_decay(self.origin) if self.origin is not None else 1.0
+        return {image_id: self.scores.get(image_id, 0.0) * decay for image_id in image_ids}
+
+    def to_json(self):
+        return json.dumps({
+            "epoch": self.epoch,
+            "version": self.version,
+            "global": self.global_top,
+            "tags": self.tag_top,
+            "built_at": self.built_at,
+            "mode": self.mode,
+            "origin": self.origin,
+        })
+
+    @classmethod
+    def from_json(cls, raw: str):
+        data = json.loads(raw)
+        return cls(
+            data["epoch"],
+            data["version"],
+            [tuple(entry) for entry in data["global"]],
+            {tag: [tuple(entry) for entry in entries] for tag, entries in data["tags"].items()},
+            data["built_at"],
+            data.get("mode", "alltime"),
+            data.get("origin"),
+        )
+
+
+def get_snapshot():
+    """Return the local snapshot, or None if missing or too stale to trust."""
+    if _snapshot is None:
+        return None
+    if time.time() - _snapshot.built_at > RANKING_REFRESH_SECONDS * 10:
+        return None
+    return _snapshot
+
+
+def set_snapshot(snapshot):
+    global _snapshot
+    _snapshot = snapshot
+    if snapshot is not None:
+        snapshot_epoch.set(snapshot.epoch)
+
+
+def on_snapshot(fn):
+    """Register fn(snapshot) to run in a thread after each materializer pass."""
+    _listeners.append(fn)
+    return fn
+
+
+def run_listeners(snapshot):
+    # A failing listener must not leave the ones after it on stale data.
+    for listener in _listeners:
+        try:
+            listener(snapshot)
+        except Exception as e:
+            print(f"Snapshot listener {listener.__module__}.{listener.__qualname__} failed: {e}")
+
+
+def materialize_snapshot():
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+
+    start = time.perf_counter()
+    mode = get_ranking_mode()
+    version = int(redis.get(VERSION_KEY) or 0)
+    origin = None
+    source = GLOBAL_KEY
+    if mode == "trending":
+        # Every catalog image, scored by its (origin-scaled) trending score.
+        pipe = redis.pipeline()
+        pipe.get(TRENDING_ORIGIN_KEY)
+        pipe.zunionstore(TRENDING_SCRATCH_KEY, {GLOBAL_KEY: 0, TRENDING_KEY: 1})
+        pipe.expire(TRENDING_SCRATCH_KEY, LOCK_TTL_SECONDS)
+        origin, _, _ = pipe.execute()
+        origin = float(origin) if origin is not None else None
+        source = TRENDING_SCRATCH_KEY
+    global_top = redis.zrevrange(source, 0, RANKING_TOP_N - 1, withscores=True)
+
+    tags = sorted(get_all_tags())
+    pipe = redis.pipeline()
+    for tag in tags:
+        scratch = ranking_key(f"ranking:tag:{tag}")
+        pipe.zinterstore(scratch, {source: 1, tag_key(tag): 0})
+        pipe.expire(scratch, LOCK_TTL_SECONDS)
+        pipe.zrevrange(scratch, 0, RANKING_TAG_TOP_N - 1, withscores=True)
+    results = pipe.execute()
+    tag_top = {tag: [tuple(entry) for entry in results[i * 3 + 2]] for i, tag in enumerate(tags)}
+
+    epoch = redis.incr(EPOCH_KEY)
+    snapshot = RankingSnapshot(
+        epoch, version, [tuple(entry) for entry in global_top], tag_top, time.time(), mode, origin
+    )
+    redis.set(SNAPSHOT_KEY, snapshot.to_json())
+    materialize_duration.observe(time.perf_counter() - start)
+    return snapshot
+
+
+def refresh_snapshot():
+    """Rebuild the snapshot if the global ranking changed, or adopt a newer
+    one built by another worker."""
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+
+    version = int(redis.get(VERSION_KEY) or 0)
+    current = _snapshot
+    if current is not None and current.version == version and current.mode == get_ranking_mode():
+        current.built_at = time.time()
+        return current
+
+    token = uuid.uuid4().hex
+    if redis.set(LOCK_KEY, token, nx=True, ex=LOCK_TTL_SECONDS):
+        try:
+            snapshot = materialize_snapshot()
+        finally:
+            redis.register_script(RELEASE_LOCK_SCRIPT)(keys=[LOCK_KEY], args=[token])
+    else:
+        raw = redis.get(SNAPSHOT_KEY)
+        if raw is None:
+            return current
+        snapshot = RankingSnapshot.from_json(raw)
+        if current is not None and snapshot.epoch <= current.epoch:
+            return current
+        snapshot.built_at = time.time()
+
+    set_snapshot(snapshot)
+    return snapshot
+
+
+async def run_materializer():
+    while True:
+        try:
+            await asyncio.to_thread(renormalize_trending)
+            snapshot = await asyncio.to_thread(refresh_snapshot)
+            await asyncio.to_thread(run_listeners, snapshot)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error materializing ranking snapshot: {e}")
+        await asyncio.sleep(RANKING_REFRESH_SECONDS)
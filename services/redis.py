@@ -1,27 +1,321 @@
-from redis import Redis 
+from redis import Redis, ConnectionPool
+from redis.client import Pipeline
+from redis.cluster import RedisCluster, ClusterPipeline
+from redis.backoff import NoBackoff
+from redis.exceptions import ConnectionError, TimeoutError, MaxConnectionsError
+from redis.retry import Retry
+from services.breaker import CircuitBreaker
+from services import metrics
+from collections import deque
+import asyncio
+import itertools
 import os
-from config import REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD
+import threading
+import time
+from config import (
+    REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD, REDIS_CLUSTER, REDIS_BACKEND,
+    REDIS_SOCKET_TIMEOUT, REDIS_CONNECT_TIMEOUT, REDIS_RETRIES, REDIS_MAX_CONNECTIONS,
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS,
+    REDIS_REPLICAS, REDIS_REPLICA_MAX_LAG_SECONDS, REDIS_REPLICA_CHECK_SECONDS,
+)
 
+# One shared client (and connection pool) per decode mode. Every command and
+# pipeline goes through the circuit breaker: connection errors and timeouts
+# count as failures, and while the breaker is open commands fail fast with
+# RedisUnavailable instead of waiting on a dead server.
 
-def get_redis():
+redis_breaker = CircuitBreaker("redis", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+
+_clients = {}
+_clients_lock = threading.Lock()
+_memory_server = None
+
+
+class RedisUnavailable(ConnectionError):
+    """Raised without touching the network while the breaker is open."""
+
+
+# What callers catch to fall back to local state.
+UNAVAILABLE_ERRORS = (ConnectionError, TimeoutError)
+
+
+def _guarded(breaker, call, *args, **kwargs):
+    if not breaker.allow():
+        raise RedisUnavailable(f"{breaker.name} circuit breaker is open")
     try:
-        redis_kwargs = {
-            'host': REDIS_HOST,
-            'port': REDIS_PORT,
-            'db': REDIS_DB,
-            'decode_responses': True,
-            'encoding': 'utf-8'
-        }
-        if REDIS_PASSWORD:
-            redis_kwargs['password'] = REDIS_PASSWORD
-        
-        if 'upstash' in REDIS_HOST.lower():
-            redis_kwargs['ssl'] = True
-        
-        return Redis(**redis_kwargs)
+        result = call(*args, **kwargs)
+    except MaxConnectionsError:
+        # Local pool exhaustion says nothing about the server.
+        breaker.record_unknown()
+        raise
+    except (ConnectionError, TimeoutError):
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # The server answered (WatchError, ResponseError, ...).
+        breaker.record_success()
+        raise
+    breaker.record_success()
+    return result
+
+
+class BreakerPipeline(Pipeline):
+    def __init__(self, breaker, *args):
+        super().__init__(*args)
+        self.breaker = breaker
+
+    def immediate_execute_command(self, *args, **options):
+        return _guarded(self.breaker, super().immediate_execute_command, *args, **options)
+
+    def execute(self, raise_on_error: bool = True):
+        if not self.command_stack:
+            return super().execute(raise_on_error)
+        return _guarded(self.breaker, super().execute, raise_on_error)
+
+
+class BreakerRedis(Redis):
+    def __init__(self, *args, breaker: CircuitBreaker = None, **kwargs):
+        self.breaker = breaker if breaker is not None else redis_breaker
+        super().__init__(*args, **kwargs)
+
+    def execute_command(self, *args, **options):
+        return _guarded(self.breaker, super().execute_command, *args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return BreakerPipeline(
+            self.breaker, self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+class BreakerClusterPipeline(ClusterPipeline):
+    def execute(self, raise_on_error: bool = True):
+        return _guarded(self.breaker, super().execute, raise_on_error)
+
+
+class BreakerRedisCluster(RedisCluster):
+    """Cluster client (REDIS_CLUSTER=1) behind the same breaker."""
+
+    def __init__(self, *args, breaker: CircuitBreaker = None, **kwargs):
+        self.breaker = breaker if breaker is not None else redis_breaker
+        super().__init__(*args, **kwargs)
+
+    def execute_command(self, *args, **kwargs):
+        return _guarded(self.breaker, super().execute_command, *args, **kwargs)
+
+    def pipeline(self, transaction=None, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        # RedisCluster builds the pipeline from private state; adopt it
+        # rather than duplicate that constructor call.
+        pipe.__class__ = BreakerClusterPipeline
+        pipe.breaker = self.breaker
+        return pipe
+
+
+def _client_kwargs(host: str, port: int, decode_responses: bool):
+    redis_kwargs = {
+        'host': host,
+        'port': port,
+        'db': REDIS_DB,
+        'decode_responses': decode_responses,
+        'encoding': 'utf-8',
+        'socket_timeout': REDIS_SOCKET_TIMEOUT,
+        'socket_connect_timeout': REDIS_CONNECT_TIMEOUT,
+        'retry': Retry(NoBackoff(), REDIS_RETRIES),
+        'max_connections': REDIS_MAX_CONNECTIONS,
+    }
+    if REDIS_PASSWORD:
+        redis_kwargs['password'] = REDIS_PASSWORD
+
+    if 'upstash' in host.lower():
+        redis_kwargs['ssl'] = True
+    return redis_kwargs
+
+
+def _memory_client(decode_responses: bool):
+    """In-process stand-in for Redis (REDIS_BACKEND=memory), for traffic
+    replay and local benchmarks. Both decode modes share one dataset."""
+    global _memory_server
+    # Imported here so workers talking to a real Redis never load it.
+    import fakeredis
+    if _memory_server is None:
+        _memory_server = fakeredis.FakeServer()
+    pool = ConnectionPool(
+        connection_class=fakeredis.FakeConnection,
+        server=_memory_server,
+        decode_responses=decode_responses,
+    )
+    return BreakerRedis(connection_pool=pool)
+
+
+def get_redis(decode_responses: bool = True):
+    client = _clients.get(decode_responses)
+    if client is not None:
+        return client
+    try:
+        with _clients_lock:
+            client = _clients.get(decode_responses)
+            if client is None and REDIS_BACKEND == "memory":
+                client = _clients[decode_responses] = _memory_client(decode_responses)
+            elif client is None:
+                redis_kwargs = _client_kwargs(REDIS_HOST, REDIS_PORT, decode_responses)
+                if REDIS_CLUSTER:
+                    # Cluster nodes only have DB 0.
+                    redis_kwargs.pop('db')
+                    client = BreakerRedisCluster(**redis_kwargs)
+                else:
+                    client = BreakerRedis(**redis_kwargs)
+                _clients[decode_responses] = client
+        return client
     except Exception as e:
         print(f"Error connecting to Redis: {e}")
         return None
 
 
+def warm_connections(count: int):
+    """Open `count` pooled connections to the primary ahead of traffic, so
+    the first requests don't pay for TCP/TLS setup and AUTH."""
+    for decode_responses in (True, False):
+        client = get_redis(decode_responses)
+        if client is None:
+            raise ConnectionError("Redis connection failed")
+        if REDIS_CLUSTER:
+            # Node pools are created per node as slots are routed.
+            client.ping()
+            continue
+        pool = client.connection_pool
+        connections = []
+        try:
+            for _ in range(count):
+                connections.append(_guarded(client.breaker, pool.get_connection))
+        finally:
+            for connection in connections:
+                pool.release(connection)
+
+
+# Read replicas (REDIS_REPLICAS=host:port,...). Catalog and global-ranking
+# reads go round-robin to replicas whose replication link is up and that are
+# at most REDIS_REPLICA_MAX_LAG_SECONDS behind; session state and all writes
+# stay on the primary. A background task samples the primary's replication
+# offset and checks each replica's, so a replica's lag is how long ago the
+# primary was at the offset the replica has reached. A replica that errors is
+# skipped until its own breaker lets a trial through, and with no usable
+# replica reads fall back to the primary.
+
+class Replica:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.name = f"{host}:{port}"
+        self.breaker = CircuitBreaker(f"replica:{self.name}", 1, BREAKER_RESET_SECONDS)
+        self.healthy = False
+        self.lag = None
+        self._clients = {}
+
+    def client(self, decode_responses: bool = True):
+        client = self._clients.get(decode_responses)
+        if client is None:
+            client = self._clients.setdefault(decode_responses, BreakerRedis(
+                **_client_kwargs(self.host, self.port, decode_responses), breaker=self.breaker
+            ))
+        return client
+
+
+_replicas = None
+_replica_turn = itertools.count()
+# (monotonic time, primary master_repl_offset), oldest first
+_primary_offsets = deque()
+_offsets_lock = threading.Lock()
+
+replica_reads = metrics.Counter(
+    "feedstream_replica_reads_total",
+    "Read clients handed out, by target (replica name or primary)",
+)
+replica_healthy = metrics.Gauge(
+    "feedstream_replica_healthy",
+    "1 if the replica is within the lag tolerance and serving reads",
+)
+
+
+def get_replicas():
+    global _replicas
+    if _replicas is None:
+        replicas = []
+        for entry in filter(None, (part.strip() for part in REDIS_REPLICAS.split(","))):
+            host, _, port = entry.rpartition(":")
+            replicas.append(Replica(host or entry, int(port) if host else REDIS_PORT))
+        _replicas = replicas
+    return _replicas
+
+
+def reset_replicas():
+    global _replicas
+    _replicas = None
+    with _offsets_lock:
+        _primary_offsets.clear()
+
+
+def replication_lag(offset: int):
+    """Seconds a replica that has applied the stream up to offset is behind
+    the primary, at the resolution of the samples taken so far; inf if it is
+    behind every sample still kept."""
+    now = time.monotonic()
+    current = int(get_redis().info("replication")["master_repl_offset"])
+    with _offsets_lock:
+        _primary_offsets.append((now, current))
+        horizon = now - REDIS_REPLICA_MAX_LAG_SECONDS - REDIS_REPLICA_CHECK_SECONDS
+        while len(_primary_offsets) > 1 and _primary_offsets[0][0] < horizon:
+            _primary_offsets.popleft()
+        if offset >= current:
+            return 0.0
+        reached = [sampled_at for sampled_at, primary_offset in _primary_offsets if primary_offset <= offset]
+    return now - max(reached) if reached else float("inf")
+
+
+def check_replica(replica: Replica):
+    """A replica serves reads if its link to the primary is up and it is at
+    most REDIS_REPLICA_MAX_LAG_SECONDS behind."""
+    try:
+        info = replica.client().info("replication")
+        if info.get("role") != "slave" or info.get("master_link_status") != "up":
+            return False
+        # Sampled after the replica, so the primary's offset is the newer one.
+        replica.lag = replication_lag(int(info.get("slave_repl_offset", -1)))
+    except Exception:
+        return False
+    return replica.lag <= REDIS_REPLICA_MAX_LAG_SECONDS
+
+
+def refresh_replica_health():
+    for replica in get_replicas():
+        replica.healthy = check_replica(replica)
+        replica_healthy.set(1 if replica.healthy else 0, replica=replica.name)
+
+
+async def run_replica_monitor():
+    """Recheck replicas every REDIS_REPLICA_CHECK_SECONDS, off the request
+    path. Until the first check, reads stay on the primary."""
+    if not get_replicas() or REDIS_CLUSTER:
+        return
+    while True:
+        try:
+            await asyncio.to_thread(refresh_replica_health)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error checking read replicas: {e}")
+        await asyncio.sleep(REDIS_REPLICA_CHECK_SECONDS)
+
 
+def get_read_redis(decode_responses: bool = True):
+    """Client for catalog / global-ranking reads that tolerate replication lag."""
+    replicas = get_replicas()
+    if not replicas or REDIS_CLUSTER:
+        # A cluster routes by slot; its replicas are not addressed directly.
+        return get_redis(decode_responses)
+    usable = [r for r in replicas if r.healthy and not r.breaker.is_open()]
+    if not usable:
+        replica_reads.inc(target="primary")
+        return get_redis(decode_responses)
+    replica = usable[next(_replica_turn) % len(usable)]
+    replica_reads.inc(target=replica.name)
+    return replica.client(decode_responses)
@@ -0,0 +1,179 @@
+from fastapi import HTTPException
+from redis.exceptions import WatchError
+from services.redis import get_redis
+from services.keys import session_key
+from config import SEEN_TRACKER, SEEN_FILTER_THRESHOLD, SEEN_FILTER_CAPACITY, SEEN_FILTER_FP_RATE
+import hashlib
+import math
+
+# Seen tracking for long sessions (SEEN_TRACKER=bloom). A session's seen
+# images start in the `seen_images` set; once it would grow past
+# SEEN_FILTER_THRESHOLD members they move into a Bloom filter stored as a
+# Redis string (`seen_filter`), sized for SEEN_FILTER_CAPACITY images at
+# SEEN_FILTER_FP_RATE. Writes are SETBITs, reads fetch the string once and
+# test membership locally, so the cost per request stays constant however far
+# the session scrolls. A false positive only hides an unseen image.
+#
+# Each filter's (bits, hashes) are stored next to it (`seen_filter_params`,
+# "bits:hashes") when it is created and read back from there, so changing
+# the capacity or rate config only affects filters created afterwards.
+
+
+def filter_params(capacity: int = None, fp_rate: float = None):
+    """(bits, hashes) for a Bloom filter holding `capacity` items at the
+    given false-positive rate."""
+    capacity = capacity or SEEN_FILTER_CAPACITY
+    fp_rate = fp_rate or SEEN_FILTER_FP_RATE
+    bits = math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)
+    return bits, max(1, round(bits / capacity * math.log(2)))
+
+
+def get_seen_tracker():
+    return SEEN_TRACKER
+
+
+def _pack_params(bits: int, hashes: int):
+    return f"{bits}:{hashes}"
+
+
+def _unpack_params(value):
+    """(bits, hashes) stored with a filter; current config for filters
+    written before the params were stored."""
+    if value is None:
+        return filter_params()
+    bits, hashes = value.split(b":")
+    return int(bits), int(hashes)
+
+
+def _positions(image_id: str, bits: int, hashes: int):
+    digest = hashlib.blake2b(image_id.encode(), digest_size=16).digest()
+    h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+class BloomFilter:
+    def __init__(self, data: bytes = b"", bits: int = None, hashes: int = None):
+        default_bits, default_hashes = filter_params()
+        self.bits = bits or default_bits
+        self.hashes = hashes or default_hashes
+        self.data = data
+
+    def __contains__(self, image_id: str):
+        data = self.data
+        for position in _positions(image_id, self.bits, self.hashes):
+            byte = position >> 3
+            # SETBIT numbers bits from the most significant bit of byte 0.
+            if byte >= len(data) or not data[byte] & (0x80 >> (position & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        """Estimated number of items, from the fraction of bits set."""
+        ones = int.from_bytes(self.data, "big").bit_count()
+        if ones >= self.bits:
+            return SEEN_FILTER_CAPACITY
+        return round(-self.bits / self.hashes * math.log(1 - ones / self.bits))
+
+
+class SeenImages:
+    """Set-like view of a session's seen images: the pre-filter set plus the
+    Bloom filter. Supports `in`, len() and truthiness, not iteration."""
+
+    def __init__(self, members: set, bloom: BloomFilter):
+        self.members = members
+        self.bloom = bloom
+
+    def __contains__(self, image_id: str):
+        return image_id in self.members or image_id in self.bloom
+
+    def __len__(self):
+        return len(self.members) + len(self.bloom)
+
+    def __bool__(self):
+        return bool(self.members) or bool(self.bloom.data.strip(b"\0"))
+
+
+def _binary_redis():
+    redis = get_redis(decode_responses=False)
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    return redis
+
+
+def get_seen(session_id: str):
+    """The session's seen images: a set until the filter exists, then a
+    SeenImages view."""
+    redis = _binary_redis()
+    pipe = redis.pipeline(transaction=False)
+    pipe.smembers(session_key(session_id, "seen_images"))
+    pipe.get(session_key(session_id, "seen_filter"))
+    pipe.get(session_key(session_id, "seen_filter_params"))
+    members, data, params = pipe.execute()
+    members = {member.decode() for member in members}
+    if data is None:
+        return members
+    return SeenImages(members, BloomFilter(data, *_unpack_params(params)))
+
+
+def is_seen(session_id: str, image_id: str):
+    redis = _binary_redis()
+    filter_key = session_key(session_id, "seen_filter")
+    pipe = redis.pipeline(transaction=False)
+    pipe.sismember(session_key(session_id, "seen_images"), image_id)
+    pipe.exists(filter_key)
+    pipe.get(session_key(session_id, "seen_filter_params"))
+    member, has_filter, params = pipe.execute()
+    if member or not has_filter:
+        return bool(member)
+
+    pipe = redis.pipeline(transaction=False)
+    for position in _positions(image_id, *_unpack_params(params)):
+        pipe.getbit(filter_key, position)
+    return all(pipe.execute())
+
+
+def _set_bits(pipe, filter_key: str, image_ids: list[str], bits: int, hashes: int):
+    for image_id in image_ids:
+        for position in _positions(image_id, bits, hashes):
+            pipe.setbit(filter_key, position, 1)
+
+
+def _count_new(previous_bits: list[int], hashes: int):
+    """Items whose bits were not all set before, i.e. newly added."""
+    return sum(
+        1 for start in range(0, len(previous_bits), hashes)
+        if not all(previous_bits[start:start + hashes])
+    )
+
+
+def mark_seen(session_id: str, image_ids: list[str], ttl_seconds: int):
+    """Record image_ids as seen, moving the set into the filter once it would
+    pass SEEN_FILTER_THRESHOLD. Returns the number of newly seen images."""
+    redis = _binary_redis()
+    set_key = session_key(session_id, "seen_images")
+    filter_key = session_key(session_id, "seen_filter")
+    params_key = session_key(session_id, "seen_filter_params")
+
+    with redis.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                pipe.watch(set_key, filter_key, params_key)
+                has_filter = pipe.exists(filter_key)
+                if not has_filter and pipe.scard(set_key) + len(image_ids) <= SEEN_FILTER_THRESHOLD:
+                    pipe.multi()
+                    pipe.sadd(set_key, *image_ids)
+                    pipe.expire(set_key, ttl_seconds)
+                    added, _ = pipe.execute()
+                    return added
+
+                members = [member.decode() for member in pipe.smembers(set_key)]
+                bits, hashes = _unpack_params(pipe.get(params_key)) if has_filter else filter_params()
+                pipe.multi()
+                _set_bits(pipe, filter_key, members + list(image_ids), bits, hashes)
+                pipe.set(params_key, _pack_params(bits, hashes), ex=ttl_seconds)
+                pipe.expire(filter_key, ttl_seconds)
+                pipe.delete(set_key)
+                results = pipe.execute()
+                return _count_new(results[len(members) * hashes:len(results) - 3], hashes)
+            except WatchError:
+                continue
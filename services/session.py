@@ -2,7 +2,7 @@ from fastapi import HTTPException
 from services.redis import get_redis
 import uuid
 import json
-from services.feed import update_tag_scores, ensure_session
+from services.feed import update_tag_scores_batch, ensure_session
 
 def create_session(preferred_tags: list[str]):
     session_id = str(uuid.uuid4())
@@ -14,7 +14,6 @@ def create_session(preferred_tags: list[str]):
     if redis is None:
         raise HTTPException(status_code=503, detail="Redis connection failed")
     
-    for tag in preferred_tags:
-        update_tag_scores(session_id, tag, 3)
+    update_tag_scores_batch(session_id, {tag: 3 for tag in preferred_tags})
 
     return session_id
\ No newline at end of file
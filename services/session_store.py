@@ -0,0 +1,311 @@
+from fastapi import HTTPException
+from redis.exceptions import WatchError
+from services.redis import get_redis
+from services.catalog import get_image_indexes, get_image_ids
+from services.tags import lookup_tag_ids, get_tag_names
+from services import metrics
+from services.keys import session_key
+from config import SESSION_STORE, SESSION_TTL_SECONDS, SESSION_CACHE_SIZE
+from array import array
+from collections import OrderedDict
+import struct
+import threading
+
+# Packed session representation (SESSION_STORE=packed). A session is a single
+# binary string holding its tag scores (float32 indexed by tag id), a bitmap
+# of seen catalog indexes, liked/disliked bitmaps and the tag-score deltas
+# each interaction applied (the interaction ledger), and a few counters. Each worker keeps an LRU cache
+# of recently used sessions: writes go through to Redis guarded by a version
+# compare-and-set, and a read fetches only the record header and reuses the
+# cached record when its version still matches.
+
+FORMAT_VERSION = 3
+# format, version, seen_count, tag score updates, tag_count, bitmap_len
+HEADER = struct.Struct("<BIIIII")
+# Format 2 appends liked_len, disliked_len and the two ledger bitmaps.
+LEDGER_HEADER = struct.Struct("<II")
+# Format 3 appends a count of (image index, tag id, delta) ledger entries.
+DELTA_COUNT = struct.Struct("<I")
+DELTA_ENTRY = struct.Struct("<IIf")
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_session_store():
+    return SESSION_STORE
+
+
+def state_key(session_id: str):
+    return session_key(session_id, "state")
+
+
+def _has_bit(bitmap: bytearray, index: int):
+    byte = index >> 3
+    return byte < len(bitmap) and bool(bitmap[byte] & (1 << (index & 7)))
+
+
+def _set_bit(bitmap: bytearray, index: int):
+    byte = index >> 3
+    if byte >= len(bitmap):
+        bitmap.extend(bytes(byte + 1 - len(bitmap)))
+    bitmap[byte] |= 1 << (index & 7)
+
+
+def _clear_bit(bitmap: bytearray, index: int):
+    byte = index >> 3
+    if byte < len(bitmap):
+        bitmap[byte] &= ~(1 << (index & 7)) & 0xFF
+
+
+class SessionState:
+    __slots__ = ("version", "seen_count", "updates", "tag_scores", "seen", "liked", "disliked", "deltas")
+
+    def __init__(self, version=0, seen_count=0, updates=0, tag_scores=None, seen=None, liked=None, disliked=None, deltas=None):
+        self.version = version
+        self.seen_count = seen_count
+        self.updates = updates
+        self.tag_scores = tag_scores if tag_scores is not None else array("f")
+        self.seen = seen if seen is not None else bytearray()
+        self.liked = liked if liked is not None else bytearray()
+        self.disliked = disliked if disliked is not None else bytearray()
+        # image index -> {tag id: delta} applied by the recorded interaction
+        self.deltas = deltas if deltas is not None else {}
+
+    def copy(self):
+        return SessionState(
+            self.version, self.seen_count, self.updates, array("f", self.tag_scores), bytearray(self.seen),
+            bytearray(self.liked), bytearray(self.disliked),
+            {index: dict(tag_deltas) for index, tag_deltas in self.deltas.items()},
+        )
+
+    def pack(self):
+        header = HEADER.pack(
+            FORMAT_VERSION, self.version, self.seen_count, self.updates, len(self.tag_scores), len(self.seen)
+        )
+        ledger = LEDGER_HEADER.pack(len(self.liked), len(self.disliked))
+        entries = [
+            DELTA_ENTRY.pack(index, tag_id, delta)
+            for index, tag_deltas in self.deltas.items()
+            for tag_id, delta in tag_deltas.items()
+        ]
+        return b"".join([
+            header, self.tag_scores.tobytes(), bytes(self.seen), ledger, bytes(self.liked), bytes(self.disliked),
+            DELTA_COUNT.pack(len(entries)), *entries,
+        ])
+
+    @classmethod
+    def unpack(cls, raw: bytes):
+        format_version, version, seen_count, updates, tag_count, bitmap_len = HEADER.unpack_from(raw)
+        offset = HEADER.size
+        tag_scores = array("f")
+        tag_scores.frombytes(raw[offset:offset + tag_count * tag_scores.itemsize])
+        offset += tag_count * tag_scores.itemsize
+        seen = bytearray(raw[offset:offset + bitmap_len])
+        offset += bitmap_len
+        liked, disliked, deltas = bytearray(), bytearray(), {}
+        if format_version >= 2:
+            liked_len, disliked_len = LEDGER_HEADER.unpack_from(raw, offset)
+            offset += LEDGER_HEADER.size
+            liked = bytearray(raw[offset:offset + liked_len])
+            disliked = bytearray(raw[offset + liked_len:offset + liked_len + disliked_len])
+            offset += liked_len + disliked_len
+        if format_version >= 3:
+            (count,) = DELTA_COUNT.unpack_from(raw, offset)
+            for index, tag_id, delta in DELTA_ENTRY.iter_unpack(raw[offset + DELTA_COUNT.size:offset + DELTA_COUNT.size + count * DELTA_ENTRY.size]):
+                deltas.setdefault(index, {})[tag_id] = delta
+        return cls(version, seen_count, updates, tag_scores, seen, liked, disliked, deltas)
+
+    def is_seen(self, index: int):
+        return _has_bit(self.seen, index)
+
+    def mark_seen(self, index: int):
+        if self.is_seen(index):
+            return False
+        _set_bit(self.seen, index)
+        self.seen_count += 1
+        return True
+
+    def interaction(self, index: int):
+        if _has_bit(self.liked, index):
+            return "like"
+        if _has_bit(self.disliked, index):
+            return "dislike"
+        return None
+
+    def interaction_deltas(self, index: int):
+        """Tag-score deltas the recorded interaction applied, or None if the
+        record predates format 3."""
+        return self.deltas.get(index)
+
+    def set_interaction(self, index: int, kind: str, deltas: dict = None):
+        """Record kind and the tag deltas it applied for the image; returns
+        the previous kind or None."""
+        previous = self.interaction(index)
+        if previous != kind:
+            bitmaps = {"like": self.liked, "dislike": self.disliked}
+            if previous is not None:
+                _clear_bit(bitmaps[previous], index)
+            _set_bit(bitmaps[kind], index)
+            self.deltas[index] = dict(deltas or {})
+        return previous
+
+    def seen_indexes(self):
+        indexes = []
+        for byte_index, byte in enumerate(self.seen):
+            while byte:
+                low = byte & -byte
+                indexes.append(byte_index * 8 + low.bit_length() - 1)
+                byte ^= low
+        return indexes
+
+    def tag_score(self, tag_id: int):
+        return self.tag_scores[tag_id] if tag_id < len(self.tag_scores) else 0.0
+
+    def add_tag_score(self, tag_id: int, delta: float):
+        if tag_id >= len(self.tag_scores):
+            self.tag_scores.extend([0.0] * (tag_id + 1 - len(self.tag_scores)))
+        self.tag_scores[tag_id] += delta
+        return self.tag_scores[tag_id]
+
+
+def _cache_get(session_id: str):
+    with _cache_lock:
+        state = _cache.get(session_id)
+        if state is not None:
+            _cache.move_to_end(session_id)
+        return state
+
+
+def _cache_put(session_id: str, state: SessionState):
+    with _cache_lock:
+        _cache[session_id] = state
+        _cache.move_to_end(session_id)
+        while len(_cache) > SESSION_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def reset_session_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _binary_redis():
+    redis = get_redis(decode_responses=False)
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    return redis
+
+
+def load_state(session_id: str):
+    redis = _binary_redis()
+    state = _cache_get(session_id)
+    if state is not None:
+        # Version check: only refetch the full record if it changed, since
+        # another worker may have written it.
+        header = redis.getrange(state_key(session_id), 0, HEADER.size - 1)
+        if len(header) == HEADER.size and HEADER.unpack(header)[1] == state.version:
+            metrics.record_cache("session", True)
+            return state
+
+    metrics.record_cache("session", False)
+    raw = redis.get(state_key(session_id))
+    if raw is None:
+        return None
+    state = SessionState.unpack(raw)
+    _cache_put(session_id, state)
+    return state
+
+
+def update_state(session_id: str, mutate, write_if=None):
+    """Apply mutate(state) and write the record back with a version CAS.
+    With write_if, nothing is written unless write_if(result) is true."""
+    redis = _binary_redis()
+    key = state_key(session_id)
+    cached = _cache_get(session_id)
+
+    with redis.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                header = pipe.getrange(key, 0, HEADER.size - 1)
+                stored_version = HEADER.unpack(header)[1] if len(header) == HEADER.size else None
+                if stored_version is None:
+                    state = SessionState()
+                elif cached is not None and cached.version == stored_version:
+                    state = cached.copy()
+                else:
+                    state = SessionState.unpack(pipe.get(key))
+                result = mutate(state)
+                if write_if is not None and not write_if(result):
+                    return result
+                state.version += 1
+                pipe.multi()
+                pipe.set(key, state.pack(), ex=SESSION_TTL_SECONDS)
+                pipe.execute()
+                _cache_put(session_id, state)
+                return result
+            except WatchError:
+                cached = None
+
+
+def ensure_packed_session(session_id: str):
+    if load_state(session_id) is None:
+        update_state(session_id, lambda state: None)
+    return True
+
+
+def _seen_images(state):
+    if state is None:
+        return set()
+    return set(get_image_ids(state.seen_indexes()).values())
+
+
+def get_packed_seen_images(session_id: str):
+    return _seen_images(load_state(session_id))
+
+
+def is_packed_image_seen(session_id: str, image_id: str):
+    state = load_state(session_id)
+    index = get_image_indexes([image_id]).get(image_id)
+    return state is not None and index is not None and state.is_seen(index)
+
+
+def mark_packed_images_seen(session_id: str, image_ids: list[str]):
+    indexes = list(get_image_indexes(image_ids).values())
+    return update_state(session_id, lambda state: sum(state.mark_seen(index) for index in indexes))
+
+
+def update_packed_tag_scores(session_id: str, deltas: dict):
+    """Apply deltas to the session's tag scores. Tags that no image has are
+    dropped: scores are indexed by the global tag dictionary, which only
+    ingest adds to."""
+    tag_ids = lookup_tag_ids(list(deltas))
+
+    def apply(state):
+        state.updates += 1
+        return {tag: state.add_tag_score(tag_ids[tag], delta) for tag, delta in deltas.items() if tag in tag_ids}
+
+    return update_state(session_id, apply)
+
+
+def _tag_scores(state):
+    if state is None:
+        return {}
+    scored = [tag_id for tag_id, score in enumerate(state.tag_scores) if score != 0]
+    names = get_tag_names(needed=scored)
+    return {
+        names[tag_id]: float(state.tag_scores[tag_id])
+        for tag_id in scored
+        if tag_id < len(names) and names[tag_id] is not None
+    }
+
+
+def get_packed_tag_scores(session_id: str):
+    return _tag_scores(load_state(session_id))
+
+
+def get_packed_session_view(session_id: str):
+    """(seen image ids, tag scores) from a single load of the record."""
+    state = load_state(session_id)
+    return _seen_images(state), _tag_scores(state)
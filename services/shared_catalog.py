@@ -0,0 +1,93 @@
+from multiprocessing import shared_memory
+import heapq
+import struct
+
+# Ranking inputs for process-pool workers. The parent publishes every
+# snapshot image's tag mask and global score into one shared-memory block,
+# so a ranking call only ships candidate slot numbers and the session's dense
+# tag scores to the worker instead of pickling the catalog every request.
+# This module is imported by spawned workers and must stay free of app
+# imports (config, Redis, FastAPI).
+
+HEADER = struct.Struct("<QQ")  # count, epoch
+MAX_MASK = (1 << 64) - 1
+
+
+class SharedCatalog:
+    def __init__(self, shm, epoch: int, image_ids: list[str]):
+        self.shm = shm
+        self.epoch = epoch
+        self.image_ids = image_ids
+        self.slots = {image_id: slot for slot, image_id in enumerate(image_ids)}
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @classmethod
+    def build(cls, epoch: int, entries: list):
+        """entries: (image_id, tag_mask, global_score). Returns None when a
+        mask does not fit in 64 bits."""
+        if any(mask > MAX_MASK for _, mask, _ in entries):
+            return None
+        count = len(entries)
+        shm = shared_memory.SharedMemory(create=True, size=HEADER.size + count * 16 or HEADER.size)
+        HEADER.pack_into(shm.buf, 0, count, epoch)
+        masks = shm.buf[HEADER.size:HEADER.size + count * 8].cast("Q")
+        scores = shm.buf[HEADER.size + count * 8:HEADER.size + count * 16].cast("d")
+        for slot, (_, mask, score) in enumerate(entries):
+            masks[slot] = mask
+            scores[slot] = score
+        masks.release()
+        scores.release()
+        return cls(shm, epoch, [image_id for image_id, _, _ in entries])
+
+    def release(self):
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+_attached = {}
+
+
+def _attach(name: str):
+    views = _attached.get(name)
+    if views is None:
+        for stale in list(_attached):
+            _attached.pop(stale)[0].close()
+        # Spawned workers share the parent's resource tracker, so attaching
+        # here doesn't give the block a second owner; the parent unlinks it.
+        shm = shared_memory.SharedMemory(name=name)
+        count, _ = HEADER.unpack_from(shm.buf, 0)
+        masks = shm.buf[HEADER.size:HEADER.size + count * 8].cast("Q")
+        scores = shm.buf[HEADER.size + count * 8:HEADER.size + count * 16].cast("d")
+        views = _attached[name] = (shm, masks, scores)
+    return views
+
+
+def rank_slots(name: str, slots: bytes, dense: list, scale: float, count: int):
+    """Score candidate slots (packed uint32) and return the top `count`."""
+    _, masks, scores = _attach(name)
+    candidates = memoryview(slots).cast("I")
+    boosts = {}
+
+    def score(slot):
+        mask = masks[slot]
+        # Same as tags.mask_boost, which workers can't import.
+        boost = boosts.get(mask)
+        if boost is None:
+            boost = 0.0
+            tag_id = 0
+            remaining = mask
+            while remaining:
+                if remaining & 1 and tag_id < len(dense):
+                    boost += dense[tag_id]
+                remaining >>= 1
+                tag_id += 1
+            boosts[mask] = boost
+        return scores[slot] * scale + boost
+
+    return heapq.nlargest(count, candidates, key=score)
@@ -0,0 +1,92 @@
+from services import metrics
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+# Request coalescing. Concurrent callers asking for the same key share one
+# in-flight computation instead of each running it; KeyedLock serializes
+# callers per key instead, so the second one observes the first one's writes.
+
+coalesced_calls = metrics.Counter(
+    "feedstream_coalesced_calls_total",
+    "Calls that joined an in-flight computation instead of running their own",
+)
+
+
+class AsyncSingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+
+    async def do(self, key, fn):
+        """Await fn() once per key; concurrent callers get the same result.
+
+        The computation runs as its own task, so a caller that is cancelled
+        (a client disconnect) stops waiting without cancelling it for the rest.
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            coalesced_calls.inc(flight=self.name)
+        else:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception retrieved when every caller stopped waiting.
+        if not task.cancelled():
+            task.exception()
+
+
+class SingleFlight:
+    """Thread-based variant for the synchronous data layer."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [threading.Event(), None, None]
+        if not leader:
+            coalesced_calls.inc(flight=self.name)
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+
+        try:
+            call[1] = fn()
+            return call[1]
+        except BaseException as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
+
+
+class KeyedLock:
+    def __init__(self):
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
@@ -1,8 +1,18 @@
 from typing import Dict, Set
+from services import metrics
 import asyncio
 
 active_connections: Dict[str, Set[asyncio.Queue]] = {}
 
+def connection_count() -> int:
+    return sum(len(queues) for queues in active_connections.values())
+
+def queued_message_count() -> int:
+    return sum(queue.qsize() for queues in active_connections.values() for queue in queues)
+
+metrics.sse_active_connections.set_function(connection_count)
+metrics.sse_queue_depth.set_function(queued_message_count)
+
 def register_connection(session_id: str, queue: asyncio.Queue):
     if session_id not in active_connections:
         active_connections[session_id] = set()
@@ -26,16 +36,16 @@ async def broadcast_to_session(session_id: str, message: dict):
     if session_id not in active_connections:
         return
     
-    import json
-    message_str = f"data: {json.dumps(message)}\n\n"
-    
+    # Each stream serializes the message in its own format.
     disconnected = set()
     for queue in list(active_connections[session_id]):
         try:
-            queue.put_nowait(message_str)
+            queue.put_nowait(message)
         except asyncio.QueueFull:
+            metrics.sse_dropped_messages.inc(reason="queue_full")
             disconnected.add(queue)
         except Exception:
+            metrics.sse_dropped_messages.inc(reason="error")
             disconnected.add(queue)
     
     for queue in disconnected:
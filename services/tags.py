@@ -0,0 +1,156 @@
+from fastapi import HTTPException
+from services.redis import get_redis
+import threading
+import time
+
+# Global tag dictionary: every tag name gets a small integer id the first
+# time it is ingested. Images store their tags as an integer bitmask of those
+# ids and session tag scores are turned into a dense list indexed by id, so
+# scoring never parses JSON or hashes tag strings per image.
+
+TAG_DICT_KEY = "tags:dict"
+TAG_NEXT_ID_KEY = "tags:next_id"
+
+_tag_ids = {}
+_tag_names = []
+_lock = threading.Lock()
+_loaded_at = 0.0
+
+RELOAD_INTERVAL_SECONDS = 5.0
+
+
+def _remember(tag: str, tag_id: int):
+    previous = _tag_ids.get(tag)
+    if previous is not None and previous != tag_id and _tag_names[previous] == tag:
+        _tag_names[previous] = None
+    _tag_ids[tag] = tag_id
+    if tag_id >= len(_tag_names):
+        _tag_names.extend([None] * (tag_id + 1 - len(_tag_names)))
+    stale = _tag_names[tag_id]
+    if stale is not None and stale != tag:
+        _tag_ids.pop(stale, None)
+    _tag_names[tag_id] = tag
+
+
+def load_tag_dictionary():
+    global _loaded_at
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    entries = redis.hgetall(TAG_DICT_KEY)
+    with _lock:
+        _tag_ids.clear()
+        _tag_names.clear()
+        for tag, tag_id in entries.items():
+            _remember(tag, int(tag_id))
+        _loaded_at = time.monotonic()
+    return dict(_tag_ids)
+
+
+def reset_tag_cache():
+    global _loaded_at
+    with _lock:
+        _loaded_at = 0.0
+        _tag_ids.clear()
+        _tag_names.clear()
+
+
+def ensure_tag_ids(tags: list[str]):
+    """Return {tag: id}, assigning ids to tags not seen before.
+
+    Ingest always asks Redis rather than trusting the local cache, so a
+    worker with a stale dictionary can never write a mask with wrong bits.
+    """
+    tags = list(dict.fromkeys(tags))
+    if not tags:
+        return {}
+    redis = get_redis()
+    if redis is None:
+        raise HTTPException(status_code=503, detail="Redis connection failed")
+    existing = redis.hmget(TAG_DICT_KEY, tags)
+    with _lock:
+        for tag, tag_id in zip(tags, existing):
+            if tag_id is None:
+                tag_id = redis.incr(TAG_NEXT_ID_KEY) - 1
+                if not redis.hsetnx(TAG_DICT_KEY, tag, tag_id):
+                    # Another worker registered the tag first; use its id.
+                    tag_id = redis.hget(TAG_DICT_KEY, tag)
+            _remember(tag, int(tag_id))
+    return {tag: _tag_ids[tag] for tag in tags}
+
+
+def get_tag_names(min_count: int = 0, needed=None):
+    """Tag names indexed by id, reloading the dictionary if ids in needed
+    (default: every id below min_count) are unknown.
+
+    An id below the highest known one can be a permanent gap: ensure_tag_ids
+    burns an id when it loses a registration race. Those are only reloaded
+    every RELOAD_INTERVAL_SECONDS.
+    """
+    ids = range(min_count) if needed is None else needed
+    missing = [tag_id for tag_id in ids if tag_id >= len(_tag_names) or _tag_names[tag_id] is None]
+    if missing and (
+        max(missing) >= len(_tag_names) or time.monotonic() - _loaded_at > RELOAD_INTERVAL_SECONDS
+    ):
+        load_tag_dictionary()
+    return list(_tag_names)
+
+
+def tags_to_mask(tags: list[str]):
+    mask = 0
+    for tag_id in ensure_tag_ids(tags).values():
+        mask |= 1 << tag_id
+    return mask
+
+
+def mask_to_tags(mask: int):
+    if mask.bit_length() > len(_tag_names) or any(
+        _tag_names[tag_id] is None for tag_id in _mask_ids(mask)
+    ):
+        load_tag_dictionary()
+    return [_tag_names[tag_id] for tag_id in _mask_ids(mask) if tag_id < len(_tag_names) and _tag_names[tag_id]]
+
+
+def _mask_ids(mask: int):
+    tag_id = 0
+    while mask:
+        if mask & 1:
+            yield tag_id
+        mask >>= 1
+        tag_id += 1
+
+
+def lookup_tag_ids(tags: list[str]):
+    """Return {tag: id} for tags in the dictionary, without assigning ids."""
+    if any(tag not in _tag_ids for tag in tags) and time.monotonic() - _loaded_at > RELOAD_INTERVAL_SECONDS:
+        load_tag_dictionary()
+    return {tag: _tag_ids[tag] for tag in tags if tag in _tag_ids}
+
+
+def dense_tag_scores(tag_scores: dict):
+    """Session tag scores as a list indexed by tag id (unknown tags dropped)."""
+    if any(tag not in _tag_ids for tag in tag_scores) and time.monotonic() - _loaded_at > RELOAD_INTERVAL_SECONDS:
+        # Another worker may have ingested the tag since we last loaded.
+        load_tag_dictionary()
+    dense = [0.0] * len(_tag_names)
+    for tag, score in tag_scores.items():
+        tag_id = _tag_ids.get(tag)
+        if tag_id is not None:
+            dense[tag_id] = score
+    return dense
+
+
+def mask_boost(mask: int, dense: list, cache: dict):
+    """Sum of dense scores for the bits in mask, memoized per distinct mask."""
+    boost = cache.get(mask)
+    if boost is None:
+        boost = 0.0
+        tag_id = 0
+        remaining = mask
+        while remaining:
+            if remaining & 1 and tag_id < len(dense):
+                boost += dense[tag_id]
+            remaining >>= 1
+            tag_id += 1
+        cache[mask] = boost
+    return boost
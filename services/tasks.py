@@ -0,0 +1,140 @@
+from services import metrics
+from config import TASK_QUEUE_SIZE, TASK_CONCURRENCY, TASK_DRAIN_SECONDS
+import asyncio
+import itertools
+import time
+
+# Managed background work. Short fire-and-forget jobs (prefetch broadcasts)
+# go through a bounded priority queue drained by a fixed number of workers
+# started from the app lifespan, instead of unbounded asyncio.create_task
+# calls nobody keeps a reference to. The long-running loops (materializer,
+# rollup, replayer, replica monitor) would hold a worker for the life of the
+# app, so the lifespan starts them as tasks of their own and cancels them on
+# shutdown.
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+task_queue_wait = metrics.Histogram(
+    "feedstream_task_queue_wait_seconds",
+    "Time a background task waited in the queue before running",
+)
+task_run_time = metrics.Histogram(
+    "feedstream_task_run_seconds",
+    "Background task run time",
+)
+tasks_dropped = metrics.Counter(
+    "feedstream_tasks_dropped_total",
+    "Background tasks rejected because the queue was full or the runner stopped",
+)
+tasks_failed = metrics.Counter(
+    "feedstream_tasks_failed_total",
+    "Background tasks that raised an exception",
+)
+task_queue_depth = metrics.Gauge(
+    "feedstream_task_queue_depth",
+    "Background tasks waiting to run",
+)
+
+
+class TaskRunner:
+    def __init__(self, max_queue: int, concurrency: int):
+        self.max_queue = max_queue
+        self.concurrency = concurrency
+        self._queue = None
+        self._workers = []
+        self._pending_keys = set()
+        self._sequence = itertools.count()
+        self._accepting = False
+
+    @property
+    def running(self):
+        return self._accepting
+
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        self._queue = asyncio.PriorityQueue(maxsize=self.max_queue)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._accepting = True
+
+    def submit(self, fn, *args, priority: int = BACKGROUND, name: str = "task", key=None):
+        """Queue fn(*args) to run later. Returns False if the task was dropped.
+
+        Tasks sharing a key collapse into one while the first is still queued.
+        """
+        priority_name = PRIORITY_NAMES[priority]
+        if not self._accepting:
+            tasks_dropped.inc(task=name, reason="stopped", priority=priority_name)
+            return False
+        if key is not None and key in self._pending_keys:
+            return True
+        try:
+            self._queue.put_nowait((priority, next(self._sequence), time.perf_counter(), name, key, fn, args))
+        except asyncio.QueueFull:
+            tasks_dropped.inc(task=name, reason="queue_full", priority=priority_name)
+            return False
+        if key is not None:
+            self._pending_keys.add(key)
+        return True
+
+    async def _worker(self):
+        while True:
+            priority, _, enqueued_at, name, key, fn, args = await self._queue.get()
+            if key is not None:
+                self._pending_keys.discard(key)
+            priority_name = PRIORITY_NAMES[priority]
+            task_queue_wait.observe(time.perf_counter() - enqueued_at, priority=priority_name)
+            start = time.perf_counter()
+            try:
+                await fn(*args)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                tasks_failed.inc(task=name)
+                print(f"Background task {name} failed: {e}")
+            finally:
+                task_run_time.observe(time.perf_counter() - start, task=name)
+                self._queue.task_done()
+
+    async def drain(self, timeout: float = TASK_DRAIN_SECONDS):
+        """Stop accepting work, finish what is queued, then stop the workers."""
+        self._accepting = False
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Task drain timed out with {self._queue.qsize()} tasks queued")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._pending_keys.clear()
+
+
+runner = TaskRunner(TASK_QUEUE_SIZE, TASK_CONCURRENCY)
+task_queue_depth.set_function(lambda: runner.depth())
+
+# Outside the app lifespan (scripts, direct calls in tests) there is no
+# runner; keep strong references so those tasks are not garbage collected.
+_detached = set()
+
+
+async def _run_detached(name: str, fn, args):
+    try:
+        await fn(*args)
+    except Exception as e:
+        tasks_failed.inc(task=name)
+        print(f"Background task {name} failed: {e}")
+
+
+def submit(fn, *args, priority: int = BACKGROUND, name: str = "task", key=None):
+    if runner.running:
+        return runner.submit(fn, *args, priority=priority, name=name, key=key)
+    task = asyncio.get_running_loop().create_task(_run_detached(name, fn, args))
+    _detached.add(task)
+    task.add_done_callback(_detached.discard)
+    return True
@@ -0,0 +1,102 @@
+from services.compact import decompress
+from config import TRAFFIC_CAPTURE_FILE
+import json
+import os
+import threading
+
+# Opt-in traffic capture (TRAFFIC_CAPTURE_FILE=path). Session creations, feed
+# fetches and likes/dislikes are appended to the file as one compact JSON
+# line each: arrival time, the request's parameters, status, latency and, for
+# feeds, the image ids served. replay.py re-issues a capture against the app
+# to benchmark changes on real load shapes. Each record is a single O_APPEND
+# write, so workers can share one file.
+
+CAPTURED_ROUTES = {
+    ("POST", "/sessions/create"): "session",
+    ("GET", "/feed"): "feed",
+    ("POST", "/like"): "like",
+    ("POST", "/dislike"): "dislike",
+}
+
+_capture_file = TRAFFIC_CAPTURE_FILE
+_fd = None
+_lock = threading.Lock()
+
+
+def capture_op(method: str, path: str):
+    """The operation to record for a request, or None when capture is off or
+    the route isn't captured."""
+    if not _capture_file:
+        return None
+    return CAPTURED_ROUTES.get((method, path))
+
+
+def set_capture_file(path: str):
+    global _capture_file, _fd
+    with _lock:
+        if _fd is not None:
+            os.close(_fd)
+        _capture_file, _fd = path, None
+
+
+def feed_image_ids(response: dict):
+    # Compact pages list images as rows starting with the id.
+    return [
+        image[0] if isinstance(image, list) else image["image_id"]
+        for image in response.get("visible", []) + response.get("prefetched", [])
+    ]
+
+
+def build_record(op: str, started_at: float, elapsed: float, status: int, params: dict, body: dict, response: dict):
+    record = {"t": round(started_at, 6), "op": op, "ms": round(elapsed * 1000, 3), "status": status}
+    if op == "session":
+        record["preferred_tags"] = body.get("preferred_tags")
+        record["session_id"] = response.get("session_id")
+        return record
+
+    record["session_id"] = params.get("session_id")
+    if op == "feed":
+        for name in ("cursor", "tags", "mode", "format", "known_tags"):
+            if name in params:
+                record[name] = params[name]
+        if "message" in response:
+            record["message"] = response["message"]
+        else:
+            record["images"] = feed_image_ids(response)
+            record["next_cursor"] = response.get("cursor")
+    else:
+        record["image_id"] = params.get("image_id")
+    return record
+
+
+def write_record(record: dict):
+    global _fd
+    line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+    with _lock:
+        if not _capture_file:
+            return
+        if _fd is None:
+            _fd = os.open(_capture_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(_fd, line)
+
+
+def record_request(op: str, started_at: float, elapsed: float, status: int, params: dict, body: bytes, content: bytes, content_encoding: str = None):
+    try:
+        body = json.loads(body) if body else {}
+        response = json.loads(decompress(content, content_encoding)) if content else {}
+    except (ValueError, OSError, EOFError):
+        body, response = {}, {}
+    if not isinstance(body, dict) or not isinstance(response, dict):
+        body, response = {}, {}
+    try:
+        write_record(build_record(op, started_at, elapsed, status, params, body, response))
+    except OSError as e:
+        print(f"Error writing traffic capture: {e}")
+
+
+def read_records(path: str):
+    """Captured records in arrival order."""
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda record: record["t"])
+    return records
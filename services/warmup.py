@@ -0,0 +1,58 @@
+from services.redis import warm_connections
+from services.tags import load_tag_dictionary
+from services.catalog import get_image_indexes
+from services import ranking
+from services import catalog_file
+from services import metrics
+from config import WARMUP_CONNECTIONS, WARMUP_RETRY_SECONDS
+import asyncio
+import threading
+import time
+
+# Startup warmup. Before a worker takes traffic it opens its Redis
+# connections, loads the tag dictionary, builds or adopts the ranking
+# snapshot (running the snapshot listeners: shared catalog, catalog file,
+# cold-start rankings, fallback feed), maps the catalog file and caches the
+# catalog index of the ranked images.
+# /health/ready answers 503 until this has succeeded once.
+
+_ready = threading.Event()
+
+warmup_duration = metrics.Gauge(
+    "feedstream_warmup_duration_seconds",
+    "Time the last successful startup warmup took",
+)
+
+
+def warm_up():
+    start = time.perf_counter()
+    warm_connections(WARMUP_CONNECTIONS)
+    load_tag_dictionary()
+    snapshot = ranking.refresh_snapshot()
+    ranking.run_listeners(snapshot)
+    catalog_file.current()
+    if snapshot is not None:
+        get_image_indexes(list(snapshot.scores), create=False)
+    warmup_duration.set(time.perf_counter() - start)
+    _ready.set()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def reset_ready():
+    _ready.clear()
+
+
+async def run_warmup():
+    """Warm up, retrying every WARMUP_RETRY_SECONDS until it succeeds."""
+    while True:
+        try:
+            await asyncio.to_thread(warm_up)
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error warming up: {e}")
+        await asyncio.sleep(WARMUP_RETRY_SECONDS)
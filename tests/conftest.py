@@ -49,3 +49,28 @@ def check_redis_latency():
         print("Redis connection OK")
     
     print("="*60 + "\n")
+
+@pytest.fixture(autouse=True)
+def reset_local_caches():
+    """Tests flush Redis between cases, so drop per-process caches too"""
+    from services.tags import reset_tag_cache
+    from services.catalog import reset_catalog_cache
+    from services.session_store import reset_session_cache
+    from services.cold_start import reset_cold_start_cache
+    from services.fallback import reset_fallback
+    from services.hot_keys import reset_hot_keys
+    from services.catalog_file import reset_catalog_file
+    from services.embeddings import reset_embedding_index
+    from services.tag_index import reset_tag_index
+    from services.redis import redis_breaker
+    reset_tag_cache()
+    reset_catalog_cache()
+    reset_session_cache()
+    reset_cold_start_cache()
+    reset_fallback()
+    reset_hot_keys()
+    reset_catalog_file()
+    reset_embedding_index()
+    reset_tag_index()
+    redis_breaker.reset()
+    yield
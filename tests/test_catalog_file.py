@@ -0,0 +1,98 @@
+import os
+import pytest
+from services import catalog_file, ranking
+from services.catalog_file import CatalogFile, write_catalog_file, export_catalog_file
+from services.redis import get_redis
+from services.feed import store_image, add_images_tags, update_engagement, get_images_batch, read_catalog_entries
+from services.metrics import cache_hits
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    ranking.set_snapshot(None)
+    yield
+    ranking.set_snapshot(None)
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def catalog_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog_file, "CATALOG_FILE_DIR", str(tmp_path))
+    catalog_file.reset_catalog_file()
+    yield tmp_path
+    catalog_file.reset_catalog_file()
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    for i in range(12):
+        tags = ["nature"] if i % 2 == 0 else ["city", "night"]
+        store_image(f"file_img{i}", f"https://example.com/file_img{i}.jpg", tags)
+        add_images_tags(f"file_img{i}", tags)
+        update_engagement(f"file_img{i}")
+
+def test_round_trip_with_wide_masks(tmp_path):
+    entries = [
+        ("b", "https://example.com/b.jpg", 1 << 70 | 5, 2.0),
+        ("a", "https://example.com/a.jpg", 3, 1.5),
+        ("ü", "https://example.com/ü.jpg", 0, -1.0),
+    ]
+    catalog = CatalogFile(write_catalog_file(str(tmp_path), 7, entries))
+
+    assert catalog.version == 7 and len(catalog) == 3
+    assert catalog.get_images(["b", "ü", "missing"]) == {
+        "b": {"image_id": "b", "image_url": "https://example.com/b.jpg", "tag_mask": 1 << 70 | 5},
+        "ü": {"image_id": "ü", "image_url": "https://example.com/ü.jpg", "tag_mask": 0},
+    }
+    assert catalog.global_scores(["a", "b", "c"]) == {"a": 1.5, "b": 2.0}
+
+def test_empty_catalog(tmp_path):
+    catalog = CatalogFile(write_catalog_file(str(tmp_path), 1, []))
+
+    assert len(catalog) == 0
+    assert catalog.get_images(["a"]) == {}
+
+def test_exported_file_serves_catalog_reads(seeded_images, catalog_dir):
+    ids = [f"file_img{i}" for i in range(12)]
+    from_redis = get_images_batch(ids)
+
+    export_catalog_file(ranking.refresh_snapshot(), read_catalog_entries)
+    hits = cache_hits.value(cache="catalog_file")
+    # Served locally even once Redis no longer has the hash.
+    get_redis().delete("image:file_img3")
+
+    assert get_images_batch(ids) == from_redis
+    assert cache_hits.value(cache="catalog_file") == hits + 12
+
+def test_images_missing_from_file_come_from_redis(seeded_images, catalog_dir):
+    export_catalog_file(ranking.refresh_snapshot(), read_catalog_entries)
+    store_image("file_new", "https://example.com/file_new.jpg", ["nature"])
+
+    images = get_images_batch(["file_img0", "file_new"])
+
+    assert images["file_new"]["image_url"] == "https://example.com/file_new.jpg"
+    assert images["file_img0"]["image_url"] == "https://example.com/file_img0.jpg"
+
+def test_new_version_switches_atomically_and_prunes(seeded_images, catalog_dir, monkeypatch):
+    monkeypatch.setattr(catalog_file, "CATALOG_FILE_REBUILD_SECONDS", 0)
+    first = export_catalog_file(ranking.refresh_snapshot(), read_catalog_entries)
+    for version in range(3):
+        update_engagement("file_img1")
+        latest = export_catalog_file(ranking.refresh_snapshot(), read_catalog_entries)
+
+    assert latest.version > first.version
+    assert os.readlink(catalog_dir / "catalog.bin") == f"catalog-{latest.version}.bin"
+    assert len(list(catalog_dir.glob("catalog-*.bin"))) == 2
+    # A worker still mapping a pruned version can keep reading it.
+    assert first.get_images(["file_img0"])["file_img0"]["image_url"] == "https://example.com/file_img0.jpg"
+
+def test_rebuild_waits_for_interval(seeded_images, catalog_dir):
+    first = export_catalog_file(ranking.refresh_snapshot(), read_catalog_entries)
+    update_engagement("file_img1")
+
+    assert export_catalog_file(ranking.refresh_snapshot(), read_catalog_entries) is first
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,99 @@
+import pytest
+from services import feed_generator, ranking, cold_start
+from services.cold_start import cold_start_key, get_cold_start, warm_cold_starts
+from services.feed import store_image, add_images_tags, update_engagement, increment_likes
+from services.feed_generator import generate_feed, rank_cold_start
+from services.session import create_session
+from services.redis import get_redis
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    ranking.set_snapshot(None)
+    yield
+    ranking.set_snapshot(None)
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    for i in range(60):
+        tags = ["nature"] if i % 3 == 0 else ["city"] if i % 3 == 1 else ["food"]
+        store_image(f"cold_img{i}", f"https://example.com/cold_img{i}.jpg", tags)
+        add_images_tags(f"cold_img{i}", tags)
+        get_redis().hset(f"image:cold_img{i}", "likes", i)
+        update_engagement(f"cold_img{i}")
+    ranking.refresh_snapshot()
+
+@pytest.fixture
+def count_rankings(monkeypatch):
+    calls = []
+    rank_available = feed_generator.rank_available
+
+    def counted(*args):
+        calls.append(args[-1])
+        return rank_available(*args)
+
+    monkeypatch.setattr(feed_generator, "rank_available", counted)
+    return calls
+
+def _ids(page):
+    return [image["image_id"] for image in page["visible"] + page["prefetched"]]
+
+def test_key_ignores_tag_order():
+    assert cold_start_key({"nature": 3, "city": 3}) == cold_start_key({"city": 3.0, "nature": 3.0})
+
+def test_sessions_with_same_tags_share_first_ranking(seeded_images, count_rankings):
+    first = generate_feed(create_session(["nature", "city"]))
+    second = generate_feed(create_session(["city", "nature"]))
+
+    assert _ids(first) == _ids(second)
+    assert count_rankings == ["cold_start"]
+
+def test_cold_start_matches_uncached_ranking(seeded_images):
+    cached = generate_feed(create_session(["food"]))
+
+    ranking.set_snapshot(None)
+    uncached = generate_feed(create_session(["food"]))
+
+    assert _ids(cached) == _ids(uncached)
+
+def test_new_epoch_recomputes(seeded_images, count_rankings):
+    generate_feed(create_session(["nature"]))
+
+    for _ in range(100):
+        increment_likes("cold_img2")
+    update_engagement("cold_img2")
+    ranking.refresh_snapshot()
+    page = generate_feed(create_session(["nature"]))
+
+    assert count_rankings == ["cold_start", "cold_start"]
+    assert _ids(page)[0] == "cold_img2"
+
+def test_second_page_is_not_a_cold_start(seeded_images, count_rankings):
+    session_id = create_session(["nature"])
+    generate_feed(session_id)
+    generate_feed(session_id)
+
+    assert count_rankings == ["cold_start", "feed"]
+
+def test_warm_rebuilds_requested_tag_sets(seeded_images):
+    get_cold_start({"city": 3.0}, rank_cold_start)
+
+    for _ in range(100):
+        increment_likes("cold_img1")
+    update_engagement("cold_img1")
+    snapshot = ranking.refresh_snapshot()
+
+    assert warm_cold_starts(snapshot, rank_cold_start) == 1
+    assert (snapshot.epoch, cold_start_key({"city": 3.0})) in cold_start._cache
+    assert get_redis().exists(f"coldstart:{snapshot.epoch}:city=3")
+
+def test_no_snapshot_skips_cache(clean_redis):
+    assert get_cold_start({"nature": 3.0}, rank_cold_start) is None
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
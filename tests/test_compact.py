@@ -0,0 +1,174 @@
+import asyncio
+import json
+import zlib
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from services import compact, traffic
+from services.compact import StreamEncoder, compact_page, split_url
+from services.redis import get_redis
+from services.feed import store_image, add_images_tags, update_engagement
+from services.session import create_session
+from services.sse_manager import register_connection, unregister_connection, broadcast_to_session
+
+PREFIX = "https://images.unsplash.com/photo-"
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    yield
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    for i in range(30):
+        tags = ["nature", "forest"] if i % 2 else ["city"]
+        url = f"https://cdn.example.com/compact_img{i}.jpg" if i == 0 else f"{PREFIX}{1500000000000 + i}-abcdef"
+        store_image(f"compact_img{i}", url, tags)
+        add_images_tags(f"compact_img{i}", tags)
+        update_engagement(f"compact_img{i}")
+
+@pytest.fixture
+def gzip_enabled(monkeypatch):
+    monkeypatch.setattr(compact, "FEED_COMPRESSION", "gzip")
+    monkeypatch.setattr(compact, "FEED_COMPRESSION_MIN_BYTES", 100)
+
+def expand(page: dict, prefixes: list, names: list):
+    """Rebuild describe_image dicts from a compact page, as a client would."""
+    if "tags" in page:
+        del names[page["tag_base"]:]
+        names.extend(page["tags"])
+    return [
+        {
+            "image_id": image_id,
+            "image_url": suffix if prefix_id is None else prefixes[prefix_id] + suffix,
+            "image_tags": [names[tag_id] for tag_id in tag_ids],
+        }
+        for image_id, prefix_id, suffix, tag_ids in page["visible"] + page["prefetched"]
+    ]
+
+def test_split_url_prefers_the_longest_prefix(monkeypatch):
+    monkeypatch.setattr(compact, "URL_PREFIXES", ["https://a.com/", "https://a.com/photo-"])
+    monkeypatch.setattr(compact, "_PREFIX_ORDER", [1, 0])
+
+    assert split_url("https://a.com/photo-123") == (1, "123")
+    assert split_url("https://a.com/x.jpg") == (0, "x.jpg")
+    assert split_url("https://b.com/x.jpg") == (None, "https://b.com/x.jpg")
+
+def test_compact_feed_expands_to_the_json_feed(seeded_images):
+    client = TestClient(app)
+    first = client.get("/feed", params={"session_id": create_session(["nature"])}).json()
+    session_id = create_session(["nature"])
+    page = client.get("/feed", params={"session_id": session_id, "format": "compact"}).json()
+
+    assert page["format"] == "compact"
+    assert page["prefixes"] == [PREFIX]
+    assert page["tag_base"] == 0
+    assert expand(page, page["prefixes"], []) == first["visible"] + first["prefetched"]
+    assert len(json.dumps(page, separators=(",", ":"))) < len(json.dumps(first, separators=(",", ":"))) / 2
+
+def test_cursor_pages_send_only_new_tag_names(seeded_images):
+    client = TestClient(app)
+    session_id = create_session(["nature"])
+    first = client.get("/feed", params={"session_id": session_id, "format": "compact"}).json()
+    names = list(first["tags"])
+
+    store_image("compact_new", f"{PREFIX}1600000000000-new", ["nature", "desert"])
+    second, tag_count = compact_page(
+        {"visible": [{"image_id": "compact_new", "image_url": f"{PREFIX}1600000000000-new", "image_tags": ["nature", "desert"]}], "prefetched": []},
+        known_tags=len(names), prefixes=False,
+    )
+    repeat = client.get("/feed", params={"session_id": session_id, "format": "compact", "cursor": first["cursor"], "known_tags": len(names)}).json()
+
+    assert "prefixes" not in second and "prefixes" not in repeat
+    assert second["tag_base"] == len(names) and second["tags"] == ["desert"]
+    assert tag_count == len(names) + 1
+    assert expand(second, [PREFIX], names)[0]["image_tags"] == ["nature", "desert"]
+    # known_tags was sent before "desert" existed, so the cursor page carries it.
+    assert repeat["tags"] == ["desert"]
+
+def test_unknown_format_is_rejected(seeded_images):
+    response = TestClient(app).get("/feed", params={"session_id": "s", "format": "xml"})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "format must be 'json' or 'compact'"}
+
+def test_feed_is_gzipped_when_enabled_and_accepted(seeded_images, gzip_enabled):
+    client = TestClient(app)
+    params = {"session_id": create_session(["nature"]), "format": "compact"}
+
+    compressed = client.get("/feed", params=params, headers={"Accept-Encoding": "gzip"})
+    plain = client.get("/feed", params=params, headers={"Accept-Encoding": "identity"})
+
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["vary"]
+    assert len(compressed.json()["visible"]) == 10
+    assert "content-encoding" not in plain.headers
+
+def test_compression_negotiation(gzip_enabled, monkeypatch):
+    assert compact.choose_encoding("gzip, deflate, br") == "gzip"
+    assert compact.choose_encoding("br;q=1.0, gzip;q=0") is None
+    assert compact.choose_encoding("") is None
+
+    monkeypatch.setattr(compact, "FEED_COMPRESSION", "br")
+    assert compact.choose_encoding("gzip, br") == "br"
+    assert compact.decompress(compact.compress(b"feed" * 100, "br"), "br") == b"feed" * 100
+
+    monkeypatch.setattr(compact, "FEED_COMPRESSION", "off")
+    assert compact.choose_encoding("gzip") is None
+
+def test_gzip_stream_flushes_every_event(seeded_images):
+    encoder = StreamEncoder("compact", "gzip")
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    prefetched = [{"image_id": "compact_img1", "image_url": f"{PREFIX}1500000000001-abcdef", "image_tags": ["nature", "forest"]}]
+
+    connected = decoder.decompress(encoder.event({"type": "connected", "session_id": "s"}))
+    update = decoder.decompress(encoder.event({"type": "prefetch_update", "prefetched": prefetched}))
+
+    # Each chunk decodes completely on arrival, without the next one.
+    assert connected.startswith(b"data: ") and connected.endswith(b"\n\n")
+    hello = json.loads(connected[6:])
+    assert hello["prefixes"] == [PREFIX] and hello["tag_base"] == 0
+    message = json.loads(update[6:])
+    assert "prefixes" not in message and "tags" not in message
+    assert message["prefetched"] == [["compact_img1", 0, "1500000000001-abcdef", [hello["tags"].index("nature"), hello["tags"].index("forest")]]]
+
+def test_broadcast_is_encoded_per_stream(seeded_images):
+    session_id = "compact-stream"
+    json_queue, compact_queue = asyncio.Queue(), asyncio.Queue()
+    register_connection(session_id, json_queue)
+    register_connection(session_id, compact_queue)
+    image = {"image_id": "compact_img1", "image_url": f"{PREFIX}1500000000001-abcdef", "image_tags": ["nature", "forest"]}
+    try:
+        asyncio.run(broadcast_to_session(session_id, {"type": "prefetch_update", "prefetched": [image]}))
+    finally:
+        unregister_connection(session_id, json_queue)
+        unregister_connection(session_id, compact_queue)
+
+    plain = StreamEncoder().event(json_queue.get_nowait())
+    small = StreamEncoder("compact").event(compact_queue.get_nowait())
+
+    assert json.loads(plain[6:])["prefetched"] == [image]
+    assert json.loads(small[6:])["prefetched"][0][:3] == ["compact_img1", 0, "1500000000001-abcdef"]
+
+def test_capture_reads_compressed_compact_feeds(seeded_images, gzip_enabled, tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    traffic.set_capture_file(str(path))
+    try:
+        client = TestClient(app)
+        session_id = create_session(["nature"])
+        page = client.get("/feed", params={"session_id": session_id, "format": "compact"}, headers={"Accept-Encoding": "gzip"})
+    finally:
+        traffic.set_capture_file("")
+
+    record = traffic.read_records(str(path))[0]
+    assert page.headers["content-encoding"] == "gzip"
+    assert record["format"] == "compact"
+    assert record["images"] == [row[0] for row in page.json()["visible"] + page.json()["prefetched"]]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,103 @@
+import pytest
+import numpy as np
+from services import embeddings, ranking
+from services.redis import get_redis
+from services.feed import store_image, add_images_tags, update_engagement, read_embeddings
+from services.feed_generator import get_candidate, apply_interaction
+from services.session import create_session
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    ranking.set_snapshot(None)
+    yield
+    ranking.set_snapshot(None)
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+def _cluster_vector(cluster: int, rng):
+    center = np.zeros(8, dtype=np.float32)
+    center[cluster] = 1.0
+    return (center + rng.normal(0, 0.05, 8)).tolist()
+
+@pytest.fixture
+def embedded_images(clean_redis):
+    # Three clusters of images that all share the same tag.
+    rng = np.random.default_rng(1)
+    for i in range(60):
+        store_image(f"emb_img{i}", f"https://example.com/emb_img{i}.jpg", ["nature"], embedding=_cluster_vector(i % 3, rng))
+        add_images_tags(f"emb_img{i}", ["nature"])
+        update_engagement(f"emb_img{i}")
+    ranking.refresh_snapshot()
+    embeddings.rebuild_index(read_embeddings)
+
+def test_embedding_round_trip():
+    vector = [0.5, -1.25, 3.0]
+
+    assert embeddings.decode_embedding(embeddings.encode_embedding(vector)).tolist() == vector
+
+def test_ivf_search_matches_brute_force():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(2000, 16)).astype(np.float32)
+    index = embeddings.IVFIndex([f"v{i}" for i in range(2000)], vectors)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    recalls = []
+    for query in rng.normal(size=(20, 16)):
+        exact = {f"v{i}" for i in np.argsort(-(normalized @ query))[:10]}
+        recalls.append(len(exact & set(index.search(query, 10, probes=16))) / 10)
+
+    assert sum(recalls) / len(recalls) >= 0.8
+
+def test_index_rebuilds_only_when_embeddings_change(embedded_images):
+    index = embeddings.get_index()
+
+    assert len(index.image_ids) == 60
+    assert embeddings.rebuild_index(read_embeddings) is index
+    store_image("emb_new", "https://example.com/emb_new.jpg", ["nature"], embedding=[1.0] + [0.0] * 7)
+    update_engagement("emb_new")
+    assert len(embeddings.rebuild_index(read_embeddings).image_ids) == 61
+
+def test_likes_steer_candidates_to_similar_images(embedded_images):
+    session_id = create_session(["nature"])
+    assert embeddings.similar_images(session_id) is None
+
+    apply_interaction("like", session_id, "emb_img0")
+    apply_interaction("like", session_id, "emb_img3")
+
+    similar = embeddings.similar_images(session_id, 10)
+    assert all(int(image_id[len("emb_img"):]) % 3 == 0 for image_id in similar)
+    assert set(similar) <= set(get_candidate(session_id))
+
+def test_cold_start_candidates_skip_the_taste_lookup(embedded_images, monkeypatch):
+    looked_up = []
+    monkeypatch.setattr(embeddings, "get_taste", looked_up.append)
+
+    candidate = get_candidate(None, {"nature": 3.0})
+
+    assert looked_up == []
+    assert len(candidate) == 60
+
+def test_dislike_moves_taste_away(embedded_images):
+    session_id = create_session(["nature"])
+    apply_interaction("like", session_id, "emb_img1")
+    before = embeddings.get_taste(session_id) @ embeddings.get_index().vector("emb_img4")
+
+    apply_interaction("dislike", session_id, "emb_img4")
+
+    assert embeddings.get_taste(session_id) @ embeddings.get_index().vector("emb_img4") < before
+
+def test_images_without_embeddings_leave_taste_alone(clean_redis):
+    store_image("plain_img", "https://example.com/plain_img.jpg", ["nature"])
+    update_engagement("plain_img")
+    session_id = create_session(["nature"])
+
+    apply_interaction("like", session_id, "plain_img")
+
+    assert embeddings.get_taste(session_id) is None
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,66 @@
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from services.feed import store_image, add_images_tags, update_engagement, increment_likes, increment_dislikes, get_engagement, migrate_engagement_keys
+from services.redis import get_redis
+
+client = TestClient(app)
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    yield
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    for i in range(5):
+        store_image(f"eng_img{i}", f"https://example.com/eng_img{i}.jpg", ["nature"])
+        add_images_tags(f"eng_img{i}", ["nature"])
+        for _ in range(i):
+            increment_likes(f"eng_img{i}")
+        update_engagement(f"eng_img{i}")
+
+def test_engagement_is_stored_in_image_hash(seeded_images):
+    increment_dislikes("eng_img1")
+
+    redis = get_redis()
+    assert redis.hget("image:eng_img1", "likes") == "1"
+    assert redis.hget("image:eng_img1", "dislikes") == "1"
+    assert list(redis.scan_iter(match="image:*:likes")) == []
+
+def test_bulk_engagement_endpoint(seeded_images):
+    response = client.get("/images/engagement?ids=eng_img0,eng_img3,missing")
+
+    assert response.status_code == 200
+    engagement = response.json()["engagement"]
+    assert engagement["eng_img3"] == {"likes": 3, "dislikes": 0}
+    assert engagement["eng_img0"] == {"likes": 0, "dislikes": 0}
+    assert engagement["missing"] == {"likes": 0, "dislikes": 0}
+
+def test_top_engagement_endpoint(seeded_images):
+    response = client.get("/images/engagement/top?count=2")
+
+    assert response.status_code == 200
+    images = response.json()["images"]
+    assert [image["image_id"] for image in images] == ["eng_img4", "eng_img3"]
+    assert images[0]["likes"] == 4
+    assert images[0]["score"] == 8.0
+
+def test_migrate_legacy_engagement_keys(seeded_images):
+    redis = get_redis()
+    redis.set("image:eng_img0:likes", 5)
+    redis.set("image:eng_img0:dislikes", 2)
+
+    assert migrate_engagement_keys() == 2
+
+    assert get_engagement("eng_img0") == {"likes": 5, "dislikes": 2}
+    assert not redis.exists("image:eng_img0:likes", "image:eng_img0:dislikes")
+    assert migrate_engagement_keys() == 0
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
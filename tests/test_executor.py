@@ -0,0 +1,112 @@
+import asyncio
+import contextvars
+import threading
+import pytest
+from services import executor, ranking
+from services.executor import offload, publish_catalog, rank_shared
+from services.feed import store_image, add_images_tags, update_engagement, increment_likes, get_images_batch
+from services.feed_generator import score_candidates, get_candidate_scores, generate_feed
+from services.tags import dense_tag_scores
+from services.session import create_session
+from services.redis import get_redis
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    ranking.set_snapshot(None)
+    yield
+    ranking.set_snapshot(None)
+    executor.shutdown()
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    tags = [["nature"], ["city"], ["nature", "forest"], ["food"]]
+    for i in range(40):
+        store_image(f"exec_img{i}", f"https://example.com/exec_img{i}.jpg", tags[i % 4])
+        add_images_tags(f"exec_img{i}", tags[i % 4])
+        for _ in range(i % 7):
+            increment_likes(f"exec_img{i}")
+        update_engagement(f"exec_img{i}")
+
+@pytest.fixture
+def process_mode(monkeypatch):
+    monkeypatch.setattr(executor, "RANKING_EXECUTOR", "process")
+    monkeypatch.setattr(executor, "PROCESS_MIN_CANDIDATES", 0)
+
+def test_offload_runs_off_the_loop_with_context(monkeypatch):
+    monkeypatch.setattr(executor, "RANKING_EXECUTOR", "thread")
+    marker = contextvars.ContextVar("marker", default=None)
+
+    def work():
+        return threading.current_thread().name, marker.get()
+
+    async def run():
+        marker.set("request")
+        return await offload(work)
+
+    thread_name, value = asyncio.run(run())
+    executor.shutdown()
+    assert thread_name.startswith("ranking")
+    assert value == "request"
+
+def test_offload_inline_stays_on_the_loop(monkeypatch):
+    monkeypatch.setattr(executor, "RANKING_EXECUTOR", "inline")
+
+    async def run():
+        return await offload(lambda: threading.current_thread().name)
+
+    assert asyncio.run(run()) == threading.main_thread().name
+
+def test_shared_ranking_matches_in_process_ranking(seeded_images, process_mode):
+    snapshot = ranking.refresh_snapshot()
+    catalog = publish_catalog(snapshot)
+    assert catalog is not None and catalog.epoch == snapshot.epoch
+
+    available = [f"exec_img{i}" for i in range(40) if i % 3]
+    tag_scores = {"nature": 3.0, "food": -1.0}
+
+    shared = rank_shared(snapshot, available, dense_tag_scores(tag_scores), 10)
+    local = score_candidates(
+        available, get_images_batch(available), get_candidate_scores(available), tag_scores, 10, "feed"
+    )
+
+    assert shared == local
+
+def test_stale_catalog_falls_back_to_in_process(seeded_images, process_mode):
+    snapshot = ranking.refresh_snapshot()
+    publish_catalog(snapshot)
+
+    increment_likes("exec_img0")
+    update_engagement("exec_img0")
+    newer = ranking.refresh_snapshot()
+
+    assert newer.epoch != snapshot.epoch
+    assert rank_shared(newer, ["exec_img0"], [], 10) is None
+
+def test_candidates_missing_from_the_catalog_fall_back_to_in_process(seeded_images, process_mode):
+    snapshot = ranking.refresh_snapshot()
+    publish_catalog(snapshot)
+    store_image("exec_new", "https://example.com/exec_new.jpg", ["nature"])
+    add_images_tags("exec_new", ["nature"])
+
+    available = ["exec_new"] + [f"exec_img{i}" for i in range(40)]
+
+    assert rank_shared(snapshot, available, dense_tag_scores({"nature": 3.0}), 10) is None
+
+def test_feed_in_process_mode(seeded_images, process_mode):
+    publish_catalog(ranking.refresh_snapshot())
+    session_id = create_session(["nature"])
+
+    feed = generate_feed(session_id)
+
+    assert len(feed["visible"]) == 10
+    assert len(feed["prefetched"]) == 10
+    assert executor.shared_rankings.value() >= 1
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,115 @@
+import time
+import pytest
+from fastapi.testclient import TestClient
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+from main import app
+from services import ranking, fallback
+from services import redis as redis_module
+from services.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from services.redis import BreakerRedis, RedisUnavailable, redis_breaker, get_redis
+from services.feed import store_image, add_images_tags, update_engagement, get_engagement
+from services.feed_generator import apply_interaction
+from services.session import create_session
+
+client = TestClient(app)
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    ranking.set_snapshot(None)
+    yield
+    redis_breaker.reset()
+    ranking.set_snapshot(None)
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    for i in range(40):
+        tags = ["nature"] if i % 2 == 0 else ["city"]
+        store_image(f"fallback_img{i}", f"https://example.com/fallback_img{i}.jpg", tags)
+        add_images_tags(f"fallback_img{i}", tags)
+        update_engagement(f"fallback_img{i}")
+    fallback.refresh_fallback_feed(ranking.refresh_snapshot())
+
+def test_breaker_opens_and_recovers_through_a_trial():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=0.05)
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+def test_dead_server_fails_fast_once_open(monkeypatch):
+    monkeypatch.setattr(redis_module, "redis_breaker", CircuitBreaker("test", 2, 60))
+    dead = BreakerRedis(port=1, socket_connect_timeout=0.1, retry=Retry(NoBackoff(), 0))
+
+    for _ in range(2):
+        with pytest.raises(redis_module.UNAVAILABLE_ERRORS):
+            dead.ping()
+
+    with pytest.raises(RedisUnavailable):
+        dead.ping()
+
+def test_open_breaker_serves_degraded_feed(seeded_images):
+    session_id = create_session(["nature"])
+    redis_breaker.trip()
+
+    first = client.get(f"/feed?session_id={session_id}").json()
+    second = client.get(f"/feed?session_id={session_id}").json()
+
+    assert first["degraded"] and second["degraded"]
+    assert len(first["visible"]) == 10
+    first_ids = {image["image_id"] for image in first["visible"] + first["prefetched"]}
+    second_ids = {image["image_id"] for image in second["visible"] + second["prefetched"]}
+    assert first_ids.isdisjoint(second_ids)
+
+def test_interactions_are_buffered_and_replayed(seeded_images):
+    session_id = create_session(["nature"])
+    redis_breaker.trip()
+
+    response = client.post(f"/like?session_id={session_id}&image_id=fallback_img3")
+    client.post(f"/dislike?session_id={session_id}&image_id=fallback_img4")
+
+    assert response.status_code == 200
+    assert response.json() == {"message": "Liked", "liked_tags": ["city"], "buffered": True}
+    assert fallback.interaction_buffer_depth.value() == 2
+
+    redis_breaker.reset()
+    assert fallback.replay_buffered(apply_interaction) == 2
+    assert get_engagement("fallback_img3")["likes"] == 1
+    assert get_engagement("fallback_img4")["dislikes"] == 1
+    assert fallback.interaction_buffer_depth.value() == 0
+
+def test_full_buffer_rejects_interactions(seeded_images, monkeypatch):
+    monkeypatch.setattr(fallback, "INTERACTION_BUFFER_SIZE", 1)
+    session_id = create_session(["nature"])
+    redis_breaker.trip()
+
+    assert client.post(f"/like?session_id={session_id}&image_id=fallback_img1").status_code == 200
+    assert client.post(f"/like?session_id={session_id}&image_id=fallback_img2").status_code == 503
+
+def test_other_endpoints_return_503_while_open(clean_redis):
+    redis_breaker.trip()
+
+    response = client.post("/sessions/create", json={"preferred_tags": ["nature"]})
+
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Redis connection failed"}
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,98 @@
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from services import feed_generator, feed_cursor
+from services.feed import store_image, add_images_tags, update_engagement, update_tag_scores_batch
+from services.feed_generator import generate_feed
+from services.session import create_session
+from services.redis import get_redis
+
+client = TestClient(app)
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    yield
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    for i in range(80):
+        tags = ["nature"] if i % 2 == 0 else ["city"]
+        store_image(f"cursor_img{i}", f"https://example.com/cursor_img{i}.jpg", tags)
+        add_images_tags(f"cursor_img{i}", tags)
+        update_engagement(f"cursor_img{i}")
+
+def _ids(page):
+    return [image["image_id"] for image in page["visible"] + page["prefetched"]]
+
+def test_cursor_pages_without_reranking(seeded_images, monkeypatch):
+    session_id = create_session(["nature"])
+    first = generate_feed(session_id)
+
+    def no_rerank(*args):
+        raise AssertionError("cursor page should not re-rank")
+
+    monkeypatch.setattr(feed_generator, "rank_available", no_rerank)
+    pages = [first]
+    while pages[-1]["cursor"] is not None:
+        pages.append(generate_feed(session_id, pages[-1]["cursor"]))
+
+    served = [image_id for page in pages for image_id in _ids(page)]
+    assert len(served) == 50
+    assert len(set(served)) == 50
+    assert "message" in generate_feed(session_id)
+
+def test_page_size_and_depth_are_configurable(seeded_images, monkeypatch):
+    monkeypatch.setattr(feed_generator, "FEED_PAGE_SIZE", 5)
+    monkeypatch.setattr(feed_generator, "FEED_PREFETCH_SIZE", 0)
+    monkeypatch.setattr(feed_generator, "FEED_MAX_SEEN", 12)
+    session_id = create_session(["nature"])
+
+    first = generate_feed(session_id)
+    second = generate_feed(session_id, first["cursor"])
+    third = generate_feed(session_id, second["cursor"])
+
+    assert [len(page["visible"]) for page in (first, second, third)] == [5, 5, 2]
+    assert third["cursor"] is None
+    assert generate_feed(session_id) == {"message": "All 12 images are shown"}
+
+def test_tag_score_change_reranks(seeded_images, monkeypatch):
+    session_id = create_session(["nature"])
+    first = generate_feed(session_id)
+
+    update_tag_scores_batch(session_id, {"city": 5.0})
+    calls = []
+    rank_available = feed_generator.rank_available
+    monkeypatch.setattr(feed_generator, "rank_available", lambda *args: calls.append(1) or rank_available(*args))
+
+    second = generate_feed(session_id, first["cursor"])
+
+    assert calls == [1]
+    assert set(_ids(first)).isdisjoint(_ids(second))
+
+def test_expired_cursor_falls_back_to_fresh_ranking(seeded_images):
+    session_id = create_session(["nature"])
+    first = generate_feed(session_id)
+    token, _ = feed_cursor.decode_cursor(first["cursor"])
+    get_redis().delete(f"feed:cursor:{token}", f"feed:cursor:{token}:ids")
+
+    second = generate_feed(session_id, first["cursor"])
+
+    assert len(second["visible"]) == 10
+    assert set(_ids(first)).isdisjoint(_ids(second))
+
+def test_bad_and_foreign_cursors_are_rejected(seeded_images):
+    owner = create_session(["nature"])
+    other = create_session(["city"])
+    cursor = client.get(f"/feed?session_id={owner}").json()["cursor"]
+
+    assert client.get(f"/feed?session_id={owner}&cursor=not-a-cursor").status_code == 400
+    assert client.get(f"/feed?session_id={other}&cursor={cursor}").status_code == 400
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,93 @@
+import pytest
+from services import hot_keys
+from services.redis import get_redis
+from services.feed import GLOBAL_VERSION_KEY, store_image, add_images_tags, update_engagement, get_engagement, get_engagement_batch, get_global_score, get_trending_scores, rollup_engagement_shards
+from services.feed_generator import apply_interaction
+from services.session import create_session
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    yield
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def sharding(monkeypatch):
+    monkeypatch.setattr(hot_keys, "HOT_KEY_SHARDING", True)
+    monkeypatch.setattr(hot_keys, "HOT_KEY_RATE", 5)
+
+@pytest.fixture
+def hot_image(clean_redis):
+    store_image("hot_img1", "https://example.com/hot_img1.jpg", ["nature"])
+    add_images_tags("hot_img1", ["nature"])
+    update_engagement("hot_img1")
+    return "hot_img1"
+
+def _shard_keys(image_id):
+    return [key for key in get_redis().scan_iter(match=f"image:{image_id}:shard:*")]
+
+def test_sharding_is_off_by_default(hot_image):
+    for _ in range(20):
+        apply_interaction("like", create_session(["nature"]), hot_image)
+
+    assert _shard_keys(hot_image) == []
+    assert get_global_score(hot_image) == 40
+
+def test_hot_image_writes_shards_and_reads_aggregate(hot_image, sharding):
+    for _ in range(20):
+        apply_interaction("like", create_session(["nature"]), hot_image)
+    apply_interaction("dislike", create_session(["nature"]), hot_image)
+
+    # The first HOT_KEY_RATE likes go straight to the image hash.
+    assert get_redis().hget(f"image:{hot_image}", "likes") == "5"
+    assert _shard_keys(hot_image)
+    assert get_engagement(hot_image) == {"likes": 20, "dislikes": 1}
+    assert get_engagement_batch([hot_image])[hot_image] == {"likes": 20, "dislikes": 1}
+    assert get_global_score(hot_image) == 10
+
+def test_rollup_folds_shards_into_global_ranking(hot_image, sharding):
+    for _ in range(20):
+        apply_interaction("like", create_session(["nature"]), hot_image)
+
+    assert rollup_engagement_shards() == 1
+
+    assert get_redis().hget(f"image:{hot_image}", "likes") == "20"
+    assert get_global_score(hot_image) == 40
+    assert get_engagement(hot_image) == {"likes": 20, "dislikes": 0}
+    assert rollup_engagement_shards() == 0
+
+def test_hot_image_trending_is_batched_by_the_rollup(hot_image, sharding):
+    redis = get_redis()
+    for _ in range(5):
+        apply_interaction("like", create_session(["nature"]), hot_image)
+    version = int(redis.get(GLOBAL_VERSION_KEY))
+
+    for _ in range(15):
+        apply_interaction("like", create_session(["nature"]), hot_image)
+
+    # Nothing touches the {feed} slot until the rollup, which bumps it once.
+    assert int(redis.get(GLOBAL_VERSION_KEY)) == version
+    assert get_trending_scores([hot_image])[hot_image] == pytest.approx(10.0, abs=1e-3)
+    rollup_engagement_shards()
+    assert int(redis.get(GLOBAL_VERSION_KEY)) == version + 1
+    assert get_trending_scores([hot_image])[hot_image] == pytest.approx(40.0, abs=1e-3)
+
+def test_rollup_keeps_increments_made_after_the_read(hot_image, sharding):
+    for _ in range(20):
+        apply_interaction("like", create_session(["nature"]), hot_image)
+    get_redis().hincrby(hot_keys.shard_key(hot_image, 0), "likes", 3)
+    hot_keys.mark_dirty(hot_image)
+
+    rollup_engagement_shards()
+    get_redis().hincrby(hot_keys.shard_key(hot_image, 0), "likes", 2)
+    hot_keys.mark_dirty(hot_image)
+    rollup_engagement_shards()
+
+    assert get_engagement(hot_image)["likes"] == 25
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
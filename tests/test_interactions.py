@@ -0,0 +1,181 @@
+import pytest
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from redis.exceptions import ConnectionError as RedisConnectionError
+from services import session_store, feed_generator, fallback
+from services.session_store import SessionState
+from services.feed import store_image, add_images_tags, update_engagement, get_engagement, get_global_score, get_tag_scores, get_trending_scores
+from services.feed_generator import like_handler, dislike_handler, apply_interaction
+from services.session import create_session
+from services.redis import get_redis
+from services.keys import session_key
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    yield
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    for i in range(5):
+        store_image(f"ledger_img{i}", f"https://example.com/ledger_img{i}.jpg", ["nature", "forest"])
+        add_images_tags(f"ledger_img{i}", ["nature", "forest"])
+        update_engagement(f"ledger_img{i}")
+
+@pytest.fixture
+def packed_sessions(monkeypatch):
+    monkeypatch.setattr(session_store, "SESSION_STORE", "packed")
+
+@pytest.fixture
+def broadcasts(monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(feed_generator, "_schedule_prefetch_update", scheduled.append)
+    return scheduled
+
+def test_repeated_like_is_a_no_op(seeded_images, broadcasts):
+    session_id = create_session(["nature"])
+
+    first = asyncio.run(like_handler(session_id, "ledger_img0"))
+    second = asyncio.run(like_handler(session_id, "ledger_img0"))
+
+    assert first == {"message": "Liked", "liked_tags": ["nature", "forest"]}
+    assert second == {"message": "Liked", "liked_tags": ["nature", "forest"], "unchanged": True}
+    assert get_engagement("ledger_img0") == {"likes": 1, "dislikes": 0}
+    assert get_global_score("ledger_img0") == 2
+    assert get_tag_scores(session_id) == {"nature": 4.0, "forest": 1.0}
+    # Only the first like recomputes and broadcasts the prefetch batch.
+    assert broadcasts == [session_id]
+
+def test_like_then_dislike_flips_counts(seeded_images, broadcasts):
+    session_id = create_session(["nature"])
+
+    asyncio.run(like_handler(session_id, "ledger_img0"))
+    asyncio.run(dislike_handler(session_id, "ledger_img0"))
+    repeated = asyncio.run(dislike_handler(session_id, "ledger_img0"))
+
+    assert repeated["unchanged"] is True
+    assert get_engagement("ledger_img0") == {"likes": 0, "dislikes": 1}
+    assert get_global_score("ledger_img0") == -1
+    assert get_trending_scores(["ledger_img0"])["ledger_img0"] == pytest.approx(-1.0, abs=1e-3)
+    # The like's +1 is reversed, then the dislike applies to what's left.
+    assert get_tag_scores(session_id) == {"nature": 2.5, "forest": 0.0}
+    assert broadcasts == [session_id, session_id]
+
+def test_dislike_then_like_flips_counts(seeded_images):
+    session_id = create_session(["nature"])
+
+    apply_interaction("dislike", session_id, "ledger_img0")
+    tags, changed = apply_interaction("like", session_id, "ledger_img0")
+
+    assert changed is True
+    assert tags == ["nature", "forest"]
+    assert get_engagement("ledger_img0") == {"likes": 1, "dislikes": 0}
+    assert get_global_score("ledger_img0") == 2
+    # The dislike's -0.5 on "nature" is undone exactly before the like's +1.
+    assert get_tag_scores(session_id) == {"nature": 4.0, "forest": 1.0}
+
+@pytest.mark.parametrize("store", ["keys", "packed"])
+def test_flipping_back_and_forth_ends_like_a_single_like(seeded_images, monkeypatch, store):
+    monkeypatch.setattr(session_store, "SESSION_STORE", store)
+    flipped, liked = create_session(["nature"]), create_session(["nature"])
+    apply_interaction("like", session_id=liked, image_id="ledger_img0")
+
+    for kind in ("dislike", "like", "dislike", "like"):
+        apply_interaction(kind, flipped, "ledger_img0")
+
+    assert get_tag_scores(flipped) == get_tag_scores(liked)
+    assert get_engagement("ledger_img0") == {"likes": 2, "dislikes": 0}
+
+def test_counts_failing_after_the_swap_are_replayed(seeded_images, monkeypatch):
+    session_id = create_session(["nature"])
+
+    def redis_down(*args, **kwargs):
+        raise RedisConnectionError("down")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(feed_generator, "record_trending", redis_down)
+        response = asyncio.run(like_handler(session_id, "ledger_img0"))
+        # The ledger and engagement counts have the like; trending is queued.
+        assert response["buffered"] is True
+        assert apply_interaction("like", session_id, "ledger_img0")[1] is False
+        assert get_trending_scores(["ledger_img0"])["ledger_img0"] == pytest.approx(0.0, abs=1e-3)
+
+    assert fallback.replay_buffered(apply_interaction) == 1
+    assert get_engagement("ledger_img0") == {"likes": 1, "dislikes": 0}
+    assert get_trending_scores(["ledger_img0"])["ledger_img0"] == pytest.approx(2.0, abs=1e-3)
+    assert get_tag_scores(session_id) == {"nature": 4.0, "forest": 1.0}
+
+def test_ledger_is_per_session_and_image(seeded_images):
+    first, second = create_session(["nature"]), create_session(["nature"])
+
+    apply_interaction("like", first, "ledger_img0")
+    apply_interaction("like", first, "ledger_img1")
+    apply_interaction("like", second, "ledger_img0")
+
+    assert get_engagement("ledger_img0") == {"likes": 2, "dislikes": 0}
+    assert get_engagement("ledger_img1") == {"likes": 1, "dislikes": 0}
+
+def test_concurrent_double_taps_count_once(seeded_images):
+    session_id = create_session(["nature"])
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: apply_interaction("like", session_id, "ledger_img2"), range(16)))
+
+    assert [changed for _, changed in results].count(True) == 1
+    assert get_engagement("ledger_img2") == {"likes": 1, "dislikes": 0}
+
+def test_unknown_image_is_not_recorded(seeded_images):
+    session_id = create_session(["nature"])
+
+    with pytest.raises(Exception) as exc_info:
+        apply_interaction("like", session_id, "missing_img")
+
+    assert exc_info.value.status_code == 404
+    assert not get_redis().exists(session_key(session_id, "interactions"))
+
+def test_packed_sessions_keep_the_ledger_in_the_record(seeded_images, packed_sessions):
+    session_id = create_session(["nature"])
+
+    assert apply_interaction("like", session_id, "ledger_img0")[1] is True
+    assert apply_interaction("like", session_id, "ledger_img0")[1] is False
+    assert apply_interaction("dislike", session_id, "ledger_img0")[1] is True
+
+    assert get_engagement("ledger_img0") == {"likes": 0, "dislikes": 1}
+    assert list(get_redis().scan_iter(match=session_key(session_id, "*"))) == [session_store.state_key(session_id)]
+
+def test_packed_state_reads_format_1_records():
+    state = SessionState()
+    state.add_tag_score(1, 2.0)
+    state.mark_seen(9)
+    header = session_store.HEADER.pack(1, 7, state.seen_count, 0, len(state.tag_scores), len(state.seen))
+    raw = header + state.tag_scores.tobytes() + bytes(state.seen)
+
+    restored = SessionState.unpack(raw)
+
+    assert restored.version == 7
+    assert restored.seen_indexes() == [9]
+    assert restored.interaction(9) is None
+    assert restored.set_interaction(9, "like") is None
+    assert SessionState.unpack(restored.pack()).interaction(9) == "like"
+
+def test_prefetch_broadcast_sends_the_configured_batch(seeded_images, monkeypatch):
+    monkeypatch.setattr(feed_generator, "FEED_PREFETCH_SIZE", 3)
+    sent = []
+
+    async def capture(session_id, message):
+        sent.append(message)
+
+    monkeypatch.setattr(feed_generator, "broadcast_to_session", capture)
+    session_id = create_session(["nature"])
+
+    asyncio.run(feed_generator._broadcast_prefetch_update(session_id))
+
+    assert len(sent[0]["prefetched"]) == 3
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,90 @@
+import shutil
+import subprocess
+import time
+import pytest
+from redis import Redis, RedisCluster
+from redis.exceptions import RedisError
+from services import keys
+from services.keys import cluster_key, copy_to_cluster_layout
+from services.redis import get_redis
+from services.feed import store_image, add_images_tags, update_engagement
+from services.session import create_session
+from config import REDIS_HOST, REDIS_CLUSTER
+
+CLUSTER_PORT = 6391
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    yield
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture(scope="module")
+def cluster_target(tmp_path_factory):
+    if REDIS_CLUSTER or not shutil.which("redis-server") or REDIS_HOST not in ("localhost", "127.0.0.1"):
+        pytest.skip("needs a local standalone Redis and redis-server to start a cluster node")
+    workdir = tmp_path_factory.mktemp("cluster")
+    process = subprocess.Popen(
+        ["redis-server", "--port", str(CLUSTER_PORT), "--cluster-enabled", "yes",
+         "--cluster-config-file", "nodes.conf", "--save", "", "--appendonly", "no"],
+        cwd=workdir, stdout=subprocess.DEVNULL,
+    )
+    try:
+        node = Redis(port=CLUSTER_PORT)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                node.execute_command("CLUSTER", "ADDSLOTS", *range(16384))
+                break
+            except RedisError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        while b"cluster_state:ok" not in node.execute_command("CLUSTER", "INFO"):
+            time.sleep(0.05)
+        yield RedisCluster(host="localhost", port=CLUSTER_PORT)
+    finally:
+        process.terminate()
+        process.wait()
+
+def test_cluster_key_tags_related_keys():
+    assert cluster_key("feed:global") == "{feed}:feed:global"
+    assert cluster_key("tag:nature") == "{feed}:tag:nature"
+    assert cluster_key("ranking:tag:nature") == "{feed}:ranking:tag:nature"
+    assert cluster_key("session:abc:seen_images") == "session:{abc}:seen_images"
+    assert cluster_key("feed:cursor:tok") == "feed:cursor:{tok}"
+    assert cluster_key("feed:cursor:tok:ids") == "feed:cursor:{tok}:ids"
+    assert cluster_key("image:img1") == "image:img1"
+
+def test_key_helpers_follow_cluster_layout(monkeypatch):
+    monkeypatch.setattr(keys, "REDIS_CLUSTER", True)
+    assert keys.session_key("abc", "tag_scores") == cluster_key("session:abc:tag_scores")
+    assert keys.tag_key("nature") == cluster_key("tag:nature")
+    assert keys.cursor_key("tok", "ids") == cluster_key("feed:cursor:tok:ids")
+
+    monkeypatch.setattr(keys, "REDIS_CLUSTER", False)
+    assert keys.session_key("abc", "tag_scores") == "session:abc:tag_scores"
+    assert keys.ranking_key("feed:global") == "feed:global"
+
+def test_copy_to_cluster_layout(clean_redis, cluster_target):
+    cluster_target.flushall()
+    store_image("cluster_img1", "https://example.com/cluster_img1.jpg", ["nature"])
+    add_images_tags("cluster_img1", ["nature"])
+    update_engagement("cluster_img1")
+    session_id = create_session(["nature"])
+    source = get_redis(decode_responses=False)
+
+    copied = copy_to_cluster_layout(source, cluster_target, batch_size=2)
+
+    assert copied == source.dbsize()
+    assert cluster_target.zscore("{feed}:feed:global", "cluster_img1") is not None
+    assert cluster_target.sismember("{feed}:tag:nature", "cluster_img1")
+    assert cluster_target.exists(f"session:{{{session_id}}}:tag_scores")
+    assert cluster_target.hget("image:cluster_img1", "image_url") == b"https://example.com/cluster_img1.jpg"
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
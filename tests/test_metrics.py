@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from services import metrics
+from services.sse_manager import register_connection, unregister_connection, broadcast_to_session
+
+client = TestClient(app)
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_latency_seconds", "test histogram", buckets=(0.1, 1.0))
+    histogram.observe(0.05, route="/a")
+    histogram.observe(0.5, route="/a")
+    histogram.observe(5.0, route="/a")
+
+    lines = histogram.collect()
+
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{route="/a",le="1"} 2' in lines
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{route="/a"} 3' in lines
+
+def test_metrics_endpoint_reports_route_latency():
+    client.get("/health")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE feedstream_request_duration_seconds histogram" in response.text
+    assert 'route="/health"' in response.text
+
+def test_sse_metrics_track_connections_and_drops():
+    session_id = "metrics-session"
+    queue = asyncio.Queue(maxsize=1)
+    register_connection(session_id, queue)
+    dropped_before = metrics.sse_dropped_messages.value(reason="queue_full")
+
+    try:
+        assert metrics.sse_active_connections.value() >= 1
+        asyncio.run(broadcast_to_session(session_id, {"type": "ping"}))
+        assert metrics.sse_queue_depth.value() >= 1
+        asyncio.run(broadcast_to_session(session_id, {"type": "ping"}))
+    finally:
+        unregister_connection(session_id, queue)
+
+    assert metrics.sse_dropped_messages.value(reason="queue_full") == dropped_before + 1
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
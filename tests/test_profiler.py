@@ -0,0 +1,97 @@
+import pstats
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from services import profiler
+from services.feed import store_image, add_images_tags, update_engagement
+from services.redis import get_redis
+
+client = TestClient(app)
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    yield
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+ADMIN = {"X-Admin-Token": "secret"}
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiler, "ADMIN_TOKEN", "secret")
+    return tmp_path
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    for i in range(12):
+        tags = ["nature"] if i % 2 == 0 else ["city"]
+        store_image(f"prof_img{i}", f"https://example.com/prof_img{i}.jpg", tags)
+        add_images_tags(f"prof_img{i}", tags)
+        update_engagement(f"prof_img{i}")
+
+def test_feed_is_not_profiled_without_opt_in(seeded_images, profile_dir):
+    session_id = client.post("/sessions/create", json={"preferred_tags": ["nature"]}).json()["session_id"]
+
+    client.get(f"/feed?session_id={session_id}")
+
+    assert client.get("/admin/profiles", headers=ADMIN).json()["profiles"] == []
+
+def test_profile_header_captures_generate_feed(seeded_images, profile_dir):
+    session_id = client.post("/sessions/create", json={"preferred_tags": ["nature"]}).json()["session_id"]
+
+    response = client.get(f"/feed?session_id={session_id}", headers={"X-Profile": "1", **ADMIN})
+    assert response.status_code == 200
+
+    profiles = client.get("/admin/profiles", headers=ADMIN).json()["profiles"]
+    assert len(profiles) == 1
+    assert "generate_feed" in profiles[0]["name"]
+
+    download = client.get(f"/admin/profiles/{profiles[0]['name']}", headers=ADMIN)
+    assert download.status_code == 200
+    dumped = profile_dir / "downloaded.prof"
+    dumped.write_bytes(download.content)
+    stats = pstats.Stats(str(dumped))
+    assert any(func[2] == "get_images_batch" for func in stats.stats)
+
+def test_profile_download_rejects_unknown_names(profile_dir):
+    assert client.get("/admin/profiles/missing.pstats", headers=ADMIN).status_code == 404
+    assert client.get("/admin/profiles/..%2Fconfig.py", headers=ADMIN).status_code == 404
+
+def test_profile_header_needs_the_admin_token(seeded_images, profile_dir):
+    session_id = client.post("/sessions/create", json={"preferred_tags": ["nature"]}).json()["session_id"]
+
+    client.get(f"/feed?session_id={session_id}", headers={"X-Profile": "1"})
+    client.get(f"/feed?session_id={session_id}", headers={"X-Profile": "1", "X-Admin-Token": "wrong"})
+
+    assert list(profile_dir.iterdir()) == []
+
+def test_admin_routes_need_the_token(profile_dir, monkeypatch):
+    assert client.get("/admin/profiles").status_code == 403
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+    monkeypatch.setattr(profiler, "ADMIN_TOKEN", "")
+    assert client.get("/admin/profiles", headers=ADMIN).status_code == 404
+
+def test_profiled_rejects_coroutine_functions():
+    async def handler():
+        pass
+
+    with pytest.raises(TypeError):
+        profiler.profiled("handler")(handler)
+
+def test_profile_captures_interactions(seeded_images, profile_dir):
+    session_id = client.post("/sessions/create", json={"preferred_tags": ["nature"]}).json()["session_id"]
+
+    response = client.post(f"/like?session_id={session_id}&image_id=prof_img0", headers={"X-Profile": "1", **ADMIN})
+    assert response.status_code == 200
+
+    profiles = client.get("/admin/profiles", headers=ADMIN).json()["profiles"]
+    assert [profile["name"].split("-")[2] for profile in profiles] == ["apply_interaction"]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
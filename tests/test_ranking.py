@@ -0,0 +1,148 @@
+import pytest
+from services import ranking, feed
+from services.feed import store_image, add_images_tags, update_engagement, increment_likes, record_trending, get_trending_scores, renormalize_trending
+from services.feed_generator import generate_feed
+from services.session import create_session
+from services.redis import get_redis
+from services.keys import ranking_key
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    ranking.set_snapshot(None)
+    yield
+    ranking.set_snapshot(None)
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    for i in range(30):
+        tags = ["nature"] if i % 2 == 0 else ["city"]
+        store_image(f"rank_img{i}", f"https://example.com/rank_img{i}.jpg", tags)
+        add_images_tags(f"rank_img{i}", tags)
+        for _ in range(i % 5):
+            increment_likes(f"rank_img{i}")
+        update_engagement(f"rank_img{i}")
+
+def test_snapshot_orders_global_and_tag_lists(seeded_images):
+    snapshot = ranking.materialize_snapshot()
+
+    global_scores = [score for _, score in snapshot.global_top]
+    assert global_scores == sorted(global_scores, reverse=True)
+    assert len(snapshot.global_top) == 30
+    assert set(snapshot.tag_ids("nature")) == {f"rank_img{i}" for i in range(0, 30, 2)}
+    assert snapshot.epoch == 1
+
+def test_refresh_skips_rebuild_until_ranking_changes(seeded_images):
+    first = ranking.refresh_snapshot()
+    assert ranking.refresh_snapshot().epoch == first.epoch
+
+    increment_likes("rank_img1")
+    update_engagement("rank_img1")
+
+    assert ranking.refresh_snapshot().epoch == first.epoch + 1
+
+def test_worker_adopts_snapshot_published_by_another_worker(seeded_images):
+    published = ranking.materialize_snapshot()
+    get_redis().set(ranking.LOCK_KEY, "other-worker")
+
+    adopted = ranking.refresh_snapshot()
+
+    assert adopted.epoch == published.epoch
+    assert adopted.global_ids() == published.global_ids()
+
+def test_lock_taken_over_during_a_slow_pass_is_not_released(seeded_images, monkeypatch):
+    materialize = ranking.materialize_snapshot
+
+    def slow_pass():
+        # The lock expires mid-pass and another worker takes it.
+        get_redis().set(ranking.LOCK_KEY, "other-worker")
+        return materialize()
+
+    monkeypatch.setattr(ranking, "materialize_snapshot", slow_pass)
+    ranking.refresh_snapshot()
+
+    assert get_redis().get(ranking.LOCK_KEY) == "other-worker"
+
+def test_lock_is_released_after_a_pass(seeded_images):
+    ranking.refresh_snapshot()
+
+    assert not get_redis().exists(ranking.LOCK_KEY)
+
+def test_scratch_sets_expire(seeded_images, monkeypatch):
+    monkeypatch.setattr(feed, "RANKING_MODE", "trending")
+    ranking.materialize_snapshot()
+
+    for key in (ranking_key("ranking:tag:nature"), ranking_key("ranking:tag:city"), ranking.TRENDING_SCRATCH_KEY):
+        assert 0 < get_redis().ttl(key) <= ranking.LOCK_TTL_SECONDS
+
+def test_failing_listener_does_not_skip_the_rest(monkeypatch):
+    called = []
+
+    def broken(snapshot):
+        raise FileExistsError("catalog.bin.tmp")
+
+    monkeypatch.setattr(ranking, "_listeners", [broken, called.append])
+    ranking.run_listeners("snapshot")
+
+    assert called == ["snapshot"]
+
+def test_feed_reads_scores_from_snapshot(seeded_images):
+    ranking.refresh_snapshot()
+    session_id = create_session(["nature"])
+    get_redis().delete("feed:global", "tag:nature", "tag:city")
+
+    feed = generate_feed(session_id)
+
+    assert len(feed["visible"]) == 10
+    assert len(feed["prefetched"]) == 10
+
+def test_trending_scores_decay_with_half_life(seeded_images):
+    record_trending("rank_img0", 2.0)
+    redis = get_redis()
+    origin = float(redis.get(feed.TRENDING_ORIGIN_KEY))
+    # Pretend one half-life has passed since the first like.
+    redis.set(feed.TRENDING_ORIGIN_KEY, origin - feed.TRENDING_HALF_LIFE_SECONDS)
+    record_trending("rank_img1", 2.0)
+
+    scores = get_trending_scores(["rank_img0", "rank_img1", "rank_img2"])
+
+    assert scores["rank_img0"] == pytest.approx(1.0, rel=1e-3)
+    assert scores["rank_img1"] == pytest.approx(2.0, rel=1e-3)
+    assert scores["rank_img2"] == 0.0
+
+def test_renormalize_keeps_scores_and_bounds_stored_values(seeded_images):
+    record_trending("rank_img0", 2.0)
+    redis = get_redis()
+    origin = float(redis.get(feed.TRENDING_ORIGIN_KEY))
+    redis.set(feed.TRENDING_ORIGIN_KEY, origin - 10 * feed.TRENDING_HALF_LIFE_SECONDS)
+    record_trending("rank_img1", 2.0)
+    before = get_trending_scores(["rank_img0", "rank_img1"])
+    assert redis.zscore(feed.TRENDING_KEY, "rank_img1") > 1000
+
+    assert renormalize_trending(force=True)
+
+    after = get_trending_scores(["rank_img0", "rank_img1"])
+    assert after["rank_img0"] == pytest.approx(before["rank_img0"], rel=1e-3)
+    assert after["rank_img1"] == pytest.approx(before["rank_img1"], rel=1e-3)
+    assert redis.zscore(feed.TRENDING_KEY, "rank_img1") == pytest.approx(2.0, rel=1e-3)
+
+def test_trending_mode_snapshot_ranks_recent_interactions_first(seeded_images, monkeypatch):
+    monkeypatch.setattr(feed, "RANKING_MODE", "trending")
+    record_trending("rank_img0", 2.0)
+    record_trending("rank_img3", -1.0)
+
+    snapshot = ranking.refresh_snapshot()
+
+    assert snapshot.mode == "trending"
+    assert snapshot.global_ids()[0] == "rank_img0"
+    assert snapshot.global_ids()[-1] == "rank_img3"
+    assert len(snapshot.global_top) == 30
+    assert snapshot.global_scores(["rank_img0"])["rank_img0"] == pytest.approx(2.0, rel=1e-3)
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
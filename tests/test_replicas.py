@@ -0,0 +1,144 @@
+import shutil
+import subprocess
+import time
+import pytest
+from services import redis as redis_module, feed as feed_module
+from services.redis import get_redis, get_read_redis, get_replicas, reset_replicas, check_replica, refresh_replica_health, replication_lag
+from services.feed import store_image, add_images_tags, update_engagement, get_images_batch, increment_engagement, get_global_score
+from config import REDIS_HOST, REDIS_PORT, REDIS_CLUSTER
+
+pytestmark = pytest.mark.skipif(REDIS_CLUSTER, reason="cluster mode routes reads by slot")
+
+REPLICA_PORT = 6390
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    yield
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def replicas(monkeypatch):
+    def configure(value):
+        monkeypatch.setattr(redis_module, "REDIS_REPLICAS", value)
+        reset_replicas()
+        return get_replicas()
+    yield configure
+    reset_replicas()
+
+@pytest.fixture(scope="module")
+def replica_server(tmp_path_factory):
+    if not shutil.which("redis-server") or REDIS_HOST not in ("localhost", "127.0.0.1"):
+        pytest.skip("needs a local redis-server to start a replica")
+    process = subprocess.Popen(
+        ["redis-server", "--port", str(REPLICA_PORT), "--replicaof", REDIS_HOST, str(REDIS_PORT),
+         "--save", "", "--appendonly", "no"],
+        cwd=tmp_path_factory.mktemp("replica"), stdout=subprocess.DEVNULL,
+    )
+    yield f"localhost:{REPLICA_PORT}"
+    process.terminate()
+    process.wait()
+
+def _wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+class _Primary:
+    def __init__(self, offsets):
+        self.offsets = iter(offsets)
+
+    def info(self, section):
+        return {"master_repl_offset": next(self.offsets)}
+
+def _refreshed(get):
+    refresh_replica_health()
+    return get()
+
+def test_no_replicas_reads_from_primary(replicas):
+    replicas("")
+    assert get_read_redis() is get_redis()
+
+def test_primary_listed_as_replica_is_not_used(replicas):
+    # Role "master": not a replica, so reads stay on the primary.
+    replicas(f"{REDIS_HOST}:{REDIS_PORT}")
+    assert _refreshed(get_read_redis) is get_redis()
+
+def test_unreachable_replica_falls_back_to_primary(replicas):
+    replicas("localhost:1")
+    assert _refreshed(get_read_redis) is get_redis()
+
+def test_round_robin_over_healthy_replicas(replicas, monkeypatch):
+    configured = replicas("replica-a:6379,replica-b:6379")
+    monkeypatch.setattr(redis_module, "check_replica", lambda replica: True)
+    refresh_replica_health()
+
+    clients = {id(get_read_redis()) for _ in range(4)}
+
+    assert clients == {id(replica.client()) for replica in configured}
+
+def test_failed_replica_is_skipped(replicas, monkeypatch):
+    configured = replicas("replica-a:6379,replica-b:6379")
+    monkeypatch.setattr(redis_module, "check_replica", lambda replica: True)
+    refresh_replica_health()
+    configured[0].breaker.trip()
+
+    assert all(get_read_redis() is configured[1].client() for _ in range(4))
+
+def test_replicas_are_unused_until_checked(replicas, monkeypatch):
+    replicas("replica-a:6379")
+    monkeypatch.setattr(redis_module, "check_replica", lambda replica: True)
+
+    # Health checks run in the background monitor, never on a read.
+    assert get_read_redis() is get_redis()
+
+def test_lag_is_time_behind_the_primary_offset(replicas, monkeypatch):
+    replicas("")
+    clock = [100.0]
+    monkeypatch.setattr(redis_module.time, "monotonic", lambda: clock[0])
+    primary = _Primary([1000, 5000, 9000])
+    monkeypatch.setattr(redis_module, "get_redis", lambda: primary)
+
+    assert replication_lag(1000) == 0.0
+    clock[0] = 105.0
+    # Streaming, but only as far as the primary was 5 seconds ago.
+    assert replication_lag(1200) == 5.0
+    clock[0] = 125.0
+    assert replication_lag(1200) == float("inf")
+
+def test_catalog_reads_go_to_replica(clean_redis, replicas, replica_server):
+    [replica] = replicas(replica_server)
+    assert _wait_until(lambda: check_replica(replica)), "replica never caught up"
+
+    store_image("replica_img1", "https://example.com/replica_img1.jpg", ["nature"])
+    add_images_tags("replica_img1", ["nature"])
+    update_engagement("replica_img1")
+    assert _wait_until(lambda: replica.client().exists("image:replica_img1"))
+
+    assert _refreshed(get_read_redis) is replica.client()
+    assert get_images_batch(["replica_img1"])["replica_img1"]["image_url"] == "https://example.com/replica_img1.jpg"
+    assert redis_module.replica_reads.value(target=replica.name) >= 1
+
+def test_engagement_score_is_computed_from_the_primary(clean_redis, monkeypatch):
+    store_image("replica_img2", "https://example.com/replica_img2.jpg", ["nature"])
+    increment_engagement("replica_img2", {"likes": 3, "dislikes": 1})
+
+    def lagging_replica(*args, **kwargs):
+        raise AssertionError("update_engagement read from a replica")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(feed_module, "get_read_redis", lagging_replica)
+        score = update_engagement("replica_img2")
+
+    assert score == 5
+    assert get_global_score("replica_img2") == 5
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,173 @@
+import pytest
+import random
+from fastapi.testclient import TestClient
+from main import app
+from services import ranking, catalog, tags, cold_start, feed, redis as redis_service
+from services.redis import get_redis
+from services.keys import tag_key
+from services.catalog import INDEX_KEY, IDS_KEY, NEXT_INDEX_KEY
+from services.feed import GLOBAL_KEY, GLOBAL_VERSION_KEY, ALL_TAGS_KEY
+from services.tags import tags_to_mask
+from config import RANKING_TOP_N, RANKING_TAG_TOP_N, FEED_PAGE_SIZE
+
+# Scaling regressions: runs against the in-memory Redis stand-in and checks
+# that each endpoint's Redis round trips and commands stay within budget and
+# don't grow with the catalog from 1k to 100k images. Counts, not timings,
+# so the results don't depend on how loaded the machine is.
+
+TAGS = ["nature", "city", "food", "travel", "art", "sports", "music", "tech", "animals", "ocean"]
+SIZES = (1_000, 10_000, 100_000)
+SAMPLES = 15
+
+# Round trips (commands or pipelines sent to Redis) per request, on paths
+# with cold per-worker caches. The maximum over sessions: some requests skip
+# a write, e.g. a dislike that changes no tag score.
+ROUND_TRIP_BUDGETS = {
+    "create_session": 9,
+    "feed": 8,
+    "feed_cursor": 6,
+    "like": 13,
+    "dislike": 14,
+    "engagement": 1,
+}
+
+# Commands per request besides catalog entry reads, at the measured maximum:
+# one extra command per request, or per candidate, fails. Feed pages read one
+# entry per candidate; those are counted separately against CANDIDATE_BOUND.
+COMMAND_BUDGETS = {
+    "create_session": 11,
+    "feed": 11,
+    "feed_cursor": 11,
+    "like": 20,
+    "dislike": 20,
+    "engagement": FEED_PAGE_SIZE,
+}
+
+# The ranking snapshot bounds candidates to the global top N plus the top N
+# of the session's three best tags, whatever the catalog size.
+CANDIDATE_BOUND = RANKING_TOP_N + 3 * RANKING_TAG_TOP_N
+
+@pytest.fixture(scope="module")
+def memory_redis():
+    saved = redis_service.REDIS_BACKEND, dict(redis_service._clients), redis_service._memory_server
+    redis_service.REDIS_BACKEND = "memory"
+    redis_service._clients.clear()
+    redis_service._memory_server = None
+    get_redis().flushdb()
+    yield
+    ranking.set_snapshot(None)
+    redis_service.REDIS_BACKEND, _, redis_service._memory_server = saved
+    redis_service._clients.clear()
+    redis_service._clients.update(saved[1])
+
+@pytest.fixture
+def redis_traffic(monkeypatch):
+    """measure(call, ...) -> (result, round trips, commands, catalog entries
+    read) for everything sent through the circuit breaker while call runs."""
+    counts = {"round_trips": 0, "commands": 0, "entries": 0}
+    guarded = redis_service._guarded
+    read_images = feed._read_images
+
+    def counting(breaker, call, *args, **kwargs):
+        counts["round_trips"] += 1
+        # Pipelines go through as one execute() of their queued commands.
+        stack = getattr(getattr(call, "__self__", None), "command_stack", None)
+        counts["commands"] += len(stack) if call.__name__ == "execute" and stack else 1
+        return guarded(breaker, call, *args, **kwargs)
+
+    def counting_entries(image_ids):
+        counts["entries"] += len(image_ids)
+        return read_images(image_ids)
+
+    monkeypatch.setattr(redis_service, "_guarded", counting)
+    monkeypatch.setattr(feed, "_read_images", counting_entries)
+
+    def measure(call, *args, **kwargs):
+        counts["round_trips"] = counts["commands"] = counts["entries"] = 0
+        result = call(*args, **kwargs)
+        return result, counts["round_trips"], counts["commands"], counts["entries"]
+
+    return measure
+
+def grow_catalog(size: int):
+    """Add images until the catalog holds `size`, in bulk pipelines."""
+    redis = get_redis()
+    start = int(redis.get(NEXT_INDEX_KEY) or 0)
+    rng = random.Random(start)
+    masks = {}
+    for batch_start in range(start, size, 5000):
+        batch = range(batch_start, min(size, batch_start + 5000))
+        pipe = redis.pipeline(transaction=False)
+        members = {tag: [] for tag in TAGS}
+        for i in batch:
+            image_tags = tuple(rng.sample(TAGS, 2))
+            if image_tags not in masks:
+                masks[image_tags] = tags_to_mask(list(image_tags))
+            pipe.hset(f"image:scale_img{i}", mapping={
+                "image_url": f"https://example.com/scale_img{i}.jpg",
+                "tag_mask": masks[image_tags],
+            })
+            for tag in image_tags:
+                members[tag].append(f"scale_img{i}")
+        for tag, image_ids in members.items():
+            pipe.sadd(tag_key(tag), *image_ids)
+        pipe.zadd(GLOBAL_KEY, {f"scale_img{i}": rng.randint(0, 1000) for i in batch})
+        pipe.hset(INDEX_KEY, mapping={f"scale_img{i}": i for i in batch})
+        pipe.hset(IDS_KEY, mapping={i: f"scale_img{i}" for i in batch})
+        pipe.execute()
+    redis.sadd(ALL_TAGS_KEY, *TAGS)
+    redis.set(NEXT_INDEX_KEY, size)
+    redis.incr(GLOBAL_VERSION_KEY)
+    ranking.set_snapshot(ranking.refresh_snapshot())
+    tags.reset_tag_cache()
+    catalog.reset_catalog_cache()
+
+def measure_requests(client, measure):
+    """Per endpoint, the most round trips, other commands and catalog entry
+    reads any of SAMPLES new sessions needed."""
+    usage = {name: (0, 0, 0) for name in ROUND_TRIP_BUDGETS}
+    rng = random.Random(7)
+
+    def record(name, call, *args, **kwargs):
+        response, round_trips, commands, entries = measure(call, *args, **kwargs)
+        assert response.status_code == 200, (name, response.text)
+        usage[name] = tuple(max(pair) for pair in zip(usage[name], (round_trips, commands - entries, entries)))
+        return response.json()
+
+    for _ in range(SAMPLES):
+        session_id = record("create_session", client.post, "/sessions/create", json={"preferred_tags": rng.sample(TAGS, 2)})["session_id"]
+        # Measure the ranking path, not a shared first page.
+        cold_start.reset_cold_start_cache()
+        first = record("feed", client.get, "/feed", params={"session_id": session_id})
+        image_ids = [image["image_id"] for image in first["visible"]]
+
+        record("like", client.post, "/like", params={"session_id": session_id, "image_id": image_ids[0]})
+        record("dislike", client.post, "/dislike", params={"session_id": session_id, "image_id": image_ids[1]})
+        record("feed_cursor", client.get, "/feed", params={"session_id": session_id, "cursor": first["cursor"]})
+        record("engagement", client.get, "/images/engagement", params={"ids": ",".join(image_ids)})
+    return usage
+
+def assert_within_budgets(usage: dict, size: int):
+    for name, (round_trips, commands, entries) in usage.items():
+        assert round_trips <= ROUND_TRIP_BUDGETS[name], f"{name} at {size} images: {round_trips} round trips"
+        assert commands <= COMMAND_BUDGETS[name], f"{name} at {size} images: {commands} commands"
+        assert entries <= CANDIDATE_BOUND, f"{name} at {size} images: {entries} catalog entries read"
+
+def test_round_trips_within_budget(memory_redis, redis_traffic):
+    grow_catalog(SIZES[0])
+
+    usage = measure_requests(TestClient(app), redis_traffic)
+
+    assert_within_budgets(usage, SIZES[0])
+
+def test_feed_cost_does_not_grow_with_catalog(memory_redis, redis_traffic):
+    client = TestClient(app)
+    for size in SIZES:
+        grow_catalog(size)
+        usage = measure_requests(client, redis_traffic)
+        print(f"  {size:>7} images: usage {usage}")
+        # 100x the images must not show up as more commands per request.
+        assert_within_budgets(usage, size)
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
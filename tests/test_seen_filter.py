@@ -0,0 +1,124 @@
+import pytest
+from services import seen_filter, feed_generator, ranking, feed
+from services.seen_filter import BloomFilter, SeenImages, filter_params
+from services.redis import get_redis
+from services.keys import session_key
+from services.feed import store_image, add_images_tags, update_engagement, get_seen_images, mark_image_as_seen, mark_images_as_seen, is_image_seen
+from services.feed_generator import generate_feed
+from services.session import create_session
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    ranking.set_snapshot(None)
+    yield
+    ranking.set_snapshot(None)
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def bloom(monkeypatch):
+    monkeypatch.setattr(seen_filter, "SEEN_TRACKER", "bloom")
+    monkeypatch.setattr(seen_filter, "SEEN_FILTER_THRESHOLD", 5)
+    monkeypatch.setattr(seen_filter, "SEEN_FILTER_CAPACITY", 1000)
+
+def test_filter_params():
+    assert filter_params(10000, 0.01) == (95851, 7)
+
+def test_set_until_threshold_then_filter(clean_redis, bloom):
+    session_id = "bloom_session"
+
+    assert mark_images_as_seen(session_id, ["a", "b", "c"]) == 3
+    assert get_seen_images(session_id) == {"a", "b", "c"}
+
+    assert mark_images_as_seen(session_id, ["c", "d", "e", "f"]) == 3
+    assert not get_redis().exists(session_key(session_id, "seen_images"))
+    assert get_redis().exists(session_key(session_id, "seen_filter"))
+
+    seen = get_seen_images(session_id)
+    assert isinstance(seen, SeenImages)
+    assert all(image_id in seen for image_id in "abcdef")
+    assert len(seen) == 6
+    assert is_image_seen(session_id, "d")
+    assert mark_images_as_seen(session_id, ["a", "g"]) == 1
+
+def test_false_positive_rate(clean_redis, bloom):
+    session_id = "bloom_fp_session"
+    inserted = [f"seen_{i}" for i in range(1000)]
+    for start in range(0, len(inserted), 100):
+        mark_images_as_seen(session_id, inserted[start:start + 100])
+
+    seen = get_seen_images(session_id)
+
+    assert all(image_id in seen for image_id in inserted)
+    false_positives = sum(f"unseen_{i}" in seen for i in range(10000))
+    assert false_positives < 300
+    assert 900 <= len(seen) <= 1100
+
+def test_filter_size_is_constant(clean_redis, bloom):
+    session_id = "bloom_size_session"
+    mark_images_as_seen(session_id, [f"seen_{i}" for i in range(10)])
+    size = get_redis().strlen(session_key(session_id, "seen_filter"))
+    mark_images_as_seen(session_id, [f"seen_{i}" for i in range(10, 900)])
+
+    assert get_redis().strlen(session_key(session_id, "seen_filter")) <= filter_params()[0] // 8 + 1
+    assert size > 0
+
+def test_long_session_scrolls_past_old_cap(clean_redis, bloom, monkeypatch):
+    monkeypatch.setattr(feed_generator, "FEED_MAX_SEEN", 1000)
+    for i in range(120):
+        tags = ["nature"] if i % 2 == 0 else ["city"]
+        store_image(f"long_img{i}", f"https://example.com/long_img{i}.jpg", tags)
+        add_images_tags(f"long_img{i}", tags)
+        update_engagement(f"long_img{i}")
+    session_id = create_session(["nature"])
+
+    shown, cursor = [], None
+    for _ in range(20):
+        feed = generate_feed(session_id, cursor)
+        if "visible" not in feed:
+            break
+        shown += [image["image_id"] for image in feed["visible"] + feed["prefetched"]]
+        cursor = feed["cursor"]
+
+    assert len(shown) == len(set(shown))
+    assert len(shown) > 100
+
+def test_filter_keeps_its_params_when_config_changes(clean_redis, bloom, monkeypatch):
+    session_id = "bloom_params_session"
+    inserted = [f"seen_{i}" for i in range(20)]
+    mark_images_as_seen(session_id, inserted[:10])
+    bits, hashes = filter_params()
+    assert get_redis().get(session_key(session_id, "seen_filter_params")) == f"{bits}:{hashes}"
+
+    monkeypatch.setattr(seen_filter, "SEEN_FILTER_CAPACITY", 50000)
+    monkeypatch.setattr(seen_filter, "SEEN_FILTER_FP_RATE", 0.001)
+    mark_images_as_seen(session_id, inserted[10:])
+
+    seen = get_seen_images(session_id)
+    assert (seen.bloom.bits, seen.bloom.hashes) == (bits, hashes)
+    assert all(image_id in seen for image_id in inserted)
+    assert is_image_seen(session_id, "seen_15")
+    assert not is_image_seen(session_id, "unseen")
+
+def test_filter_uses_session_ttl(clean_redis, bloom, monkeypatch):
+    monkeypatch.setattr(feed, "SESSION_TTL_SECONDS", 120)
+    session_id = "bloom_ttl_session"
+    for i in range(6):
+        mark_image_as_seen(session_id, f"seen_{i}")
+
+    for name in ("seen_filter", "seen_filter_params"):
+        assert 0 < get_redis().ttl(session_key(session_id, name)) <= 120
+
+def test_bloom_filter_from_empty_data():
+    empty = BloomFilter(b"", 64, 3)
+
+    assert "anything" not in empty
+    assert len(empty) == 0
+    assert not SeenImages(set(), empty)
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,114 @@
+import pytest
+from services import session_store, tags
+from services.session_store import SessionState
+from services.feed import store_image, add_images_tags, update_engagement, get_seen_images, get_tag_scores
+from services.feed_generator import generate_feed, like_handler
+from services.session import create_session
+from services.redis import get_redis
+from services.keys import session_key
+import asyncio
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    yield
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def packed_sessions(clean_redis, monkeypatch):
+    monkeypatch.setattr(session_store, "SESSION_STORE", "packed")
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    for i in range(30):
+        tags = ["nature", "forest"] if i % 2 == 0 else ["city"]
+        store_image(f"packed_img{i}", f"https://example.com/packed_img{i}.jpg", tags)
+        add_images_tags(f"packed_img{i}", tags)
+        update_engagement(f"packed_img{i}")
+
+def test_state_round_trip():
+    state = SessionState()
+    state.add_tag_score(3, 2.5)
+    state.mark_seen(0)
+    state.mark_seen(17)
+    assert not state.mark_seen(17)
+
+    restored = SessionState.unpack(state.pack())
+
+    assert list(restored.tag_scores) == [0.0, 0.0, 0.0, 2.5]
+    assert restored.seen_indexes() == [0, 17]
+    assert restored.seen_count == 2
+
+def test_packed_session_is_a_single_key(packed_sessions, seeded_images):
+    session_id = create_session(["nature"])
+
+    feed = generate_feed(session_id)
+    asyncio.run(like_handler(session_id, "packed_img1"))
+
+    redis = get_redis()
+    assert list(redis.scan_iter(match=session_key(session_id, "*"))) == [session_store.state_key(session_id)]
+    assert len(get_seen_images(session_id)) == len(feed["visible"]) + len(feed["prefetched"])
+    assert get_tag_scores(session_id) == {"nature": 3.0, "city": 1.0}
+
+def test_feeds_do_not_repeat_images(packed_sessions, seeded_images):
+    session_id = create_session(["nature"])
+
+    first = generate_feed(session_id)
+    second = generate_feed(session_id)
+
+    first_urls = {image["image_url"] for image in first["visible"] + first["prefetched"]}
+    second_urls = {image["image_url"] for image in second["visible"] + second["prefetched"]}
+    assert first_urls.isdisjoint(second_urls)
+
+def test_write_from_another_worker_is_not_lost(packed_sessions, seeded_images):
+    session_id = create_session(["nature"])
+    session_store.load_state(session_id)
+
+    # Another worker updates the record behind this worker's cache.
+    cached = session_store._cache.pop(session_id)
+    session_store.update_packed_tag_scores(session_id, {"city": 2.0})
+    session_store._cache[session_id] = cached
+
+    session_store.update_packed_tag_scores(session_id, {"nature": 1.0})
+
+    session_store.reset_session_cache()
+    assert get_tag_scores(session_id) == {"nature": 4.0, "city": 2.0}
+
+def test_feed_reads_the_session_once(packed_sessions, seeded_images, monkeypatch):
+    session_id = create_session(["nature"])
+    session_store.reset_session_cache()
+    load_state = session_store.load_state
+    loads = []
+
+    def counted(session_id):
+        loads.append(session_id)
+        return load_state(session_id)
+
+    monkeypatch.setattr(session_store, "load_state", counted)
+    generate_feed(session_id)
+
+    assert loads == [session_id]
+
+def test_cached_state_is_refetched_when_another_worker_wrote(packed_sessions, seeded_images):
+    session_id = create_session(["nature"])
+    session_store.load_state(session_id)
+
+    # Another worker writes right after this worker cached the record.
+    cached = session_store._cache.pop(session_id)
+    session_store.update_packed_tag_scores(session_id, {"city": 2.0})
+    session_store._cache[session_id] = cached
+
+    assert get_tag_scores(session_id) == {"nature": 3.0, "city": 2.0}
+
+def test_unknown_preferred_tags_get_no_tag_id(packed_sessions, seeded_images):
+    session_id = create_session(["nature", "not-a-catalog-tag"])
+
+    assert get_tag_scores(session_id) == {"nature": 3.0}
+    assert "not-a-catalog-tag" not in tags.load_tag_dictionary()
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+import httpx
+import pytest
+from main import app
+from routes import feed as feed_routes
+from services.singleflight import AsyncSingleFlight, SingleFlight, KeyedLock
+from services.feed import store_image, add_images_tags, update_engagement, get_seen_images
+from services.session import create_session
+from services.redis import get_redis
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    yield
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    for i in range(60):
+        tags = ["nature"] if i % 2 == 0 else ["city"]
+        store_image(f"flight_img{i}", f"https://example.com/flight_img{i}.jpg", tags)
+        add_images_tags(f"flight_img{i}", tags)
+        update_engagement(f"flight_img{i}")
+
+def test_async_single_flight_runs_once_per_key():
+    flight = AsyncSingleFlight("test")
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", compute) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["result"] * 5
+    assert len(calls) == 1
+
+def test_async_single_flight_shares_errors():
+    flight = AsyncSingleFlight("test")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_cancelled_leader_does_not_cancel_followers():
+    flight = AsyncSingleFlight("test")
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def run():
+        leader = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == "result"
+    assert len(calls) == 1
+    assert flight._calls == {}
+
+def test_thread_single_flight_runs_once_per_key():
+    flight = SingleFlight("test")
+    calls = []
+    results = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return 42
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", compute))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [42] * 5
+    assert len(calls) < 5
+
+def test_keyed_lock_serializes_same_key():
+    lock = KeyedLock()
+    order = []
+
+    async def worker(name):
+        async with lock.hold("session"):
+            order.append(f"{name}-start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name}-end")
+
+    async def run():
+        await asyncio.gather(worker("a"), worker("b"))
+
+    asyncio.run(run())
+    assert order == ["a-start", "a-end", "b-start", "b-end"]
+    assert lock._locks == {}
+
+async def _fire_twice(session_id):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(
+            client.get(f"/feed?session_id={session_id}"),
+            client.get(f"/feed?session_id={session_id}"),
+        )
+
+def test_double_fired_feed_requests_share_one_page(seeded_images, monkeypatch):
+    monkeypatch.setattr(feed_routes, "FEED_COALESCE", "share")
+    session_id = create_session(["nature"])
+
+    first, second = asyncio.run(_fire_twice(session_id))
+
+    assert first.json() == second.json()
+    assert len(get_seen_images(session_id)) == 20
+
+def test_serialized_feed_requests_get_consecutive_pages(seeded_images, monkeypatch):
+    monkeypatch.setattr(feed_routes, "FEED_COALESCE", "serialize")
+    session_id = create_session(["nature"])
+
+    first, second = asyncio.run(_fire_twice(session_id))
+
+    first_urls = {image["image_url"] for image in first.json()["visible"]}
+    second_urls = {image["image_url"] for image in second.json()["visible"]}
+    assert first_urls.isdisjoint(second_urls)
+    assert len(get_seen_images(session_id)) == 40
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,91 @@
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from services import ranking, tag_index
+from services.redis import get_redis
+from services.feed import store_image, add_images_tags, update_engagement, get_image
+from services.session import create_session
+
+client = TestClient(app)
+
+TAGS = [["city", "night"], ["city"], ["nature", "night"], ["nature"], ["city", "night", "urban"]]
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    ranking.set_snapshot(None)
+    yield
+    ranking.set_snapshot(None)
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    for i in range(50):
+        tags = TAGS[i % len(TAGS)]
+        store_image(f"idx_img{i}", f"https://example.com/idx_img{i}.jpg", tags)
+        add_images_tags(f"idx_img{i}", tags)
+        update_engagement(f"idx_img{i}")
+
+def _expected(tags, match):
+    return {f"idx_img{i}" for i in range(50) if match(tag in TAGS[i % len(TAGS)] for tag in tags)}
+
+def test_any_and_all_queries(seeded_images):
+    index = tag_index.rebuild_tag_index()
+
+    assert set(index.query(["city", "night"], "all")) == _expected(["city", "night"], all)
+    assert set(index.query(["urban", "nature"], "any")) == _expected(["urban", "nature"], any)
+    assert index.query(["city", "unknown"], "all") == []
+    assert set(index.query(["nature", "unknown"], "any")) == _expected(["nature"], any)
+
+def test_index_rebuilds_only_when_catalog_grows(seeded_images):
+    first = tag_index.rebuild_tag_index()
+    update_engagement("idx_img1")
+    assert tag_index.rebuild_tag_index() is first
+
+    store_image("idx_new", "https://example.com/idx_new.jpg", ["city", "night"])
+    update_engagement("idx_new")
+    assert "idx_new" in tag_index.rebuild_tag_index().query(["city", "night"], "all")
+
+def test_feed_filtered_by_all_tags(seeded_images):
+    session_id = create_session(["nature"])
+    expected = _expected(["city", "night"], all)
+
+    shown, cursor = [], None
+    while True:
+        url = f"/feed?session_id={session_id}&tags=city,night&mode=all"
+        feed = client.get(url + (f"&cursor={cursor}" if cursor else "")).json()
+        if "visible" not in feed:
+            break
+        shown += [image["image_id"] for image in feed["visible"] + feed["prefetched"]]
+        for image in feed["visible"]:
+            assert {"city", "night"} <= set(image["image_tags"])
+        cursor = feed["cursor"]
+        if cursor is None:
+            break
+
+    assert len(shown) == len(set(shown))
+    assert set(shown) == expected
+
+def test_feed_filtered_by_any_tag_is_personalized(seeded_images):
+    session_id = create_session(["urban"])
+
+    feed = client.get(f"/feed?session_id={session_id}&tags=urban,nature&mode=any").json()
+
+    ids = [image["image_id"] for image in feed["visible"]]
+    assert set(ids) <= _expected(["urban", "nature"], any)
+    assert "urban" in get_image(ids[0])["image_tags"]
+
+def test_feed_tag_query_errors(seeded_images):
+    session_id = create_session(["nature"])
+
+    assert client.get(f"/feed?session_id={session_id}&tags=city&mode=some").status_code == 400
+    assert client.get(f"/feed?session_id={session_id}&tags=unknown").json() == {
+        "message": "No images match the requested tags"
+    }
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,92 @@
+import json
+import pytest
+from services import tags
+from services.feed import store_image, add_images_tags, update_engagement, get_image, get_images_batch, migrate_image_tags
+from services.feed_generator import generate_feed
+from services.session import create_session
+from services.redis import get_redis
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    yield
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+def test_tag_ids_are_stable_and_dense(clean_redis):
+    first = tags.ensure_tag_ids(["nature", "city"])
+    second = tags.ensure_tag_ids(["city", "ocean", "nature"])
+
+    assert first == {"nature": 0, "city": 1}
+    assert second == {"city": 1, "ocean": 2, "nature": 0}
+
+def test_mask_round_trip_after_cache_reset(clean_redis):
+    mask = tags.tags_to_mask(["forest", "snow"])
+    tags.reset_tag_cache()
+
+    assert sorted(tags.mask_to_tags(mask)) == ["forest", "snow"]
+
+def test_id_gaps_do_not_reload_on_every_call(clean_redis, monkeypatch):
+    tags.ensure_tag_ids(["nature"])
+    # A lost registration race burns id 1.
+    get_redis().incr(tags.TAG_NEXT_ID_KEY)
+    tags.ensure_tag_ids(["city"])
+    tags.load_tag_dictionary()
+    reloads = []
+    monkeypatch.setattr(tags, "load_tag_dictionary", lambda: reloads.append(1))
+
+    names = tags.get_tag_names(3)
+    tags.get_tag_names(needed=[0, 2])
+
+    assert names == ["nature", None, "city"]
+    assert reloads == []
+
+def test_images_store_a_tag_mask_instead_of_json(clean_redis):
+    store_image("tag_img1", "https://example.com/tag_img1.jpg", ["nature", "mountain"])
+
+    raw = get_redis().hgetall("image:tag_img1")
+    assert "image_tags" not in raw
+    assert int(raw["tag_mask"]) == tags.tags_to_mask(["nature", "mountain"])
+    assert get_image("tag_img1")["image_tags"] == ["nature", "mountain"]
+
+def test_mask_boost_matches_tag_score_sum(clean_redis):
+    tags.ensure_tag_ids(["nature", "city", "ocean"])
+    dense = tags.dense_tag_scores({"nature": 3.0, "ocean": -1.5, "unknown": 9.0})
+    cache = {}
+
+    boost = tags.mask_boost(tags.tags_to_mask(["nature", "ocean"]), dense, cache)
+
+    assert boost == 1.5
+    assert len(cache) == 1
+
+def test_legacy_json_tags_are_read_and_migrated(clean_redis):
+    redis = get_redis()
+    redis.hset("image:legacy1", mapping={
+        "image_url": "https://example.com/legacy1.jpg",
+        "image_tags": json.dumps(["beach", "ocean"]),
+    })
+
+    assert get_image("legacy1")["image_tags"] == ["beach", "ocean"]
+    assert migrate_image_tags() == 1
+
+    raw = redis.hgetall("image:legacy1")
+    assert "image_tags" not in raw
+    assert get_images_batch(["legacy1"])["legacy1"]["tag_mask"] == tags.tags_to_mask(["beach", "ocean"])
+
+def test_feed_boosts_preferred_tags(clean_redis):
+    for i in range(20):
+        image_tags = ["nature"] if i % 2 == 0 else ["city"]
+        store_image(f"tag_feed{i}", f"https://example.com/tag_feed{i}.jpg", image_tags)
+        add_images_tags(f"tag_feed{i}", image_tags)
+        update_engagement(f"tag_feed{i}")
+    session_id = create_session(["nature"])
+
+    feed = generate_feed(session_id)
+
+    assert all(image["image_tags"] == ["nature"] for image in feed["visible"])
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from services import tasks
+from services.tasks import TaskRunner, INTERACTIVE, BACKGROUND
+
+def test_runner_respects_priority_and_concurrency():
+    order = []
+
+    async def job(name):
+        order.append(name)
+
+    async def run():
+        runner = TaskRunner(max_queue=10, concurrency=1)
+        await runner.start()
+        # Queue everything before the single worker gets a chance to run.
+        runner.submit(job, "background", priority=BACKGROUND)
+        runner.submit(job, "interactive", priority=INTERACTIVE)
+        await runner.drain()
+
+    asyncio.run(run())
+    assert order == ["interactive", "background"]
+
+def test_runner_drops_when_queue_is_full():
+    async def job():
+        pass
+
+    async def run():
+        runner = TaskRunner(max_queue=2, concurrency=1)
+        await runner.start()
+        accepted = [runner.submit(job, name="full_test") for _ in range(3)]
+        await runner.drain()
+        return accepted
+
+    dropped_before = tasks.tasks_dropped.value(task="full_test", reason="queue_full", priority="background")
+    assert asyncio.run(run()) == [True, True, False]
+    assert tasks.tasks_dropped.value(task="full_test", reason="queue_full", priority="background") == dropped_before + 1
+
+def test_runner_collapses_tasks_with_same_key():
+    calls = []
+
+    async def job(session_id):
+        calls.append(session_id)
+
+    async def run():
+        runner = TaskRunner(max_queue=10, concurrency=1)
+        await runner.start()
+        for _ in range(5):
+            runner.submit(job, "s1", key=("prefetch", "s1"))
+        runner.submit(job, "s2", key=("prefetch", "s2"))
+        await runner.drain()
+
+    asyncio.run(run())
+    assert calls == ["s1", "s2"]
+
+def test_drain_finishes_queued_work_and_rejects_new_tasks():
+    finished = []
+
+    async def slow_job():
+        await asyncio.sleep(0.01)
+        finished.append(True)
+
+    async def run():
+        runner = TaskRunner(max_queue=10, concurrency=2)
+        await runner.start()
+        for _ in range(4):
+            runner.submit(slow_job)
+        await runner.drain()
+        return runner.submit(slow_job)
+
+    assert asyncio.run(run()) is False
+    assert len(finished) == 4
+
+def test_failures_are_counted_not_raised():
+    async def broken():
+        raise RuntimeError("boom")
+
+    async def run():
+        runner = TaskRunner(max_queue=10, concurrency=1)
+        await runner.start()
+        runner.submit(broken, name="broken_test")
+        await runner.drain()
+
+    failed_before = tasks.tasks_failed.value(task="broken_test")
+    asyncio.run(run())
+    assert tasks.tasks_failed.value(task="broken_test") == failed_before + 1
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
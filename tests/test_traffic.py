@@ -0,0 +1,133 @@
+import asyncio
+import json
+import pytest
+import httpx
+from fastapi.testclient import TestClient
+from main import app
+from services import ranking, traffic, redis as redis_service
+from services.redis import get_redis
+from services.feed import store_image, add_images_tags, update_engagement
+import replay
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    ranking.set_snapshot(None)
+    yield
+    ranking.set_snapshot(None)
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def capture_file(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    traffic.set_capture_file(str(path))
+    yield path
+    traffic.set_capture_file("")
+
+def seed_images():
+    for i in range(30):
+        tags = ["nature"] if i % 2 else ["city"]
+        store_image(f"traffic_img{i}", f"https://example.com/traffic_img{i}.jpg", tags)
+        add_images_tags(f"traffic_img{i}", tags)
+        update_engagement(f"traffic_img{i}")
+
+def record_session(client):
+    session_id = client.post("/sessions/create", json={"preferred_tags": ["nature"]}).json()["session_id"]
+    first = client.get("/feed", params={"session_id": session_id}).json()
+    client.post("/like", params={"session_id": session_id, "image_id": first["visible"][0]["image_id"]})
+    client.get("/feed", params={"session_id": session_id, "cursor": first["cursor"]})
+    client.get("/health")
+    return session_id
+
+def test_capture_records_sessions_feeds_and_interactions(clean_redis, capture_file):
+    seed_images()
+    session_id = record_session(TestClient(app))
+
+    records = traffic.read_records(str(capture_file))
+
+    assert [record["op"] for record in records] == ["session", "feed", "like", "feed"]
+    assert all(record["session_id"] == session_id and record["status"] == 200 for record in records)
+    assert records[0]["preferred_tags"] == ["nature"]
+    assert len(records[1]["images"]) == 20
+    assert records[2]["image_id"] == records[1]["images"][0]
+    assert records[3]["cursor"] == records[1]["next_cursor"]
+    assert all(record["t"] <= later["t"] for record, later in zip(records, records[1:]))
+
+def test_only_captured_routes_are_recorded(capture_file):
+    assert traffic.capture_op("POST", "/sessions/create") == "session"
+    assert traffic.capture_op("GET", "/feed/stream") is None
+    assert traffic.capture_op("GET", "/health") is None
+
+    traffic.set_capture_file("")
+    assert traffic.capture_op("GET", "/feed") is None
+
+def test_captured_response_is_passed_through(clean_redis, capture_file):
+    seed_images()
+    client = TestClient(app)
+    session_id = client.post("/sessions/create", json={"preferred_tags": ["nature"]}).json()["session_id"]
+
+    response = client.get("/feed", params={"session_id": session_id, "mode": "bogus"})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "mode must be 'any' or 'all'"}
+    assert json.loads(capture_file.read_text().splitlines()[-1])["status"] == 400
+
+def test_replay_reproduces_captured_feeds(clean_redis, capture_file):
+    seed_images()
+    captured_session = record_session(TestClient(app))
+    traffic.set_capture_file("")
+    records = traffic.read_records(str(capture_file))
+
+    get_redis().flushdb()
+    ranking.set_snapshot(None)
+    seed_images()
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+            return await replay.replay(records, client, speed=0)
+
+    results = asyncio.run(run())
+    summary = replay.summarize(results)
+
+    assert summary["status_mismatches"] == 0
+    assert summary["feeds"] == {"compared": 2, "same_order": 2, "same_set": 2, "overlap": 1.0}
+    assert set(summary["ops"]) == {"session", "feed", "like"}
+    # The replay runs under a new session, and its cursor was mapped.
+    replayed = [result for _, result in results]
+    assert replayed[0]["session_id"] != captured_session
+    assert {result["session_id"] for result in replayed} == {replayed[0]["session_id"]}
+
+def test_summarize_reports_ranking_diffs():
+    captured = {"op": "feed", "status": 200, "ms": 5.0, "images": ["a", "b", "c", "d"]}
+    results = [
+        (captured, {"op": "feed", "status": 200, "ms": 2.0, "images": ["b", "a", "c", "d"]}),
+        (captured, {"op": "feed", "status": 200, "ms": 4.0, "images": ["a", "b", "x", "y"]}),
+        (captured, {"op": "feed", "status": 503, "ms": 1.0}),
+    ]
+
+    summary = replay.summarize(results)
+
+    assert summary["status_mismatches"] == 1
+    assert summary["feeds"] == {"compared": 2, "same_order": 0, "same_set": 1, "overlap": 0.75}
+    assert summary["ops"]["feed"]["count"] == 3
+    assert summary["ops"]["feed"]["max_ms"] == 4.0
+    assert summary["ops"]["feed"]["captured_p50_ms"] == 5.0
+
+def test_memory_backend_shares_one_dataset(monkeypatch):
+    monkeypatch.setattr(redis_service, "REDIS_BACKEND", "memory")
+    monkeypatch.setattr(redis_service, "_clients", {})
+    monkeypatch.setattr(redis_service, "_memory_server", None)
+
+    text, binary = redis_service.get_redis(), redis_service.get_redis(decode_responses=False)
+    text.hset("image:mem1", mapping={"image_url": "https://example.com/mem1.jpg"})
+
+    assert binary.hget("image:mem1", "image_url") == b"https://example.com/mem1.jpg"
+    assert isinstance(text, redis_service.BreakerRedis)
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
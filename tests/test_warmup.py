@@ -0,0 +1,62 @@
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from services import ranking, tags, catalog, warmup
+from services.redis import get_redis
+from services.feed import store_image, add_images_tags, update_engagement
+from config import REDIS_CLUSTER
+
+@pytest.fixture(scope="function")
+def clean_redis():
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+    ranking.set_snapshot(None)
+    warmup.reset_ready()
+    yield
+    ranking.set_snapshot(None)
+    warmup.reset_ready()
+    redis = get_redis()
+    if redis:
+        redis.flushdb()
+
+@pytest.fixture
+def seeded_images(clean_redis):
+    for i in range(10):
+        store_image(f"warm_img{i}", f"https://example.com/warm_img{i}.jpg", ["nature"])
+        add_images_tags(f"warm_img{i}", ["nature"])
+        update_engagement(f"warm_img{i}")
+    # Start from a cold worker.
+    tags.reset_tag_cache()
+    catalog.reset_catalog_cache()
+
+def test_not_ready_before_warmup(clean_redis):
+    response = TestClient(app).get("/health/ready")
+
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Warming up"}
+
+def test_warm_up_loads_local_state(seeded_images):
+    warmup.warm_up()
+
+    assert warmup.is_ready()
+    assert set(ranking.get_snapshot().global_ids()) == {f"warm_img{i}" for i in range(10)}
+    assert "nature" in tags._tag_ids
+    assert all(f"warm_img{i}" in catalog._indexes for i in range(10))
+
+@pytest.mark.skipif(REDIS_CLUSTER, reason="cluster node pools are created lazily")
+def test_warm_up_opens_pooled_connections(clean_redis, monkeypatch):
+    monkeypatch.setattr(warmup, "WARMUP_CONNECTIONS", 4)
+    warmup.warm_up()
+
+    assert len(get_redis().connection_pool._available_connections) >= 4
+
+def test_lifespan_reports_ready_once_warm(seeded_images):
+    with TestClient(app) as client:
+        response = client.get("/health/ready")
+
+    assert response.status_code == 200
+    assert response.json() == {"message": "Ready"}
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])